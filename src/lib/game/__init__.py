@@ -1,2 +1,5 @@
 from ._game import *
 from ._agents import *
+from ._search import *
+from ._runlog import *
+from ._tournament import *
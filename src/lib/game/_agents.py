@@ -10,11 +10,21 @@ class RandomAgent(Agent):
         return random.choice(state.actions)
 
 class GreedyAgent(Agent):
-    def __init__(self, evaluate_function):
+    def __init__(self, evaluate_function, batch_evaluate_function=None):
         super().__init__()
         self.evaluate = evaluate_function
+        # Scores every successor in one call, given their encode()
+        # tuples, the player and the GameType (see MinimaxAgent).
+        self.batch_evaluate = batch_evaluate_function
 
     """Simple agent that chooses the best action based on one level of the evaluation function."""
     def decide(self, state):
+        if self.batch_evaluate is not None:
+            # Actions act() rejects have no child to score.
+            children = [(a, state.act(a)) for a in state.actions]
+            children = [(a, child) for (a, child) in children if child is not None]
+            scores = self.batch_evaluate([child.encode() for (_, child) in children],
+                                         state.current_player, children[0][1].game_type)
+            return max(zip([a for (a, _) in children], scores.tolist()), key=lambda x:x[1])[0]
         return max([(a, self.evaluate(state.act(a), state.current_player)) for a in state.actions],
                    key=lambda x:x[1])[0]
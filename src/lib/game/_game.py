@@ -1,26 +1,27 @@
 #!/usr/bin/env python3
 
 from os import write
-import pygame
 ## We will use persistent data structures because we want fast
 ## immutable game states
 from pyrsistent import m, v, pmap, PRecord
+import functools
+import os
+import random
+import shutil
+import sys
 import time
-import csv
+from collections import OrderedDict
 import numpy as np
 
 
-csv_save_a = open('acts_df4.csv', 'w', encoding='UTF8', newline='')
-writer_a = csv.writer(csv_save_a)
-
-csv_save_b = open('check_df4.csv', 'w', encoding='UTF8', newline='')
-writer_b = csv.writer(csv_save_b)
-
-
 predicted_move = -1
 actual_move = -1
 
 class Agent:
+    # True for agents that keep learning from one game to the next, so
+    # that their games have to be played in order (see Tournament).
+    learning = False
+
     def __init__(self):
         pass
 
@@ -50,56 +51,68 @@ class Agent:
         """
         pass
 
+    def save(self, directory):
+        """Optional function. Saves whatever the agent has learned to
+        `directory`, so that `load` can restore it (see
+        Game.checkpoint). Agents that do not learn save nothing."""
+        pass
+
+    def load(self, directory):
+        """Optional function. Restores what `save` saved to `directory`."""
+        pass
+
 
 class Game:
-    def __init__(self, game_type, agents, display=False):
+    """Runs games between `agents`.
+
+    pygame is only imported when `display` is set (or an
+    InteractiveAgent asks for input), so headless runs never load it
+    and do not wait between turns or games.
+
+    Every decision and the winner of every game go to `logger`, a
+    RunLogger, if one is given.
+    """
+    def __init__(self, game_type, agents, display=False, logger=None):
         self.game_type = game_type
         self.agents = list(agents)
         self.display = display
+        self.logger = logger
         if display:
+            import pygame
             time.sleep(10)
             pygame.init()
             self.screen = pygame.display.set_mode((672, 480))
 
-    def run(self, play_again='query', speed=2):
+    def run(self, play_again='query', speed=2, num_games=1000, checkpoint_dir=None,
+            checkpoint_every=None, resume=False):
+        """Plays `num_games` games. With `checkpoint_dir`, a checkpoint is
+        taken there every `checkpoint_every` games and after the last
+        one; with `resume`, the run carries on from the latest
+        checkpoint there instead of starting over."""
         # print('in run')
 
-        num_games = 1000
-
-        csv_save = open('savingprobsg_df4.csv', 'w', encoding='UTF8', newline='')
-        writer = csv.writer(csv_save)
-
         blue_score = 0
         red_score = 0
 
-        # writer.writerow(['start time',time.time()]) 
-        # writer.writerow(['type', 'MM'])
-        # writer.writerow(['depth', '5'])
-        
-        # t
-        for l in range(0,num_games): # num of games
+        first_game = self.restore(checkpoint_dir) if resume else 0
+        for l in range(first_game,num_games): # num of games
             
-            writer.writerow(['game',l]) 
-            writer_b.writerow(['game',l]) 
             print('game ' , l)
             
             #print('in while' , l)
             #print('play again' , play_again)
             iterats, game_winner,times_actions = self._run_round(speed, actual_move, predicted_move)
-            # writer.writerow(['iterations', iterats])
-            # writer.writerow(['times of actions', times_actions])
 
             print(game_winner)
             
             if game_winner == 1:
                 print('red')
-                writer.writerow(['winner', '1'])
                 red_score+=1
             elif game_winner == 2:
-                writer.writerow(['winner', '0'])
                 blue_score += 1
-            else:
-                writer.writerow(['winner', '-1'])
+            if checkpoint_dir is not None and (l + 1 == num_games or
+                                               checkpoint_every and (l + 1) % checkpoint_every == 0):
+                self.checkpoint(checkpoint_dir, l + 1)
             
 
             #self._play_again()
@@ -109,15 +122,52 @@ class Game:
             # if not play_again or play_again == 'query' and not :
             #     break
         
-        # writer.writerow(['blue games won', blue_score])
-        # writer.writerow(['red games won', red_score])
-        # writer.writerow(['end time', time.time()])
-        csv_save.close()
+        if self.logger is not None:
+            self.logger.flush()
+
+    def checkpoint(self, directory, games):
+        """Saves what is needed to carry on after `games` games: what each
+        agent has learned (see Agent.save), in `agent0`, `agent1`, ...,
+        and the states of `random` and `np.random`, in
+        `directory/game<games>`. The other complete checkpoints in
+        `directory` (see _checkpoints) are removed once it is complete;
+        nothing else there is touched. The moves logged so far are
+        flushed."""
+        if self.logger is not None:
+            self.logger.flush()
+        path = os.path.join(directory, 'game{}'.format(games))
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        for (i, agent) in enumerate(self.agents):
+            agent.save(os.path.join(path, 'agent{}'.format(i)))
+        _save_random_state(path)
+        # Written last: a checkpoint without it is incomplete.
+        np.save(os.path.join(path, 'games.npy'), np.array(games))
+        for (earlier, _) in _checkpoints(directory):
+            if earlier != path:
+                shutil.rmtree(earlier)
+
+    def restore(self, directory):
+        """Restores the latest complete checkpoint in `directory` and
+        returns the number of games played before it. The agents must
+        have been constructed as they were for the checkpointed run, and
+        moves the logger holds from later games are dropped. Returns 0,
+        restoring nothing, if there is no checkpoint."""
+        checkpoints = _checkpoints(directory)
+        if not checkpoints:
+            return 0
+        (path, games) = checkpoints[-1]
+        for (i, agent) in enumerate(self.agents):
+            agent.load(os.path.join(path, 'agent{}'.format(i)))
+        _load_random_state(path)
+        if self.logger is not None:
+            self.logger.rewind(games)
+        return games
 
     def _run_round(self, speed, actual_move,predicted_move):
         
         state = self.game_type.init(self.agents)
-        states = [state]
+        states = GameHistory(state)
         i = np.random.choice([0,1])
         self._draw_state(state)
         if speed == 2:
@@ -155,22 +205,23 @@ class Game:
                 en = time.time()
                 # print("player check " , i)
 
+                hit = -1
                 if i == 1:
                     # print('in if , ' , i)
-                    writer_a.writerow(['p1 act', action])
                     actual_move = action
                     # print(predicted_move)
                 else:
                     # print('in else , ' , i)
                     # print('pred' , pred)
-                    writer_a.writerow(['pred' , pred])
                     # print('act move' , actual_move)
                     # print('check ' , actual_move == predicted_move)
-                    writer_b.writerow(['check', actual_move == predicted_move])
+                    hit = int(actual_move == predicted_move)
                     predicted_move = pred
                     # print('pred move' , predicted_move)
 
                     # times_act.append(action)
+                if self.logger is not None:
+                    self.logger.record(num_iter, i, action, pred, hit)
 
                 
                 # print('coords  ' , (state.players[i].x,state.players[i].y))
@@ -190,7 +241,7 @@ class Game:
             if new_state in states:
                 print("State has been repeated! Therefore, game is over.")
                 break
-            states += [new_state]
+            states.append(new_state)
             state = new_state
             end_t = int(round(time.time() * 1000))
             wait_time = turn_wait - (end_t - start_t)
@@ -202,28 +253,35 @@ class Game:
             #         if event.key == pygame.K_SPACE:
             #             break
             if wait_time > 0 and self.display:
+                import pygame
                 pygame.time.wait(wait_time)
 
             num_iter += 1
 
         
             
+        if self.logger is not None:
+            self.logger.end_game(state.winner)
         for player_id, agent in enumerate(self.agents):
             print('for ' , player_id)
             agent.learn(states, player_id)
-        pygame.time.wait(round_wait)
+        if self.display:
+            import pygame
+            pygame.time.wait(round_wait)
         
         # print(times_act)
         return num_iter,state.winner,times_act
 
     def _draw_state(self, state):
         if self.display:
+            import pygame
             surf = state.draw()
             # surf = pygame.transform.scale(surf, (672, 480))
             self.screen.blit(surf, (0, 0))
             pygame.display.flip()
 
     def _play_again(self):
+        import pygame
         font = pygame.font.SysFont("monospace", 32)
         font.set_bold(True)
         label = font.render("play again? (y/n)", 1, (255, 255, 255))
@@ -242,6 +300,179 @@ class Game:
                 if event.key == pygame.K_n:
                     return False
 
+def _checkpoints(directory):
+    """The complete checkpoints in `directory`, as (path, games), oldest
+    first."""
+    if directory is None or not os.path.isdir(directory):
+        return []
+    checkpoints = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith('game') and os.path.exists(os.path.join(path, 'games.npy')):
+            checkpoints += [(path, int(np.load(os.path.join(path, 'games.npy'))))]
+    return sorted(checkpoints, key=lambda c: c[1])
+
+
+def _save_random_state(directory):
+    """Saves the states of `random` and `np.random` to `directory`, as
+    `random.npy` (the Mersenne Twister state, its position last) and
+    `np_random.npy` (likewise), and `gauss.npy` (the Gaussians each
+    has cached, NaN for none)."""
+    os.makedirs(directory, exist_ok=True)
+    (_, internal, gauss_next) = random.getstate()
+    (_, keys, pos, has_gauss, cached_gaussian) = np.random.get_state()
+    np.save(os.path.join(directory, 'random.npy'), np.array(internal, dtype=np.uint32))
+    np.save(os.path.join(directory, 'np_random.npy'), np.append(keys, np.uint32(pos)))
+    np.save(os.path.join(directory, 'gauss.npy'),
+            np.array([np.nan if gauss_next is None else gauss_next,
+                      cached_gaussian if has_gauss else np.nan]))
+
+
+def _load_random_state(directory):
+    """Restores the states `_save_random_state` saved to `directory`."""
+    internal = np.load(os.path.join(directory, 'random.npy'))
+    state = np.load(os.path.join(directory, 'np_random.npy'))
+    (gauss_next, cached_gaussian) = np.load(os.path.join(directory, 'gauss.npy')).tolist()
+    random.setstate((3, tuple(internal.tolist()), None if np.isnan(gauss_next) else gauss_next))
+    np.random.set_state(('MT19937', state[:-1], int(state[-1]),
+                         int(not np.isnan(cached_gaussian)),
+                         0.0 if np.isnan(cached_gaussian) else cached_gaussian))
+
+
+class GameHistory:
+    """The states a game has gone through, in order (history[0] is the
+    initial state), as handed to Agent.learn.
+
+    States that can be encoded (see GameState.encode) are kept as
+    their codes, which take much less memory than the states, and are
+    decoded again when read. The key of every state is kept in a set,
+    so that checking whether a state has already occurred does not
+    compare it with every earlier one.
+    """
+    def __init__(self, state):
+        try:
+            state.encode()
+            self.game_type = state.game_type
+        except NotImplementedError:
+            self.game_type = None
+        self.items = []
+        self.keys = set()
+        self.append(state)
+
+    def append(self, state):
+        self.keys.add(state.key)
+        self.items.append(state if self.game_type is None else state.encode())
+
+    def __contains__(self, state):
+        return state.key in self.keys
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        item = self.items[i]
+        return item if self.game_type is None else self.game_type.decode(item)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class SuccessorCache:
+    """A bounded memo of `act`: the successor of every (state, action)
+    pair looked up, keyed by (state.dimensions, state.key, action), so
+    that asking again for a successor (from a sibling branch, the next
+    move's search or a learner's update) does not step the state again.
+
+    A cache serves every state of a class once it is set as the
+    class's `successors` attribute (see GameType.cache_successors),
+    and is switched off by setting that back to None. States are
+    immutable and `act` is deterministic, so a cached successor is
+    the one `act` would have built. Keys hold the size of the field or
+    board, so one cache serves games of every size. Invalid actions
+    are never cached: `act` reports them every time. Terminal states
+    are never looked up either: keys may leave out the winner, so a
+    won position can share its key with the same position still in
+    play, which has successors where it has none.
+
+    Once `capacity` entries are held, the least recently used one
+    makes room for the next.
+
+    :param int capacity: The maximum number of entries.
+    """
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("A successor cache needs room for at least one entry.")
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        # Lookups that found their successor, lookups that stepped the
+        # state, and entries dropped to make room.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_rate(self):
+        """The fraction of lookups the cache answered."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def act(self, state, action, act):
+        """Returns `act(state, action)`, from the cache if it is there."""
+        if state.is_terminal:
+            return act(state, action)
+        key = (state.dimensions, state.key, action)
+        entries = self.entries
+        successor = entries.get(key)
+        if successor is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return successor
+        self.misses += 1
+        successor = act(state, action)
+        if successor is not None:
+            entries[key] = successor
+            if len(entries) > self.capacity:
+                entries.popitem(last=False)
+                self.evictions += 1
+        return successor
+
+    def nbytes(self):
+        """A rough estimate of the memory the entries take: the table, the
+        keys, and each successor with its `encode()` tuple. What
+        successors share with other states (a record state's unchanged
+        fields, the lookup tables of the field) is not counted."""
+        total = sys.getsizeof(self.entries)
+        for (key, successor) in self.entries.items():
+            total += sys.getsizeof(key) + sys.getsizeof(key[1]) + sys.getsizeof(successor)
+            try:
+                total += sys.getsizeof(successor.encode())
+            except NotImplementedError:
+                pass
+        return total
+
+
+def cached_successors(act):
+    """Decorates the `act` of a state class so that it goes through the
+    class's SuccessorCache whenever one is set."""
+    @functools.wraps(act)
+    def cached_act(self, action):
+        cache = self.successors
+        if cache is None:
+            return act(self, action)
+        return cache.act(self, action, act)
+    return cached_act
+
+
 class GameType:
     """A helper class that initializes the game state. Used as a class
     since the game type might have parameters."""
@@ -251,6 +482,30 @@ class GameType:
     def init(self, agents):
         pass
 
+    @property
+    def state_class(self):
+        """The class of the states this game type creates."""
+        raise NotImplementedError
+
+    def cache_successors(self, capacity):
+        """Has every state of `state_class` remember its successors in a
+        new SuccessorCache of `capacity` entries, which is returned, or
+        stops caching them if `capacity` is None. The cache belongs to
+        the class, so it serves (and is replaced or stopped by) every
+        game type whose states are of that class, whatever their size."""
+        cache = None if capacity is None else SuccessorCache(capacity)
+        self.state_class.successors = cache
+        return cache
+
+    def decode(self, code):
+        """Returns the game state whose `encode()` is `code`.
+
+        Together with `GameState.encode` and `GameState.game_type`, this
+        lets states be sent to other processes as small tuples instead
+        of pickling whole records (and the agents inside them).
+        """
+        raise NotImplementedError
+
 
 class GameState(PRecord):
     """A recording of the current state of a game. The game state performs
@@ -263,6 +518,9 @@ class GameState(PRecord):
     in this class.
 
     """
+    # The SuccessorCache `act` goes through, if any (see
+    # cached_successors).
+    successors = None
 
     @property
     def num_players(self):
@@ -332,6 +590,29 @@ Allowed actions: {}""".format(action, self.actions))
             return None
         return self
 
+    @property
+    def key(self):
+        """A hashable value that is equal for two states exactly when the
+        states are. Games whose states are slow to hash override it."""
+        return self
+
+    @property
+    def dimensions(self):
+        """The size of the field or board the state is played on, which
+        tells apart states of different sizes whose `key`s are equal.
+        Games whose `key` leaves the size out override it."""
+        return ()
+
+    def encode(self):
+        """Returns a compact, picklable description of the state, which
+        `self.game_type.decode` turns back into an equal state."""
+        raise NotImplementedError
+
+    @property
+    def game_type(self):
+        """Returns a GameType that can decode this state's `encode()`."""
+        raise NotImplementedError
+
     def draw(self):
         """Used internally for visualizing the state of the game in the Game
         class.
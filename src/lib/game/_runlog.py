@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+
+
+class RunLogger:
+    """Records every move of a run of games, one record of the dtype
+    `RECORD` per decision:
+
+    * `game`: the number of the game in the run, from 0.
+    * `ply`: the number of moves already played in the game. A player
+      whose action turns out to be invalid decides again, and both
+      decisions are recorded under the same ply.
+    * `player`: the ID of the player that moved.
+    * `action`: the action it chose.
+    * `prediction`: the action it predicted its opponent would play
+      next (agents return it with their action), or -1.
+    * `hit`: for player 0, 1 if the opponent's last action was the one
+      player 0 predicted the turn before and 0 otherwise; -1 for the
+      other players.
+    * `winner`: `int(state.winner)` at the end of the game, or -1 if
+      nobody won.
+
+    Actions and predictions are stored as their index in `actions`
+    (e.g. discrete_soccer.ACTIONS), or as themselves if `actions` is
+    None (e.g. Connect 4 columns).
+
+    Records are held back until their game ends, and written
+    `buffer_size` at a time to one .npy file per field in `directory`
+    (`game.npy`, `ply.npy`, ...). Each file is a complete array after
+    every write, so a run can be read with `np.load(path,
+    mmap_mode='r')` while it is still going. Files already in
+    `directory` are replaced, unless `resume` is set, in which case
+    new records are added after them (see also `rewind`). With
+    `directory=None`, the records are only kept in memory (see
+    `records`).
+
+    :param str directory: Where to write the records, or None.
+    :param actions: The game's actions, in a fixed order, or None.
+    :param int buffer_size: Number of records written at a time.
+    :param bool resume: Whether to carry on from the records already
+        in `directory`.
+    """
+    RECORD = np.dtype([
+        ('game', np.int32),
+        ('ply', np.int32),
+        ('player', np.int8),
+        ('action', np.int16),
+        ('prediction', np.int16),
+        ('hit', np.int8),
+        ('winner', np.int8),
+    ])
+
+    def __init__(self, directory='.', actions=None, buffer_size=10000, resume=False):
+        self.directory = directory
+        self.actions = actions
+        self.buffer_size = buffer_size
+        self._index = None if actions is None else {a: i for (i, a) in enumerate(actions)}
+        self.game = 0
+        # Records of the current game, records of finished games that
+        # have not been written yet, and the number written.
+        self._moves = []
+        self._buffer = []
+        self.written = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            if resume and os.path.exists(self.path('game')):
+                game = np.load(self.path('game'), mmap_mode='r')
+                self.written = len(game)
+                self.game = int(game[-1]) + 1 if len(game) else 0
+                return
+            for name in self.RECORD.names:
+                if os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+
+    def path(self, field):
+        """The file holding `field` of every record."""
+        return os.path.join(self.directory, field + '.npy')
+
+    def _code(self, action):
+        if action is None:
+            return -1
+        if self._index is None:
+            return int(action)
+        return self._index[action]
+
+    def record(self, ply, player, action, prediction=None, hit=-1):
+        """Records a decision of `player` in the current game."""
+        self._moves += [(self.game, ply, player, self._code(action),
+                         self._code(prediction), hit)]
+
+    def end_game(self, winner):
+        """Ends the current game, won by `winner` (None if nobody won)."""
+        winner = -1 if winner is None else int(winner)
+        self._buffer += [move + (winner,) for move in self._moves]
+        self._moves = []
+        self.game += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, records):
+        """Adds the records of whole games, e.g. from a RunLogger in another
+        process, with their game numbers. The next game is numbered
+        after the last of them."""
+        if len(records):
+            self._buffer += records.tolist()
+            self.game = max(self.game, int(records['game'].max()) + 1)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the records of every finished game."""
+        if not self._buffer or self.directory is None:
+            return
+        records = np.array(self._buffer, dtype=self.RECORD)
+        self._buffer = []
+        for name in self.RECORD.names:
+            _append(self.path(name), records[name], self.written)
+        self.written += len(records)
+
+    def rewind(self, game):
+        """Drops the records of game `game` and every later game, so that
+        the next game is numbered `game` (e.g. when a run is resumed
+        from a checkpoint taken after `game` games)."""
+        self._moves = []
+        self._buffer = [r for r in self._buffer if r[0] < game]
+        if self.directory is not None and self.written:
+            kept = int(np.searchsorted(np.load(self.path('game'), mmap_mode='r'), game))
+            for name in self.RECORD.names:
+                _truncate(self.path(name), kept)
+            self.written = kept
+        self.game = game
+
+    def close(self):
+        self.flush()
+
+    def records(self):
+        """Returns every record of a finished game as an array of
+        `RECORD`s."""
+        if self.directory is None:
+            return np.array(self._buffer, dtype=self.RECORD)
+        self.flush()
+        records = np.empty(self.written, dtype=self.RECORD)
+        for name in self.RECORD.names:
+            if self.written:
+                records[name] = np.load(self.path(name), mmap_mode='r')
+        return records
+
+    def export_csv(self, path):
+        """Writes every record of a finished game to `path` as CSV, with a
+        header row of the field names."""
+        np.savetxt(path, self.records(), fmt='%d', delimiter=',',
+                   header=','.join(self.RECORD.names), comments='')
+
+
+def _append(path, column, length):
+    """Appends `column` to the .npy file at `path`, which holds `length`
+    items, and updates its header to match."""
+    if length == 0:
+        np.save(path, column)
+        return
+    with open(path, 'r+b') as f:
+        (version, fortran_order, dtype, offset) = _read_header(f)
+        f.seek(0, os.SEEK_END)
+        f.write(column.astype(dtype, copy=False).tobytes())
+        _write_header(f, path, version, fortran_order, dtype, length + len(column), offset)
+
+
+def _truncate(path, length):
+    """Cuts the .npy file at `path` down to its first `length` items."""
+    with open(path, 'r+b') as f:
+        (version, fortran_order, dtype, offset) = _read_header(f)
+        _write_header(f, path, version, fortran_order, dtype, length, offset)
+        f.truncate(offset + length * dtype.itemsize)
+
+
+def _read_header(f):
+    """Reads the header of the .npy file `f` as (version, fortran_order,
+    dtype, offset of the data)."""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        (_, fortran_order, dtype) = np.lib.format.read_array_header_1_0(f)
+    else:
+        (_, fortran_order, dtype) = np.lib.format.read_array_header_2_0(f)
+    return (version, fortran_order, dtype, f.tell())
+
+
+def _write_header(f, path, version, fortran_order, dtype, length, offset):
+    """Rewrites the header of the .npy file `f` for `length` items."""
+    # np.save leaves room in the header for the length to grow, so
+    # the new header takes exactly the space of the old one.
+    f.seek(0)
+    header = {'descr': np.lib.format.dtype_to_descr(dtype),
+              'fortran_order': fortran_order,
+              'shape': (length,)}
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(f, header)
+    else:
+        np.lib.format.write_array_header_2_0(f, header)
+    if f.tell() != offset:
+        raise ValueError("The header of {} changed size.".format(path))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+
+class TranspositionTable:
+    """A fixed-size table of search results, indexed by position, so that
+    a position reached again through a different order of moves does
+    not have to be searched again.
+
+    Each entry records how many plies below the position were searched
+    (`depth`), the value found, whether that value is exact or only a
+    lower or upper bound on the true value (searches with alpha-beta
+    pruning stop as soon as they know a value falls outside the
+    alpha-beta window), and optionally the best action found, which is
+    worth trying first when the position is searched again.
+
+    The table has `size` slots and a key can only go in slot
+    `hash(key) % size`, so it never holds more than `size` entries.
+    When two keys compete for a slot, an entry written during an
+    earlier search (see `new_search`) is always replaced, and otherwise
+    the entry searched deeper is kept.
+
+    Keys are compared with ==, so states must define equality as well
+    as hashing (SoccerState and the other GameStates do).
+
+    :param int size: The maximum number of entries.
+    """
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("A transposition table needs at least one slot.")
+        self.size = size
+        self.slots = [None] * size
+        self.generation = 0
+        # Probes that found a deep enough entry, probes that did not,
+        # and entries written.
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def new_search(self):
+        """Marks every current entry as belonging to an earlier search, so
+        that the following search prefers its own entries to them."""
+        self.generation += 1
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.hits = self.misses = self.stores = 0
+
+    def __len__(self):
+        return self.size - self.slots.count(None)
+
+    def probe(self, key, depth):
+        """Returns the (value, bound) stored for `key` by a search at least
+        `depth` plies deep, or None if there is none."""
+        entry = self.slots[hash(key) % self.size]
+        if entry is not None and entry[1] >= depth and entry[0] == key:
+            self.hits += 1
+            return (entry[2], entry[3])
+        self.misses += 1
+        return None
+
+    def best_action(self, key):
+        """Returns the best action stored for `key` by a search of any
+        depth, or None."""
+        entry = self.slots[hash(key) % self.size]
+        if entry is not None and entry[0] == key:
+            return entry[5]
+        return None
+
+    def store(self, key, depth, value, bound, action=None):
+        """Records that searching `key` `depth` plies deep gave `value`,
+        which is exact, a lower bound or an upper bound as given by
+        `bound`, and that `action` was the best action found."""
+        i = hash(key) % self.size
+        entry = self.slots[i]
+        if entry is None or entry[4] != self.generation or depth >= entry[1] or entry[0] == key:
+            self.slots[i] = (key, depth, value, bound, self.generation, action)
+            self.stores += 1
+
+    @staticmethod
+    def bound(value, alpha, beta):
+        """The kind of bound `value` is when a search with the window
+        (`alpha`, `beta`) returns it."""
+        if value <= alpha:
+            return TranspositionTable.UPPER
+        elif value >= beta:
+            return TranspositionTable.LOWER
+        return TranspositionTable.EXACT
+
+    @staticmethod
+    def cutoff(value, bound, alpha, beta):
+        """True if a stored (`value`, `bound`) settles a search with the
+        window (`alpha`, `beta`) without searching again."""
+        return bound == TranspositionTable.EXACT \
+            or bound == TranspositionTable.LOWER and value >= beta \
+            or bound == TranspositionTable.UPPER and value <= alpha
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import copy
+import multiprocessing
+import random
+import time
+import numpy as np
+
+from ._game import Game
+from ._runlog import RunLogger
+
+
+# The game type, agents and logger a worker process plays with (see
+# Tournament.run).
+_worker_game = None
+
+
+def _init_worker(game_type, agents, logger):
+    global _worker_game
+    _worker_game = Game(game_type, agents, logger=logger)
+
+
+def _play_games(game, task):
+    """Plays the games of `task` = (seeds, fresh) with copies of the
+    agents of `game`, and returns (plies, winner) for each, along with
+    the records of an in-memory RunLogger if `game` has a logger (with
+    games numbered from 0). With `fresh`, every game starts from a new
+    copy of the agents; otherwise one copy plays them all in order,
+    carrying over whatever it learns."""
+    (seeds, fresh) = task
+    results = []
+    agents = game.agents
+    logger = None if game.logger is None else RunLogger(None, game.logger.actions)
+    for seed in seeds:
+        if fresh or not results:
+            game = Game(game.game_type, copy.deepcopy(agents), logger=logger)
+        random.seed(seed)
+        np.random.seed(seed)
+        (plies, winner, _) = game._run_round(2, -1, -1)
+        results += [(plies, winner)]
+    return (results, None if logger is None else logger.records())
+
+
+def _play_task(task):
+    return _play_games(_worker_game, task)
+
+
+class Tournament:
+    """Plays `num_games` games between `agents`, spread over `workers`
+    processes.
+
+    Game `i` of replica `r` is seeded with `seed + r * num_games + i`
+    (both `random` and `np.random`), and every game of a replica
+    starts from a copy of `agents` as they were when the tournament
+    started, so the results depend only on the seed and not on how
+    many processes play the games.
+
+    Agents with a true `learning` attribute (e.g. OpponentLearning)
+    carry what they learn from game to game, so each replica's games
+    are played in order by one copy of the agents, in one process.
+    `replicas` independent runs can then be played side by side. The
+    games of agents that do not learn are independent of each other
+    and are shared out among the processes individually.
+
+    The agents must be picklable. If a `logger` (a RunLogger) is
+    given, the moves of every game are logged to it in game order,
+    game `i` of replica `r` as the `r * num_games + i`th game.
+
+    :param GameType game_type: The game to play.
+    :param agents: The agents, in player order.
+    :param int num_games: Games per replica.
+    :param int replicas: Number of independent runs of `num_games`.
+    :param int seed: Seed of the first game.
+    :param int workers: Number of processes (default: number of CPUs).
+    :param RunLogger logger: Where to log the moves, if anywhere.
+    """
+    def __init__(self, game_type, agents, num_games, replicas=1, seed=0, workers=None,
+                 logger=None):
+        self.game_type = game_type
+        self.agents = list(agents)
+        self.num_games = num_games
+        self.replicas = replicas
+        self.seed = seed
+        self.workers = workers or multiprocessing.cpu_count()
+        self.logger = logger
+        self.learning = any(getattr(a, 'learning', False) for a in self.agents)
+        # results[r][i] = (plies, winner) of game i of replica r, and
+        # the time the last run took.
+        self.results = None
+        self.elapsed = None
+
+    def _tasks(self):
+        tasks = []
+        for r in range(self.replicas):
+            first = self.seed + r * self.num_games
+            if self.learning:
+                tasks += [(range(first, first + self.num_games), False)]
+            else:
+                tasks += [(range(s, s + 1), True) for s in range(first, first + self.num_games)]
+        return tasks
+
+    def run(self):
+        """Plays every game and returns `self.results`, in game order."""
+        start = time.perf_counter()
+        tasks = self._tasks()
+        workers = min(self.workers, len(tasks))
+        # Games are logged in the workers and then renumbered here.
+        logger = None if self.logger is None else RunLogger(None, self.logger.actions)
+        if workers <= 1:
+            game = Game(self.game_type, self.agents, logger=logger)
+            done = [_play_games(game, task) for task in tasks]
+        else:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            with multiprocessing.Pool(workers, initializer=_init_worker,
+                                      initargs=(self.game_type, self.agents, logger)) as pool:
+                done = list(pool.imap(_play_task, tasks, chunksize))
+        games = []
+        first_game = None if self.logger is None else self.logger.game
+        for ((seeds, _), (results, records)) in zip(tasks, done):
+            games += results
+            if records is not None:
+                records['game'] += first_game + seeds[0] - self.seed
+                self.logger.extend(records)
+        if self.logger is not None:
+            self.logger.flush()
+        self.results = [games[r * self.num_games:(r + 1) * self.num_games]
+                        for r in range(self.replicas)]
+        self.elapsed = time.perf_counter() - start
+        return self.results
+
+    @property
+    def games_per_second(self):
+        return self.replicas * self.num_games / self.elapsed
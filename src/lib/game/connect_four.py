@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 from ._game import *
-import pygame
 from pyrsistent import m, v, PMap, PVector, field, pvector_field, pmap_field
 from enum import Enum, IntEnum
 import math
@@ -9,6 +8,7 @@ import random
 
 class InteractiveAgent(Agent):
     def decide(self, state):
+        import pygame
         if state.width > 10:
             raise ValueError("InteractivePlayer can only play games on Connect 4 boards of width <= 10.")
         actions = state.actions
@@ -34,14 +34,31 @@ class InteractiveAgent(Agent):
 
 
 class generator(GameType):
-    def __init__(self, width=7, height=6, connect_length=4):
+    """Connect 4 games on a width x height board.
+
+    :param backend: 'record' plays with Connect4State, which keeps
+        the board as pyrsistent vectors; 'bitboard' plays with
+        BitboardConnect4State, which keeps it as two integers and is
+        much faster to search. Both follow the same rules.
+    """
+    def __init__(self, width=7, height=6, connect_length=4, backend='record'):
+        if backend not in ('record', 'bitboard'):
+            raise ValueError("Unknown Connect 4 backend '{}'. Choose either 'record' or 'bitboard'.".format(backend))
         self.width = width
         self.height = height
         self.connect_length = connect_length
+        self.backend = backend
+
+    @property
+    def state_class(self):
+        return BitboardConnect4State if self.backend == 'bitboard' else Connect4State
 
     def init(self, agents):
         if len(agents) != 2:
             return ValueError("Connect 4 only accepts games with 2 agents.")
+        if self.backend == 'bitboard':
+            return BitboardConnect4State.initial(
+                BitboardGrid.get(self.width, self.height, self.connect_length))
         board = v(*[v() for _ in range(self.width)])
         state = Connect4State(
             current_player_id=0,
@@ -53,6 +70,28 @@ class generator(GameType):
         )
         return state
 
+    def decode(self, code):
+        """Returns the state of this generator's backend whose `encode()`
+        is `code`."""
+        grid = BitboardGrid.get(self.width, self.height, self.connect_length)
+        (current_player_id, board_0, board_1, winner) = code
+        mask = board_0 | board_1
+        if self.backend == 'bitboard':
+            return BitboardConnect4State(grid, current_player_id, (board_0, board_1), mask,
+                                         bin(mask).count('1'), winner)
+        stride = self.height + 1
+        board = v(*[v(*[0 if board_0 >> (x * stride + y) & 1 else 1
+                        for y in range(self.height) if mask >> (x * stride + y) & 1])
+                    for x in range(self.width)])
+        return Connect4State(
+            current_player_id=current_player_id,
+            width=self.width,
+            height=self.height,
+            connect_length=self.connect_length,
+            board=board,
+            winner=winner
+        )
+
 
 class Connect4State(GameState):
     current_player_id = field(int)
@@ -88,6 +127,7 @@ class Connect4State(GameState):
             return 0
         return 10 if player_id == self.winner else -10
 
+    @cached_successors
     def act(self, action):
         self._action_is_valid(action)
 
@@ -99,6 +139,7 @@ class Connect4State(GameState):
         return state
 
     def draw(self):
+        import pygame
         surf = pygame.Surface((672, 480))
         padding_x = 30
         padding_y = 20
@@ -149,6 +190,21 @@ class Connect4State(GameState):
 
         return surf
 
+    def encode(self):
+        """Returns the position as (current player, bitboard of player 0,
+        bitboard of player 1, winner), with the bit layout of
+        BitboardGrid."""
+        boards = [0, 0]
+        stride = self.height + 1
+        for (x, column) in enumerate(self.board):
+            for (y, chip) in enumerate(column):
+                boards[chip] |= 1 << (x * stride + y)
+        return (self.current_player_id, boards[0], boards[1], self.winner)
+
+    @property
+    def game_type(self):
+        return generator(self.width, self.height, self.connect_length)
+
     def at(self, x, y):
         if x < 0 or x >= self.width or y < 0 or y >= len(self.board[x]):
             return None
@@ -212,3 +268,238 @@ class Connect4State(GameState):
              and all([state.column_filled(x) for x in range(self.width)]):
             state = state.set(winner=-1)
         return state
+
+
+################################################################
+## BITBOARD BACKEND
+################################################################
+
+class BitboardGrid:
+    """The bit layout of a Connect 4 board, plus the masks derived from
+    it. There is one BitboardGrid per board size (see
+    `BitboardGrid.get`), shared by every state played on it.
+
+    Column x takes bits x*(height+1) to x*(height+1)+height-1, bottom
+    to top, and bit x*(height+1)+height is left empty so that shifts
+    never carry a chip from one column into the next. Moving one cell
+    along a line is then a shift by `height+1` (horizontal), 1
+    (vertical), `height+2` (rising diagonal) or `height` (falling
+    diagonal).
+
+    """
+    __slots__ = ('width', 'height', 'connect_length', 'size', 'bottom', 'columns',
+                 'top', 'windows')
+
+    _grids = {}
+
+    @classmethod
+    def get(cls, width, height, connect_length):
+        """Returns the BitboardGrid for a board, building it the first time
+        the board is used."""
+        key = (width, height, connect_length)
+        grid = cls._grids.get(key)
+        if grid is None:
+            grid = cls._grids[key] = cls(width, height, connect_length)
+        return grid
+
+    def __init__(self, width, height, connect_length):
+        self.width = width
+        self.height = height
+        self.connect_length = connect_length
+        self.size = width * height
+        stride = height + 1
+        self.bottom = tuple(1 << (x * stride) for x in range(width))
+        self.columns = tuple(((1 << height) - 1) << (x * stride) for x in range(width))
+        self.top = tuple(1 << (x * stride + height - 1) for x in range(width))
+
+        # For every bit, the (shift, mask) of each line through the cell
+        # that a chip placed there can complete. The masks cover the
+        # same cells Connect4State._update_check_win looks at: the chip
+        # and the three cells below it, and three cells either way
+        # along the row and the diagonals. Lines too short to hold
+        # `connect_length` chips are left out.
+        self.windows = [()] * (width * stride)
+        for x in range(width):
+            for y in range(height):
+                windows = []
+                for (shift, cells) in (
+                        (1, [(x, y - i) for i in range(4)]),
+                        (stride, [(x + i, y) for i in range(-3, 4)]),
+                        (stride + 1, [(x + i, y + i) for i in range(-3, 4)]),
+                        (stride - 1, [(x + i, y - i) for i in range(-3, 4)])):
+                    mask = 0
+                    for (cx, cy) in cells:
+                        if 0 <= cx < width and 0 <= cy < height:
+                            mask |= 1 << (cx * stride + cy)
+                    if bin(mask).count('1') >= connect_length:
+                        windows += [(shift, mask)]
+                self.windows[x * stride + y] = tuple(windows)
+
+
+class BitboardConnect4State:
+    """A Connect 4 game state stored as bitboards (see BitboardGrid).
+
+    `boards[p]` has a bit set for every chip of player p, `mask` is
+    their union and `moves` is the number of chips played. Placing a
+    chip is an addition on the column, a win is found by shifting and
+    masking the player's board along the lines through the new chip,
+    and the game is drawn once `moves` reaches the number of cells.
+
+    The rules are the same as Connect4State's, and so are the public
+    GameState methods (`actions`, `act`, `is_terminal`, `reward`, ...)
+    along with `width`, `height`, `connect_length`, `winner`, `at` and
+    `column_filled`, so agents work with either backend.
+
+    """
+    __slots__ = ('grid', 'current_player_id', 'boards', 'mask', 'moves', 'winner')
+    # See GameState.successors.
+    successors = None
+
+    def __init__(self, grid, current_player_id, boards, mask, moves, winner):
+        self.grid = grid
+        self.current_player_id = current_player_id
+        self.boards = boards
+        self.mask = mask
+        self.moves = moves
+        self.winner = winner
+
+    @classmethod
+    def initial(cls, grid):
+        """Returns the empty board of `grid`, with player 0 to move."""
+        return cls(grid, 0, (0, 0), 0, 0, None)
+
+    ################################################################
+    ## PUBLIC METHODS
+    ################################################################
+
+    @property
+    def num_players(self):
+        return 2
+
+    @property
+    def current_player(self):
+        return self.current_player_id
+
+    @property
+    def is_terminal(self):
+        return self.winner != None
+
+    @property
+    def actions(self):
+        mask = self.mask
+        return [x for (x, top) in enumerate(self.grid.top) if not mask & top]
+
+    def reward(self, player_id):
+        if self.winner == None:
+            return None
+        ## Draw
+        if self.winner < 0:
+            return 0
+        return 10 if player_id == self.winner else -10
+
+    @cached_successors
+    def act(self, action):
+        grid = self.grid
+        if self.winner != None or action not in range(grid.width) or self.mask & grid.top[action]:
+            # Let _action_is_valid report what is wrong.
+            self._action_is_valid(action)
+            return None
+
+        player = self.current_player_id
+        # The chips of a column fill its bits from the bottom up, so
+        # adding the bottom bit gives the first empty cell.
+        chip = (self.mask & grid.columns[action]) + grid.bottom[action]
+        board = self.boards[player] | chip
+        boards = (board, self.boards[1]) if player == 0 else (self.boards[0], board)
+
+        winner = None
+        steps = grid.connect_length - 1
+        for (shift, window) in grid.windows[chip.bit_length() - 1]:
+            # After n steps, a bit is left set wherever n+1 chips
+            # in a row start.
+            run = board & window
+            for _ in range(steps):
+                run &= run >> shift
+            if run:
+                winner = player
+                break
+        moves = self.moves + 1
+        if winner is None and moves == grid.size:
+            winner = -1
+
+        return BitboardConnect4State(grid, (player + 1) % 2, boards, self.mask | chip, moves, winner)
+
+    @property
+    def width(self):
+        return self.grid.width
+
+    @property
+    def height(self):
+        return self.grid.height
+
+    @property
+    def connect_length(self):
+        return self.grid.connect_length
+
+    @property
+    def board(self):
+        """The chips as one tuple per column, bottom to top, like
+        Connect4State.board."""
+        return tuple(tuple(self.at(x, y) for y in range(self.column_height(x)))
+                     for x in range(self.width))
+
+    def at(self, x, y):
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return None
+        bit = 1 << (x * (self.height + 1) + y)
+        if self.boards[0] & bit:
+            return 0
+        elif self.boards[1] & bit:
+            return 1
+        return None
+
+    def column_height(self, x):
+        return bin(self.mask & self.grid.columns[x]).count('1')
+
+    def column_filled(self, x):
+        return bool(self.mask & self.grid.top[x])
+
+    @property
+    def key(self):
+        """The current player and both boards, which tell positions
+        apart."""
+        return (self.current_player_id,) + self.boards
+
+    @property
+    def dimensions(self):
+        """The board's width, height and connect length, which `key`
+        leaves out."""
+        grid = self.grid
+        return (grid.width, grid.height, grid.connect_length)
+
+    def encode(self):
+        """See Connect4State.encode."""
+        return (self.current_player_id,) + self.boards + (self.winner,)
+
+    @property
+    def game_type(self):
+        return generator(self.width, self.height, self.connect_length, backend='bitboard')
+
+    def __eq__(self, other):
+        if not isinstance(other, BitboardConnect4State):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return 'BitboardConnect4State(current_player_id={}, boards={}, winner={})'.format(
+            self.current_player_id, self.boards, self.winner)
+
+    # These only read `width`, `height`, `at` and `winner`, so they are
+    # shared with Connect4State rather than duplicated.
+    draw = Connect4State.draw
+    get_range = Connect4State.get_range
+    chain_length = Connect4State.chain_length
+    _action_is_valid = GameState._action_is_valid
@@ -2,11 +2,12 @@
 from typing import List
 
 from ._game import *
-import pygame
 from pyrsistent import m, v, PMap, PVector, field, pvector_field, pmap_field
 from enum import Enum, IntEnum
+from collections import namedtuple
 import math
 import random
+import numpy as np
 
 
 MAX_KICK_DIST = 5
@@ -33,11 +34,20 @@ class Team(IntEnum):
         return "red" if self == Team.RED else "blue"
 
 
+# Every soccer action, in the order `state.actions` lists them.
+ACTIONS = (
+    Action.KICK,
+    Action.move(1, 0), Action.move(-1, 0),
+    Action.move(0, 1), Action.move(0, -1)
+)
+
+
 class InteractiveAgent(Agent):
     def __init__(self, evaluation_function=None):
         self.evaluate = evaluation_function
 
     def decide(self, state):
+        import pygame
         # print('i decide')
         if self.evaluate:
             self.evaluate(state, state.current_player, True)
@@ -78,13 +88,39 @@ class InteractiveAgent(Agent):
 
 
 class generator(GameType):
-    def __init__(self, field_width=10, field_height=6, goal_height=2, random_pos=True):
+    """Creates discrete soccer games.
+
+    :param str backend: The state representation to use. 'record'
+        (the default) uses the pyrsistent SoccerState; 'packed' uses
+        PackedSoccerState, which stores the whole position in a flat
+        tuple and is considerably faster to step through.
+    """
+    def __init__(self, field_width=10, field_height=6, goal_height=2, random_pos=True,
+                 backend='record'):
+        if backend not in ('record', 'packed'):
+            raise ValueError("Unknown soccer backend '{}'. Choose either 'record' or 'packed'.".format(backend))
         self.field_width = field_width
         self.field_height = field_height
         self.goal_height = goal_height
         self.random_pos = random_pos
+        self.backend = backend
+        # Lookup tables shared by every state played on this field.
+        self.pitch = SoccerPitch.get(field_width, field_height, goal_height)
+
+    def __reduce__(self):
+        # The lookup tables are rebuilt (or found again) on unpickling
+        # rather than sent along.
+        return (generator, (self.field_width, self.field_height, self.goal_height,
+                            self.random_pos, self.backend))
+
+    @property
+    def state_class(self):
+        return PackedSoccerState if self.backend == 'packed' else SoccerState
 
     def init(self, agents):
+        if self.backend == 'packed':
+            return PackedSoccerState.initial(self.pitch, len(agents),
+                                             random_pos=self.random_pos)
         players = v(*[m(
             type="player",
             index=i,
@@ -138,6 +174,56 @@ class generator(GameType):
         state = state._update_reset(random_pos=self.random_pos)
         return state
 
+    def decode(self, code, agents=None):
+        """Returns the state of this generator's backend whose `encode()`
+        is `code`. `agents` are attached to the players of a record
+        state."""
+        if self.backend == 'packed':
+            return PackedSoccerState(self.pitch, tuple(code))
+        num_players = (len(code) - 5) >> 2
+        agents = agents or [None] * num_players
+        players = v(*[m(
+            type="player",
+            index=i,
+            agent=agents[i],
+            team=_team_of(i),
+            x=code[3 + 4 * i], y=code[4 + 4 * i],
+            has_ball=code[6 + 4 * i],
+            stance=code[5 + 4 * i]
+        ) for i in range(num_players)])
+        teams = m(
+            red=v(*range(0, num_players, 2)),
+            blue=v(*range(1, num_players, 2))
+        )
+        ball = m(type='ball', on_field=code[-2], x=code[1], y=code[2])
+        pitch = m(
+            width=self.field_width,
+            height=self.field_height,
+            goal_height=self.goal_height
+        )
+        return SoccerState(
+            current_player_id=code[0],
+            players=players,
+            teams=teams,
+            ball=ball,
+            pitch=pitch,
+            winner=code[-1]
+        )
+
+
+class _SoccerStateCache:
+    """Lazily computed values of a single SoccerState (see
+    SoccerState._cache)."""
+    __slots__ = ('cells', 'key', 'hash')
+
+    def __init__(self):
+        # Occupancy index: maps (x, y) to the object SoccerState.at
+        # returns there.
+        self.cells = None
+        # SoccerState.key and its hash.
+        self.key = None
+        self.hash = None
+
 
 class SoccerState(GameState):
     ################################################################
@@ -162,103 +248,17 @@ class SoccerState(GameState):
 
     @property
     def actions(self):
-        player = self.current_player_obj
-        actions = []
-        if player.has_ball:
-            actions += [Action.KICK]
-        # actions += [Action.CHANGE_STANCE]
-        dx = 1 if player.team == Team.RED else -1
-        actions += [
-            Action.move(1, 0), Action.move(-1, 0),
-            Action.move(0, 1), Action.move(0, -1)
-        ]
-
-        if player.x < 1:
-            actions.remove(Action.move(-1, 0))
-        if player.x == self.pitch.width:
-            actions.remove(Action.move(1, 0))
-        if player.y <= 1:
-            actions.remove(Action.move(0, -1))
-        if player.y == self.pitch.height:
-            actions.remove(Action.move(0, 1))
-
-        # i think this is diagonal moves
-        # if player.x <= 1:
-        #     dx = 1
-        # elif player.x >= self.pitch.width:
-        #     dx = -1
-        # else:
-        #     dx = 1 if player.team == Team.RED else -1
-
-        # actions += [
-        #     Action.move(dx, 1), Action.move(dx, -1)
-        # ]
-        return actions
+        return self.get_valid_actions(self.current_player_obj)
 
     @property
     def acts(self):
-        player = self.current_player_obj
-        # print('pl in act  ' , player)
-        actions = []
-        if player.has_ball:
-            actions += [Action.KICK]
-        # actions += [Action.CHANGE_STANCE]
-        dx = 1 if player.team == Team.RED else -1
-        actions += [
-            Action.move(1, 0), Action.move(-1, 0),
-            Action.move(0, 1), Action.move(0, -1)
-        ]
-
-        if player.x < 1:
-            actions.remove(Action.move(-1, 0))
-        if player.x == self.pitch.width:
-            actions.remove(Action.move(1, 0))
-        if player.y <= 1:
-            actions.remove(Action.move(0, -1))
-        if player.y == self.pitch.height:
-            actions.remove(Action.move(0, 1))
-
-        # i think this is diagonal moves
-        # if player.x <= 1:
-        #     dx = 1
-        # elif player.x >= self.pitch.width:
-        #     dx = -1
-        # else:
-        #     dx = 1 if player.team == Team.RED else -1
-
-        # actions += [
-        #     Action.move(dx, 1), Action.move(dx, -1)
-        # ]
-        return actions
-    
-    def get_valid_actions(self , player):
-
-        actions = []
-        if player.has_ball:
-            actions += [Action.KICK]
-        # actions += [Action.CHANGE_STANCE]
-
-        actions += [
-            Action.move(1, 0), Action.move(-1, 0),
-            Action.move(0, 1), Action.move(0, -1)
-        ]
-
-        # print('PLAYER COORDS  ', (player.x, player.y))
-
-        if player.x < 1:
-            actions.remove(Action.move(-1, 0))
-        if player.x == self.pitch.width:
-            actions.remove(Action.move(1, 0))
-        if player.y <= 1:
-            actions.remove(Action.move(0, -1))
-        if player.y == self.pitch.height:
-            actions.remove(Action.move(0, 1))
-
-        # print('ACTIONS  ' , actions)
+        return self.get_valid_actions(self.current_player_obj)
 
-        return actions
-
-         
+    def get_valid_actions(self, player):
+        """Returns the actions available to `player`, as a tuple shared
+        with every other state where a player stands at the same
+        position (see ActionTable)."""
+        return self.pitch_info.actions[player.x, player.y, player.has_ball]
 
     def reward(self, player_id):
         if not self.is_terminal:
@@ -307,6 +307,7 @@ class SoccerState(GameState):
         #     {'last_action': action})
 
 
+    @cached_successors
     def act(self, action):
         player = self.current_player_obj
         state = self
@@ -400,6 +401,12 @@ class SoccerState(GameState):
     # won the game.
     winner = field(type=(Team, type(None)))
 
+    @property
+    def pitch_info(self):
+        """Returns the SoccerPitch holding the lookup tables for this
+        state's field."""
+        return SoccerPitch.of(self.pitch)
+
     @property
     def objects(self):
         """Returns the list of 'objects' (players + the ball)"""
@@ -407,6 +414,12 @@ class SoccerState(GameState):
 
     def dist_to_goal(self, pos, team):
         """Returns the distance between an (x, y) position and a team's goal."""
+        (x, y) = pos
+        pitch = self.pitch_info
+        rows = pitch.goal_distance_rows[team]
+        m = pitch.margin
+        if -m <= x < len(rows) - m and -m <= y < len(rows[0]) - m and x == int(x) and y == int(y):
+            return rows[int(x) + m][int(y) + m]
         goal_pos = (self.pitch.width+0.5, self.pitch.height/2) if team == Team.RED \
                    else (0.5, self.pitch.height/2)
         return math.sqrt(sum([(p1+0.51-p2)**2 for p1, p2 in zip(pos, goal_pos)]))
@@ -416,11 +429,29 @@ class SoccerState(GameState):
         None.
 
         """
-        for obj in self.objects:
-            ## invariant: no two objects occupy the same space
-            if obj.x == x and obj.y == y:
-                return obj
-        return None
+        cache = self._cache
+        if cache.cells is None:
+            ## Where objects share a position, the first one in
+            ## `objects` is the one that is returned.
+            cache.cells = {}
+            for obj in reversed(self.objects):
+                cache.cells[obj.x, obj.y] = obj
+        return cache.cells.get((x, y))
+
+    @property
+    def _cache(self):
+        """Values derived from this state, computed at most once each.
+
+        PRecord instances have no __dict__ and cannot declare slots of
+        their own. The one spare per-instance slot is PMap's hash
+        cache, which SoccerState never fills since it defines its own
+        __hash__, so the cache is kept there.
+        """
+        try:
+            return self._cached_hash
+        except AttributeError:
+            cache = self._cached_hash = _SoccerStateCache()
+            return cache
 
     @property
     def current_player_obj(self):
@@ -551,54 +582,29 @@ class SoccerState(GameState):
         return state
 
     def is_goal(self, dist, angle):
-        return 20*abs(angle)**2/(dist**2) > 3e-1
+        return _is_goal(dist, angle)
 
     def can_shoot_from(self, x, y, team):
-        (x, y) = (x + 0.5, y - 0.5)
-        goal_x = self.pitch.width + 2 if team == Team.RED else 0
-        goal_y1 = int(self.pitch.height - self.pitch.goal_height) / 2
-        goal_y2 = int(self.pitch.height + self.pitch.goal_height) / 2
-        dx = goal_x - x
-        dy1 = (goal_y1 - y)
-        dy2 = (goal_y2 - y)
-        norm1 = math.sqrt(dx**2 + dy1**2)
-        norm2 = math.sqrt(dx**2 + dy2**2)
-        dy = ((goal_y1+goal_y2)/2 - y)
-
-        dist = math.sqrt(dx**2 + dy**2)
-        angle = math.acos((dx**2 + dy1*dy2)/(norm1*norm2))
-
-        return self.is_goal(dist, angle)
+        return self.pitch_info.shot(x, y, team)[7]
 
     def check_kick(self, player):
-        (x, y) = (player.x + 0.5, player.y - 0.5)
-        goal_x = self.pitch.width + 2 if player.team == Team.RED else 0
-        goal_y1 = int(self.pitch.height - self.pitch.goal_height) / 2
-        goal_y2 = int(self.pitch.height + self.pitch.goal_height) / 2
-        dx = goal_x - x
-        dy1 = (goal_y1 - y)
-        dy2 = (goal_y2 - y)
-        norm1 = math.sqrt(dx**2 + dy1**2)
-        norm2 = math.sqrt(dx**2 + dy2**2)
-        dy = ((goal_y1+goal_y2)/2 - y)
-
-        f_y1 = lambda obj_x: y + dy1 * obj_x
-        f_y2 = lambda obj_x: y + dy2 * obj_x
-
-        dist = math.sqrt(dx**2 + dy**2)
-        angle = math.acos((dx**2 + dy1*dy2)/(norm1*norm2))
+        (x, y, dx, dy1, dy2, dist, angle, is_goal) = \
+            self.pitch_info.shot(player.x, player.y, player.team)
 
         # Check for interceptions
-        intercept = (None, float("inf"))
+        intercept = None
+        intercept_dist = float("inf")
         for obj in self.players:
             if obj.index == player.index: continue
             (obj_x, obj_y) = (obj.x + 0.5, obj.y + 0.5)
             obj_x = (obj_x - x) / dx
-            if obj_y >= f_y1(obj_x) and obj_y <= f_y2(obj_x):
-                new_i = (obj, math.sqrt((x - obj_x)**2 + (y - obj_y)**2))
-                intercept = min([intercept, new_i], key=lambda x: x[1])
+            if obj_y >= y + dy1 * obj_x and obj_y <= y + dy2 * obj_x:
+                d = math.sqrt((x - obj_x)**2 + (y - obj_y)**2)
+                if d < intercept_dist:
+                    intercept = obj
+                    intercept_dist = d
 
-        return (dist, angle, self.is_goal(dist, angle), intercept[0])
+        return (dist, angle, is_goal, intercept)
 
     def _update_kick(self):
         """State update: Current player kicks towards opponent goal."""
@@ -766,6 +772,7 @@ class SoccerState(GameState):
 
     def draw(self):
         """Internal method, draws the current game configuration."""
+        import pygame
         BLOCK_SIZE = B = 32
         PITCH_COLOR = (0, 200, 0)
         PLAYER_RED_COLOR = (255, 0, 0)
@@ -860,10 +867,1032 @@ class SoccerState(GameState):
 
         return surf
 
+    @property
+    def key(self):
+        """The fields that tell positions apart: the current player, the
+        ball's position and each player's position, stance and
+        possession, as a flat tuple (`encode()` without the ball's
+        on_field flag and the winner). Two states are equal exactly when
+        their keys are, whichever backend they come from."""
+        cache = self._cache
+        if cache.key is None:
+            cache.key = self.encode()[:-2]
+        return cache.key
+
+    @property
+    def dimensions(self):
+        """The field's width, height and goal height, which `key` leaves
+        out."""
+        pitch = self.pitch
+        return (pitch.width, pitch.height, pitch.goal_height)
+
+    def __eq__(self, other):
+        if not isinstance(other, (SoccerState, PackedSoccerState)):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self):
+        cache = self._cache
+        if cache.hash is None:
+            cache.hash = hash(self.key)
+        return cache.hash
+
+    def encode(self):
+        """Returns the position as the flat tuple used by
+        PackedSoccerState (see PackedSoccerState.code)."""
+        code = [self.current_player, self.ball.x, self.ball.y]
+        for p in self.players:
+            code += [p.x, p.y, p.stance, p.has_ball]
+        return tuple(code + [self.ball.on_field, self.winner])
+
+    @property
+    def game_type(self):
+        pitch = self.pitch
+        return generator(pitch.width, pitch.height, pitch.goal_height)
+
+
+################################################################
+## PACKED BACKEND
+################################################################
+
+# Read-only views of the objects in a PackedSoccerState. They have the
+# same attributes as the PMaps in SoccerState.players and
+# SoccerState.ball (apart from the player's agent), so evaluation
+# functions work unchanged on either backend.
+SoccerPlayer = namedtuple('SoccerPlayer', 'type index team x y has_ball stance')
+SoccerBall = namedtuple('SoccerBall', 'type on_field x y')
+
+
+class ActionTable(dict):
+    """The legal actions for every (x, y, has_ball) of a field, mapped to
+    immutable tuples that are shared between all states.
+
+    The whole field (including the goal lines) is filled in up front;
+    positions further out, where resets can place players on narrow
+    fields, are worked out the first time they are looked up.
+
+    """
+    def __init__(self, width, height):
+        super().__init__()
+        self.width = width
+        self.height = height
+        for x in range(width + 2):
+            for y in range(height + 2):
+                for has_ball in (False, True):
+                    self.__missing__((x, y, has_ball))
+
+    def __missing__(self, key):
+        (x, y, has_ball) = key
+        excluded = set()
+        if not has_ball:
+            excluded.add(Action.KICK)
+        if x < 1:
+            excluded.add(Action.move(-1, 0))
+        if x == self.width:
+            excluded.add(Action.move(1, 0))
+        if y <= 1:
+            excluded.add(Action.move(0, -1))
+        if y == self.height:
+            excluded.add(Action.move(0, 1))
+        actions = self[key] = tuple(a for a in ACTIONS if a not in excluded)
+        return actions
+
+
+class SoccerPitch:
+    """The dimensions of a soccer field, plus the goal geometry and lookup
+    tables derived from them. There is one SoccerPitch per field size
+    (see `SoccerPitch.get`), shared by every state played on it.
+
+    """
+    __slots__ = ('width', 'height', 'goal_height', 'goal_top', 'goal_bottom',
+                 'mid_x', 'mid_y', 'red_goal_pos', 'blue_goal_pos', 'actions',
+                 'margin', 'goal_distance', 'distance', 'goal_distance_rows', 'distance_rows',
+                 'shots')
+
+    # How far outside the field (goals and out of bounds included) the
+    # distance tables reach at least. Narrow fields need more (see
+    # `margin`).
+    MARGIN = 2
+
+    _pitches = {}
+    _by_mapping = {}
+
+    @classmethod
+    def get(cls, width, height, goal_height):
+        """Returns the SoccerPitch for a field, building it the first time
+        the field is used."""
+        key = (width, height, goal_height)
+        pitch = cls._pitches.get(key)
+        if pitch is None:
+            pitch = cls._pitches[key] = cls(width, height, goal_height)
+        return pitch
+
+    @classmethod
+    def of(cls, pitch):
+        """Returns the SoccerPitch for a map like SoccerState.pitch. Every
+        state of a game shares the same map (and its cached hash), so
+        this is a single dict lookup."""
+        info = cls._by_mapping.get(pitch)
+        if info is None:
+            info = cls._by_mapping[pitch] = cls.get(pitch.width, pitch.height, pitch.goal_height)
+        return info
+
+    def __init__(self, width, height, goal_height):
+        self.width = width
+        self.height = height
+        self.goal_height = goal_height
+        # Same expressions as SoccerState.goal_top/goal_bottom, so the
+        # comparisons against them behave identically.
+        self.goal_top = int(height + goal_height) / 2
+        self.goal_bottom = int(height - goal_height) / 2 + 1
+        self.mid_x = int(width / 2) + 1
+        self.mid_y = int(height / 2) + 1
+        self.red_goal_pos = (width + 1, int(height / 2) + 1)
+        self.blue_goal_pos = (0, int(height / 2) + 1)
+        self.actions = ActionTable(width, height)
+
+        # How far outside the field the tables reach: far enough for
+        # the cells _update_reset puts players on without random_pos,
+        # up to 5 + 3 columns and 4 rows from the middle of the field,
+        # which are off the field on narrow ones.
+        margin = self.margin = max(self.MARGIN, 8 - self.mid_x, self.mid_x + 7 - width,
+                                   4 - self.mid_y, self.mid_y + 3 - height)
+
+        # goal_distance[team, x + margin, y + margin] is the distance from
+        # (x, y) to `team`'s goal, worked out as SoccerState.dist_to_goal
+        # does, and distance[dx, dy] is the distance between two cells
+        # dx and dy apart. The *_rows are the same tables as nested
+        # lists, which are faster to read one value at a time.
+        xs = np.arange(-margin, width + 2 + margin, dtype=float)[:, None]
+        ys = np.arange(-margin, height + 2 + margin, dtype=float)[None, :]
+        self.goal_distance = np.zeros((max(Team) + 1, xs.size, ys.size))
+        for team in Team:
+            (goal_x, goal_y) = (width + 0.5, height / 2) if team == Team.RED else (0.5, height / 2)
+            self.goal_distance[team] = np.sqrt((xs + 0.51 - goal_x) ** 2 + (ys + 0.51 - goal_y) ** 2)
+        dxs = np.arange(xs.size)[:, None]
+        dys = np.arange(ys.size)[None, :]
+        self.distance = np.sqrt(dxs * dxs + dys * dys)
+        self.goal_distance_rows = self.goal_distance.tolist()
+        self.distance_rows = self.distance.tolist()
+
+        # The goal-angle geometry of a kick from every cell, for each
+        # team (see `shot`).
+        self.shots = {}
+        for team in Team:
+            for x in range(-margin, width + 2 + margin):
+                for y in range(-margin, height + 2 + margin):
+                    self.shot(x, y, team)
+
+    def goal_pos(self, team):
+        return self.red_goal_pos if team == Team.RED else self.blue_goal_pos
+
+    def shot(self, x, y, team):
+        """Returns the geometry of a kick by a player of `team` at (x,y)
+        towards the opponent's goal, as (x, y, dx, dy1, dy2, dist,
+        angle, is_goal): the kick's starting point (the corner of the
+        cell that SoccerState.check_kick starts from), its offsets to
+        the goal line and to the two goal posts, its distance and the
+        angle the goal spans from it, and whether it can score. Worked
+        out once per cell and team."""
+        shot = self.shots.get((x, y, team))
+        if shot is None:
+            (x0, y0) = (x, y)
+            (x, y) = (x + 0.5, y - 0.5)
+            goal_x = self.width + 2 if team == Team.RED else 0
+            goal_y1 = int(self.height - self.goal_height) / 2
+            goal_y2 = int(self.height + self.goal_height) / 2
+            dx = goal_x - x
+            dy1 = (goal_y1 - y)
+            dy2 = (goal_y2 - y)
+            norm1 = math.sqrt(dx**2 + dy1**2)
+            norm2 = math.sqrt(dx**2 + dy2**2)
+            dy = ((goal_y1+goal_y2)/2 - y)
+
+            dist = math.sqrt(dx**2 + dy**2)
+            angle = math.acos((dx**2 + dy1*dy2)/(norm1*norm2))
+            shot = self.shots[x0, y0, team] = (x, y, dx, dy1, dy2, dist, angle, _is_goal(dist, angle))
+        return shot
+
+
+def _is_goal(dist, angle):
+    return 20*abs(angle)**2/(dist**2) > 3e-1
+
+
+def _team_of(index):
+    """The team of player `index`, as assigned by `generator.init`."""
+    return Team.RED if index % 2 == 0 else Team.BLUE
+
+
+class PackedSoccerState:
+    """A soccer game state stored in a single flat, fixed-width tuple.
+
+    The whole position lives in `code`:
+
+        code = (current_player, ball_x, ball_y,
+                x_0, y_0, stance_0, has_ball_0,
+                ...
+                x_n, y_n, stance_n, has_ball_n,
+                ball_on_field, winner)
+
+    Player i is on Team.RED when i is even and on Team.BLUE otherwise,
+    exactly as `generator` assigns them, and the pitch dimensions are
+    kept in a shared SoccerPitch rather than in every state.
+
+    Alongside `code`, each state keeps `cells`, an occupancy index
+    mapping every occupied (x, y) to the objects there (player indices
+    in order, then num_players for the ball). `act` updates it as
+    objects move, so `at` is a dict lookup whatever the number of
+    players.
+
+    The rules are the same as SoccerState's, but `act` applies them
+    to a list copy of `code` instead of chaining pyrsistent
+    transforms. The public GameState methods (`actions`, `act`,
+    `is_terminal`, `reward`, ...) behave identically, and `players`,
+    `ball`, `teams` and `pitch` can be read the same way, so agents
+    and evaluation functions work with either backend.
+
+    """
+    __slots__ = ('pitch', 'code', 'cells', '_key', '_hash')
+    # See GameState.successors.
+    successors = None
+
+    def __init__(self, pitch, code, cells=None):
+        self.pitch = pitch
+        self.code = code
+        self.cells = cells if cells is not None else self._index(code)
+        self._key = None
+        self._hash = None
+
+    @staticmethod
+    def _index(code):
+        """Builds the occupancy index of `code` from scratch."""
+        cells = {}
+        n = len(code) - 2
+        for (obj, i) in enumerate(list(range(3, n, 4)) + [1]):
+            cells[code[i], code[i + 1]] = cells.get((code[i], code[i + 1]), ()) + (obj,)
+        return cells
+
+    @classmethod
+    def initial(cls, pitch, num_players, random_pos=True):
+        """Returns the starting state of a game on `pitch`, set up the same
+        way as `generator.init` sets up a SoccerState."""
+        s = [0, pitch.mid_x, pitch.mid_y] + [0, 0, 0, False] * num_players + [True, None]
+        state = cls(pitch, None, cls._index(s))
+        state._update_reset(s, random_pos=random_pos)
+        state.code = tuple(s)
+        return state
+
+    ################################################################
+    ## PUBLIC METHODS
+    ################################################################
+
+    @property
+    def num_players(self):
+        return (len(self.code) - 5) >> 2
+
+    @property
+    def current_player(self):
+        return self.code[0]
+
+    @property
+    def current_player_id(self):
+        return self.code[0]
+
+    @property
+    def winner(self):
+        return self.code[-1]
+
+    @property
+    def is_terminal(self):
+        return self.code[-1]
+
+    @property
+    def actions(self):
+        code = self.code
+        i = 3 + 4 * code[0]
+        return self.pitch.actions[code[i], code[i + 1], code[i + 3]]
+
+    acts = actions
+
+    def reward(self, player_id):
+        winner = self.code[-1]
+        if not winner:
+            return 0
+        return 10 if winner == _team_of(player_id) else -10
+
+    def rewardOM(self, player_id):
+        code = self.code
+        winner = code[-1]
+        if not winner:
+            if code[3 + 4 * player_id + 3]:
+                return 1
+            elif code[3 + 4 * ((player_id + 1) % 2) + 3]:
+                return -1
+            return 0
+        return 10 if winner == _team_of(player_id) else -10
+
+    @cached_successors
+    def act(self, action):
+        if not self._action_is_valid(action):
+            return None
+
+        # The updates are applied to `state`, whose occupancy index
+        # starts as a copy of ours, and to a list copy of our code.
+        state = PackedSoccerState(self.pitch, None, self.cells.copy())
+        s = list(self.code)
+        if action == Action.KICK:
+            state._update_kick(s)
+        elif action == Action.CHANGE_STANCE:
+            i = 3 + 4 * s[0] + 2
+            s[i] = (s[i] + 1) % 2
+        elif isinstance(action, tuple) and action[0] == Action.MOVE:
+            (_, dx, dy) = action
+            i = 3 + 4 * s[0]
+            if not state._update_move_to(s, s[i] + dx, s[i + 1] + dy):
+                return None
+        else:
+            return None
+
+        s[0] = (s[0] + 1) % self.num_players
+        state.code = tuple(s)
+        return state
+
+    def encode(self):
+        """Returns the flat tuple describing this state."""
+        return self.code
+
+    @property
+    def game_type(self):
+        pitch = self.pitch
+        return generator(pitch.width, pitch.height, pitch.goal_height, backend='packed')
+
+    ################################################################
+    ## INTERNAL
+    ################################################################
+
+    @property
+    def players(self):
+        code = self.code
+        return tuple(SoccerPlayer('player', i, _team_of(i), code[j], code[j + 1], code[j + 3], code[j + 2])
+                     for (i, j) in enumerate(range(3, len(code) - 2, 4)))
+
+    @property
+    def ball(self):
+        code = self.code
+        return SoccerBall('ball', code[-2], code[1], code[2])
+
+    @property
+    def teams(self):
+        n = self.num_players
+        return m(red=v(*range(0, n, 2)), blue=v(*range(1, n, 2)))
+
+    def get_valid_actions(self, player):
+        return self.pitch.actions[player.x, player.y, player.has_ball]
+
+    def at(self, x, y):
+        """Returns the object at position (x,y). If no object is there, return
+        None.
+
+        """
+        i = self._occupant(x, y)
+        if i < 0:
+            return None
+        elif i == self.num_players:
+            return self.ball
+        code = self.code
+        j = 3 + 4 * i
+        return SoccerPlayer('player', i, _team_of(i), code[j], code[j + 1], code[j + 3], code[j + 2])
+
+    @property
+    def pitch_info(self):
+        """See SoccerState.pitch_info."""
+        return self.pitch
+
+    # These only read `pitch`, `players`, `ball` and friends, so they
+    # are shared with SoccerState rather than duplicated.
+    objects = SoccerState.objects
+    current_player_obj = SoccerState.current_player_obj
+    dimensions = SoccerState.dimensions
+    player_with_ball = SoccerState.player_with_ball
+    dist_to_goal = SoccerState.dist_to_goal
+    goal_pos = SoccerState.goal_pos
+    red_goal_pos = SoccerState.red_goal_pos
+    blue_goal_pos = SoccerState.blue_goal_pos
+    goal_top = SoccerState.goal_top
+    goal_bottom = SoccerState.goal_bottom
+    ball_in_red_goal = SoccerState.ball_in_red_goal
+    ball_in_blue_goal = SoccerState.ball_in_blue_goal
+    player_in_red_penalty_area = SoccerState.player_in_red_penalty_area
+    player_in_blue_penalty_area = SoccerState.player_in_blue_penalty_area
+    is_goal = SoccerState.is_goal
+    can_shoot_from = SoccerState.can_shoot_from
+    check_kick = SoccerState.check_kick
+    draw = SoccerState.draw
+    _action_is_valid = GameState._action_is_valid
+
+    # The state updates below mirror the SoccerState methods of the
+    # same name. Each one works on `s`, a mutable list copy of `code`,
+    # and moves objects with _update_position so that `cells` stays in
+    # step with it.
+
+    def _occupant(self, x, y):
+        """Returns the index of the first player at (x,y), num_players for
+        the ball, or -1 if the position is empty. Players come before
+        the ball, like in SoccerState.at.
+
+        """
+        objs = self.cells.get((x, y))
+        return objs[0] if objs else -1
+
+    def _update_position(self, s, obj, x, y):
+        """State update: object `obj` (a player index, or num_players for
+        the ball) is moved to (x,y)."""
+        i = 1 if obj == (len(s) - 5) >> 2 else 3 + 4 * obj
+        old = (s[i], s[i + 1])
+        if old == (x, y):
+            return
+        cells = self.cells
+        objs = cells[old]
+        if len(objs) == 1:
+            del cells[old]
+        else:
+            cells[old] = tuple(o for o in objs if o != obj)
+        s[i] = x
+        s[i + 1] = y
+        objs = cells.get((x, y))
+        cells[x, y] = (obj,) if objs is None else tuple(sorted(objs + (obj,)))
+
+    def _update_move_to(self, s, x, y):
+        """State update: Current player moves to pos (x,y). Returns False
+        if the move is invalid."""
+        pitch = self.pitch
+        i = 3 + 4 * s[0]
+        team = _team_of(s[0])
+        ball = (len(s) - 5) >> 2
+        if s[i + 3]:
+            if y < 1 or y > pitch.height: ## sidelines
+                self._update_reset(s, prefer_side=team.inverse)
+            elif x < 1 or x > pitch.width:
+                if pitch.goal_bottom <= y and y <= pitch.goal_top:
+                    s[-1] = Team.BLUE if x < 1 else Team.RED
+                elif x < 1 and team == Team.RED \
+                     or x > pitch.width and team == Team.BLUE:
+                    self._update_corner_kick(s)
+                else:
+                    self._update_reset(s, prefer_side=team.inverse)
+            elif self._update_check_collide(s, x, y):
+                self._update_position(s, s[0], x, y)
+                self._update_position(s, ball, x, y)
+                self._update_check_goal(s)
+        else:
+            if x < 1 or x > pitch.width:
+                return False
+            elif y < 1 or y > pitch.height:
+                return False
+            elif self._update_check_collide(s, x, y):
+                self._update_position(s, s[0], x, y)
+        return True
+
+    def _update_corner_kick(self, s):
+        p2 = next((j for j in range(3, len(s) - 2, 4) if s[j + 3]), None)
+        if p2 is None:
+            return
+
+        team = _team_of((p2 - 3) >> 2).inverse
+        goal_pos_x = self.pitch.goal_pos(team)[0]
+        p1 = 3 + 4 * (0 if team == Team.RED else 1)
+        dx = -1 if goal_pos_x > 1 else 1
+
+        self._update_position(s, (p1 - 3) >> 2, goal_pos_x + dx, 1)
+        s[p1 + 3] = True
+        self._update_position(s, (p2 - 3) >> 2, goal_pos_x + 3*dx, 3)
+        s[p2 + 3] = False
+
+    def _check_kick(self, s, player):
+        """Same computation as SoccerState.check_kick, for player index
+        `player`. Returns (is_goal, index of intercepting player or
+        None)."""
+        i = 3 + 4 * player
+        (x, y, dx, dy1, dy2, _, _, is_goal) = self.pitch.shot(s[i], s[i + 1], _team_of(player))
+
+        # Check for interceptions
+        intercept = None
+        intercept_dist = float("inf")
+        for j in range(3, len(s) - 2, 4):
+            if j == i: continue
+            (obj_x, obj_y) = (s[j] + 0.5, s[j + 1] + 0.5)
+            obj_x = (obj_x - x) / dx
+            if obj_y >= y + dy1 * obj_x and obj_y <= y + dy2 * obj_x:
+                d = math.sqrt((x - obj_x)**2 + (y - obj_y)**2)
+                if d < intercept_dist:
+                    intercept = (j - 3) >> 2
+                    intercept_dist = d
+
+        return (is_goal, intercept)
+
+    def _update_kick(self, s):
+        """State update: Current player kicks towards opponent goal."""
+        player = s[0]
+        team = _team_of(player)
+
+        (is_goal, intercept_player) = self._check_kick(s, player)
+
+        if intercept_player is not None:
+            self._update_switch_possession(s, player, intercept_player)
+        elif is_goal:
+            self._update_position(s, (len(s) - 5) >> 2, *self.pitch.goal_pos(team))
+            s[-2] = True
+            s[3 + 4 * player + 3] = False
+            self._update_check_goal(s)
+        else:
+            self._update_reset(s, prefer_side=team.inverse)
+
+    def _update_switch_possession(self, s, player_a, player_b):
+        """State update: Possession of ball switches between player_a and
+        player_b
+
+        """
+        if s[3 + 4 * player_a + 3]:
+            (p1, p2) = (player_a, player_b)
+        else:
+            (p1, p2) = (player_b, player_a)
+        goal_pos = self.pitch.goal_pos(_team_of(p1).inverse)
+        j = 3 + 4 * p2
+        s[3 + 4 * p1 + 3] = False
+        s[j + 3] = True
+        self._update_position(s, (len(s) - 5) >> 2, s[j], s[j + 1])
+        self._update_place_between(s, p1, s[j], s[j + 1], goal_pos[0], goal_pos[1])
+
+    def _update_place_between(self, s, player_id, x1, y1, x2, y2):
+        """State update: player_id is placed in between position (x1, y1) and
+        (x2, y2)
+
+        """
+        x = int((x1+x2)/2)
+        y = int((y1+y2)/2)
+        pitch = self.pitch
+        occupant = self._occupant
+        if occupant(x, y) >= 0:
+            if occupant(x+1, y) < 0 and x+1 <= pitch.width:
+                x += 1
+            elif occupant(x-1, y) < 0 and x-1 >= 1:
+                x -= 1
+            elif occupant(x, y+1) < 0 and y+1 <= pitch.height:
+                y += 1
+            elif occupant(x, y-1) < 0 and y-1 >= 1:
+                y -= 1
+        self._update_position(s, player_id, x, y)
+
+    def _update_reset(self, s, prefer_side=None, random_pos=False):
+        """State update: Players and ball are reset to original position.
+        See SoccerState._update_reset.
+
+        """
+        pitch = self.pitch
+        (mid_x, mid_y) = (pitch.mid_x, pitch.mid_y)
+        num_players = (len(s) - 5) >> 2
+        if not prefer_side:
+            self._update_position(s, num_players, mid_x, mid_y)
+            s[-2] = True
+        else:
+            s[-2] = False
+        for team in (Team.RED, Team.BLUE):
+            members = range(0 if team == Team.RED else 1, num_players, 2)
+            i = 0
+            for dx in range(4):
+                done = False
+                for dy in range(5):
+                    j = 3 + 4 * members[i]
+                    if not random_pos:
+                        x = mid_x + (-dx-5 if team == Team.RED else dx+5)
+                        y = mid_y + (2 * int(dy / 2) * (-1 if dy % 2 else 1))
+                        self._update_position(s, members[i], x, y)
+                        s[j + 3] = False
+                        if i == 0 and prefer_side == team:
+                            s[j + 3] = True
+                            self._update_position(s, num_players, x, y)
+                        i += 1
+                    else:
+                        x_range = range(1,mid_x) if team == Team.RED \
+                                  else range(mid_x+1,pitch.width)
+                        y_range = range(1,pitch.height)
+                        x = random.choice(x_range)
+                        y = random.choice(y_range)
+                        self._update_position(s, members[i], x, y)
+                    if i >= len(members):
+                        done = True
+                        break
+                if done:
+                    break
+
+    def _update_check_collide(self, s, x, y):
+        """State update: Check if there will be a collision between the
+        current player and whatever is at position (x,y). Returns True
+        if the current player should move to (x,y).
+
+        """
+        obj = self._occupant(x, y)
+        if obj < 0:
+            return True
+        i = 3 + 4 * s[0]
+        if obj == (len(s) - 5) >> 2: ## If we collide with the ball...
+            ## Pick up the ball
+            self._update_position(s, obj, x, y)
+            s[-2] = False
+            s[i + 3] = True
+            return True
+        if s[i + 3] or s[3 + 4 * obj + 3]:
+            self._update_switch_possession(s, s[0], obj)
+        return False
+
+    def _update_check_goal(self, s):
+        """State update: Check if the ball is in a goal, and, if so, update
+        the winner of the game.
+
+        """
+        pitch = self.pitch
+        (x, y) = (s[1], s[2])
+        if x > pitch.width and pitch.goal_bottom <= y and y <= pitch.goal_top:
+            s[-1] = Team.RED
+        elif x < 1 and pitch.goal_bottom <= y and y <= pitch.goal_top:
+            s[-1] = Team.BLUE
+
+    @property
+    def key(self):
+        """See SoccerState.key."""
+        if self._key is None:
+            self._key = self.code[:-2]
+        return self._key
+
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        if not isinstance(other, (SoccerState, PackedSoccerState)):
+            return NotImplemented
+        return self.key == other.key
 
     def __hash__(self):
-        key = [self.current_player, (self.ball.x, self.ball.y)] \
-              + [(p.x, p.y, p.stance, p.has_ball) for p in self.players]
-        return hash(tuple(key))
+        if self._hash is None:
+            self._hash = hash(self.key)
+        return self._hash
+
+    def __repr__(self):
+        return 'PackedSoccerState(code={})'.format(self.code)
+
+
+################################################################
+## BATCH BACKEND
+################################################################
+
+class SoccerBatch:
+    """`num_games` two-player soccer games held as NumPy arrays, which
+    `step` advances together, one move in every game per call.
+
+    Game k is described by
+
+        current[k]                  the player to move (0 or 1),
+        ball_x[k], ball_y[k]        the ball's position,
+        ball_on_field[k]            the ball's on_field flag,
+        x[p, k], y[p, k]            player p's position,
+        stance[p, k], has_ball[p, k],
+        winner[k]                   0, or the Team that won,
+        plies[k]                    the valid moves played so far,
+
+    which hold the same values as PackedSoccerState.code (see `codes`).
+    Player 0 is on Team.RED and player 1 on Team.BLUE.
+
+    Actions are given as their index in ACTIONS. `step` applies them
+    with the rules of PackedSoccerState._update_move_to,
+    _update_kick and _update_reset (and of the SoccerState methods
+    they mirror), so a game steps to the same position as its
+    PackedSoccerState would. An action PackedSoccerState.act would
+    return None for (one not in `state.actions`, or a move off the
+    field without the ball) leaves the game as it is, with the same
+    player to move, and is flagged in `invalid`.
+
+    A game that is won, or that reaches `max_plies` moves, is started
+    over straight away, from random positions drawn as
+    `generator.init` draws them, with the `rng` of the batch. The
+    games of the batch never end on a repeated position, as those of
+    Game do.
+
+    :param int num_games: The number of games.
+    :param int seed: Seeds `rng`.
+    :param int max_plies: If given, games are started over after this
+        many valid moves without a winner.
+    """
+    # The (small) integers of the batch. Most of `step` works on every
+    # game at once, with arithmetic on masks rather than np.where,
+    # whose cost on masks without a pattern dwarfs everything else.
+    DTYPE = np.int16
+
+    def __init__(self, num_games, field_width=10, field_height=6, goal_height=2, seed=None,
+                 max_plies=None):
+        pitch = self.pitch = SoccerPitch.get(field_width, field_height, goal_height)
+        self.num_games = num_games
+        self.max_plies = max_plies
+        self.rng = np.random.default_rng(seed)
+        self.current = np.zeros(num_games, self.DTYPE)
+        self.ball_x = np.zeros(num_games, self.DTYPE)
+        self.ball_y = np.zeros(num_games, self.DTYPE)
+        self.ball_on_field = np.ones(num_games, bool)
+        self.x = np.zeros((2, num_games), self.DTYPE)
+        self.y = np.zeros((2, num_games), self.DTYPE)
+        self.stance = np.zeros((2, num_games), self.DTYPE)
+        self.has_ball = np.zeros((2, num_games), bool)
+        self.winner = np.zeros(num_games, self.DTYPE)
+        self.plies = np.zeros(num_games, np.int64)
+        self.invalid = np.zeros(num_games, bool)
+
+        # The kick geometry of SoccerPitch.shot for player p at (x, y),
+        # at [p, x + margin, y + margin], over the cells the pitch's
+        # tables cover, restart positions off narrow fields included.
+        m = pitch.margin
+        shots = np.array([[[pitch.shot(x, y, team) for y in range(-m, field_height + 2 + m)]
+                           for x in range(-m, field_width + 2 + m)]
+                          for team in (Team.RED, Team.BLUE)])
+        (self._shot_x, self._shot_y, self._shot_dx, self._shot_dy1, self._shot_dy2) = \
+            (shots[..., i] for i in range(5))
+        self._shot_goal = shots[..., 7] != 0
+        # goal_pos of the team of each player.
+        self._goal = np.array([pitch.red_goal_pos, pitch.blue_goal_pos])
+        # _samples[240 * c + r] is the (r % n)-th of the n actions whose bits
+        # are set in the action code c (see `_action_codes`); 240 is a
+        # multiple of every n, so a uniform r picks each of them alike.
+        self._samples = np.array([[[a for a in range(len(ACTIONS)) if c >> a & 1][r % n] if n else 0
+                                   for r in range(240)]
+                                  for (c, n) in ((c, bin(c).count('1')) for c in range(32))], np.int8).ravel()
+        self.reset()
+
+    def reset(self, games=None):
+        """Starts the games selected by `games` (an index or mask; every
+        game by default) over, from random positions."""
+        games = np.atleast_1d(np.arange(self.num_games)[slice(None) if games is None else games])
+        n = len(games)
+        pitch = self.pitch
+        (mid_x, mid_y) = (pitch.mid_x, pitch.mid_y)
+        self.current[games] = 0
+        self.ball_x[games] = mid_x
+        self.ball_y[games] = mid_y
+        self.ball_on_field[games] = True
+        # The ranges _update_reset draws from with random_pos.
+        self.x[0, games] = self.rng.integers(1, mid_x, n)
+        self.x[1, games] = self.rng.integers(mid_x + 1, pitch.width, n)
+        self.y[:, games] = self.rng.integers(1, pitch.height, (2, n))
+        self.stance[:, games] = 0
+        self.has_ball[:, games] = False
+        self.winner[games] = 0
+        self.plies[games] = 0
+
+    def _mover(self):
+        """The position and possession of the player to move, and of the
+        other one, in every game, with a 1 where player 0 moves."""
+        (x0, x1) = self.x
+        (y0, y1) = self.y
+        (h0, h1) = self.has_ball
+        f = 1 - self.current
+        first = f.astype(bool)
+        px = x1 + f * (x0 - x1)
+        py = y1 + f * (y0 - y1)
+        return (f, first, px, py, x0 + x1 - px, y0 + y1 - py,
+                first & h0 | ~first & h1, first & h1 | ~first & h0)
+
+    def _action_codes(self, px, py, p_ball):
+        """The actions in `state.actions` of each game (see ActionTable),
+        with a bit set for each of them, by its index in ACTIONS."""
+        pitch = self.pitch
+        return (p_ball.view(np.int8) + (px != pitch.width) * np.int8(2) + (px >= 1) * np.int8(4)
+                + (py != pitch.height) * np.int8(8) + (py > 1) * np.int8(16))
+
+    def valid_actions(self):
+        """A (num_games, len(ACTIONS)) mask of the actions in
+        `state.actions` of each game."""
+        (_, _, px, py, _, _, p_ball, _) = self._mover()
+        codes = self._action_codes(px, py, p_ball)
+        return (codes[:, None] >> np.arange(len(ACTIONS), dtype=np.int8) & 1).astype(bool)
+
+    def sample_actions(self):
+        """A uniformly random action of `valid_actions` for each game."""
+        (_, _, px, py, _, _, p_ball, _) = self._mover()
+        # Random bytes below 240, drawn again where they are not.
+        r = np.frombuffer(self.rng.bytes(self.num_games), np.uint8).copy()
+        redraw = np.flatnonzero(r >= 240)
+        while len(redraw):
+            r[redraw] = np.frombuffer(self.rng.bytes(len(redraw)), np.uint8)
+            redraw = redraw[r[redraw] >= 240]
+        return self._samples.take(self._action_codes(px, py, p_ball).astype(np.intp) * 240 + r)
+
+    def codes(self):
+        """The position of every game as a PackedSoccerState.code."""
+        columns = [self.current, self.ball_x, self.ball_y]
+        for p in (0, 1):
+            columns += [self.x[p], self.y[p], self.stance[p], self.has_ball[p]]
+        rows = np.stack(columns, axis=1).tolist()
+        return [tuple(row[:6] + [bool(row[6])] + row[7:10] + [bool(row[10]), bool(on_field),
+                                                              Team(winner) if winner else None])
+                for (row, on_field, winner) in zip(rows, self.ball_on_field.tolist(), self.winner.tolist())]
+
+    def set_codes(self, codes):
+        """Sets the games to the positions of `codes`, one
+        PackedSoccerState.code of a two-player game per game."""
+        codes = np.array([code[:-1] + (int(code[-1] or 0),) for code in codes], self.DTYPE)
+        (self.current[:], self.ball_x[:], self.ball_y[:]) = (codes[:, 0], codes[:, 1], codes[:, 2])
+        for p in (0, 1):
+            j = 3 + 4 * p
+            (self.x[p], self.y[p], self.stance[p]) = (codes[:, j], codes[:, j + 1], codes[:, j + 2])
+            self.has_ball[p] = codes[:, j + 3] != 0
+        self.ball_on_field[:] = codes[:, 11] != 0
+        self.winner[:] = codes[:, 12]
+        self.plies[:] = 0
+
+    def step(self, actions, reset=True):
+        """Plays `actions[k]` (an index in ACTIONS) in game k, for every
+        game, and returns (winner, done): the Team (as an int) that won
+        each game with this move or 0, and whether the game ended,
+        by a goal or after `max_plies` moves. Ended games are started
+        over unless `reset` is False."""
+        a = np.asarray(actions)
+        pitch = self.pitch
+        (f, first, px, py, ox, oy, p_ball, o_ball) = self._mover()
+        (bx, by) = (self.ball_x, self.ball_y)
+        dx = (a == 1).view(np.int8) - (a == 2).view(np.int8)
+        dy = (a == 3).view(np.int8) - (a == 4).view(np.int8)
+        nx = px + dx
+        ny = py + dy
+
+        kick = a == 0
+        # The rules of ActionTable, for the chosen action only.
+        chosen = kick & p_ball | (dx == 1) & (px != pitch.width) | (dx == -1) & (px >= 1) \
+            | (dy == 1) & (py != pitch.height) | (dy == -1) & (py > 1)
+        in_field = (nx >= 1) & (nx <= pitch.width) & (ny >= 1) & (ny <= pitch.height)
+        # Without the ball, a move off the field is invalid.
+        valid = chosen & (self.winner == 0) & (kick | p_ball | in_field)
+
+        # Most moves are to an empty cell of the field, which the mover
+        # walks to, with the ball if it has it; the rest are resolved
+        # one by one below.
+        special = valid & (kick | ~in_field | (nx == ox) & (ny == oy) | (nx == bx) & (ny == by))
+        walks = valid & ~special
+        npx = px + walks * dx
+        npy = py + walks * dy
+        carried = walks & p_ball
+        nbx = bx + carried * (nx - bx)
+        nby = by + carried * (ny - by)
+        (nox, noy, np_ball, no_ball) = (ox, oy, p_ball, o_ball)
+        on_field = self.ball_on_field
+        winner = np.zeros(self.num_games, self.DTYPE)
+
+        games = np.flatnonzero(special)
+        if len(games):
+            (npx, npy, nox, noy, nbx, nby) = (v.copy() for v in (npx, npy, nox, noy, nbx, nby))
+            (np_ball, no_ball, on_field) = (v.copy() for v in (np_ball, no_ball, on_field))
+            (npx[games], npy[games], nox[games], noy[games], np_ball[games], no_ball[games],
+             nbx[games], nby[games], on_field[games], winner[games]) = self._resolve(
+                 first[games], px[games], py[games], ox[games], oy[games], p_ball[games],
+                 o_ball[games], bx[games], by[games], on_field[games], kick[games],
+                 nx[games], ny[games], in_field[games])
+
+        x0 = nox + f * (npx - nox)
+        y0 = noy + f * (npy - noy)
+        self.x = np.stack([x0, npx + nox - x0])
+        self.y = np.stack([y0, npy + noy - y0])
+        self.has_ball = np.stack([first & np_ball | ~first & no_ball, first & no_ball | ~first & np_ball])
+        (self.ball_x, self.ball_y, self.ball_on_field) = (nbx, nby, on_field)
+        self.winner = winner
+        self.current = self.current ^ valid
+        self.plies += valid
+        self.invalid = ~valid
+
+        done = winner != 0
+        if self.max_plies is not None:
+            done |= self.plies >= self.max_plies
+        if reset and done.any():
+            self.reset(done)
+        return (winner, done)
+
+    def _resolve(self, first, px, py, ox, oy, p_ball, o_ball, bx, by, on_field, kick, nx, ny, in_field):
+        """The valid moves of `step` other than a walk to an empty cell,
+        for the games whose fields are given: kicks, runs off the
+        field, and moves into the other player or onto the ball.
+        Returns the new (px, py, ox, oy, p_ball, o_ball, bx, by,
+        on_field, winner) of those games."""
+        pitch = self.pitch
+        (width, height) = (pitch.width, pitch.height)
+        p = (~first).view(np.int8)
+        move = ~kick
+        (npx, npy, nox, noy) = (px.copy(), py.copy(), ox.copy(), oy.copy())
+        (np_ball, no_ball) = (p_ball.copy(), o_ball.copy())
+        (nbx, nby) = (bx.copy(), by.copy())
+        on_field = on_field.copy()
+        winner = np.zeros(len(px), self.DTYPE)
+
+        # _update_reset with the other team preferred, after running
+        # the ball over a sideline or the wrong end's goal line, or a
+        # kick that neither scores nor is intercepted: the players go
+        # back to their starting cells and the other player gets the
+        # ball.
+        carrying = move & p_ball
+        sideline = carrying & ((ny < 1) | (ny > height))
+        out = carrying & ~sideline & ~in_field
+        goal_line = out & (pitch.goal_bottom <= ny) & (ny <= pitch.goal_top)
+        corner = out & ~goal_line & ((nx < 1) & first | (nx > width) & ~first)
+        # _check_kick. The games that do not kick look up a cell of the
+        # field instead of their own, and ignore what they find there.
+        m = pitch.margin
+        shot = (p, np.where(kick, px, 1) + m, np.where(kick, py, 1) + m)
+        (sx, sy, sdx) = (self._shot_x[shot], self._shot_y[shot], self._shot_dx[shot])
+        obj_x = (ox + 0.5 - sx) / sdx
+        obj_y = oy + 0.5
+        intercepted = kick & (obj_y >= sy + self._shot_dy1[shot] * obj_x) \
+            & (obj_y <= sy + self._shot_dy2[shot] * obj_x)
+        scored = kick & ~intercepted & self._shot_goal[shot]
+        restart = sideline | out & ~goal_line & ~corner | kick & ~intercepted & ~scored
+        (mid_x, mid_y) = (pitch.mid_x, pitch.mid_y)
+        npx = np.where(restart, np.where(first, mid_x - 5, mid_x + 5), npx)
+        nox = np.where(restart, np.where(first, mid_x + 5, mid_x - 5), nox)
+        npy = np.where(restart, mid_y, npy)
+        noy = np.where(restart, mid_y, noy)
+        np_ball &= ~restart
+        no_ball |= restart
+        nbx = np.where(restart, nox, nbx)
+        nby = np.where(restart, noy, nby)
+        on_field &= ~restart
+
+        # Into a goal with the ball: the goal counts for the team whose
+        # side it is on, and nothing moves.
+        winner = np.where(goal_line, np.where(nx < 1, int(Team.BLUE), int(Team.RED)), winner)
+
+        # _update_corner_kick, after running the ball over the goal
+        # line of the mover's own end: the other player gets it in the
+        # corner there, and the ball itself stays where it was.
+        corner_x = np.where(first, 1, width)
+        corner_dx = np.where(first, 1, -1)
+        nox = np.where(corner, corner_x, nox)
+        noy = np.where(corner, 1, noy)
+        no_ball |= corner
+        npx = np.where(corner, corner_x + 2 * corner_dx, npx)
+        npy = np.where(corner, 3, npy)
+        np_ball &= ~corner
+
+        # _update_check_collide, for moves on the field: into the other
+        # player, onto the ball, or into an empty cell.
+        onto = move & in_field
+        at_other = onto & (ox == nx) & (oy == ny)
+        at_ball = onto & ~at_other & (bx == nx) & (by == ny)
+        walks = onto & ~at_other
+        npx = np.where(walks, nx, npx)
+        npy = np.where(walks, ny, npy)
+        carried = walks & p_ball
+        nbx = np.where(carried, nx, nbx)
+        nby = np.where(carried, ny, nby)
+        np_ball |= at_ball
+        on_field &= ~at_ball
+
+        # _update_switch_possession, after running into the other
+        # player or an intercepted kick: whoever has the ball loses it
+        # to the other, and is placed between them and its own goal,
+        # goal_pos of the inverse of its team.
+        lose = at_other & p_ball | intercepted
+        take = at_other & ~p_ball & o_ball
+        np_ball = np.where(lose, False, np.where(take, True, np_ball))
+        no_ball = np.where(lose, True, np.where(take, False, no_ball))
+        nbx = np.where(lose, ox, np.where(take, px, nbx))
+        nby = np.where(lose, oy, np.where(take, py, nby))
+        loser_first = np.where(lose, first, ~first)
+        (gx, gy) = (np.where(loser_first, self._goal[1][0], self._goal[0][0]),
+                    np.where(loser_first, self._goal[1][1], self._goal[0][1]))
+        (wx, wy) = (np.where(lose, ox, px), np.where(lose, oy, py))
+        (lx, ly) = (np.where(lose, px, ox), np.where(lose, py, oy))
+        (cx, cy) = self._place_between(lx, ly, wx, wy, gx, gy)
+        npx = np.where(lose, cx, npx)
+        npy = np.where(lose, cy, npy)
+        nox = np.where(take, cx, nox)
+        noy = np.where(take, cy, noy)
+
+        # A kick that scores: the ball goes into the goal, and
+        # _update_check_goal names the winner.
+        goal = self._goal[p]
+        nbx = np.where(scored, goal[:, 0], nbx)
+        nby = np.where(scored, goal[:, 1], nby)
+        on_field |= scored
+        np_ball &= ~scored
+        in_band = (pitch.goal_bottom <= nby) & (nby <= pitch.goal_top)
+        winner = np.where(scored & in_band & (nbx > width), int(Team.RED),
+                          np.where(scored & in_band & (nbx < 1), int(Team.BLUE), winner))
+        return (npx, npy, nox, noy, np_ball, no_ball, nbx, nby, on_field, winner)
+
+    def _place_between(self, lx, ly, wx, wy, gx, gy):
+        """_update_place_between for the player at (lx, ly), placed between
+        (wx, wy), where the other player and the ball are, and (gx,
+        gy): the cell halfway, or the first free neighbour of it on
+        the field if it is taken."""
+        pitch = self.pitch
+        x = ((wx + gx) / 2).astype(np.int64)
+        y = ((wy + gy) / 2).astype(np.int64)
+
+        def free(x, y):
+            return ~(((x == lx) & (y == ly)) | ((x == wx) & (y == wy)))
+        taken = ~free(x, y)
+        right = taken & free(x + 1, y) & (x + 1 <= pitch.width)
+        left = taken & ~right & free(x - 1, y) & (x - 1 >= 1)
+        up = taken & ~right & ~left & free(x, y + 1) & (y + 1 <= pitch.height)
+        down = taken & ~right & ~left & ~up & free(x, y - 1) & (y - 1 >= 1)
+        return (x + right - left, y + up - down)
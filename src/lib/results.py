@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# Per-game outcomes and per-move prediction hits of experiments made of
+# several runs (e.g. seeds) of the same number of games, stored as
+# NumPy arrays, with vectorized queries over them.
+
+import csv
+import os
+import numpy as np
+
+
+class Results:
+    """The outcomes of `runs` runs of `games` games each, and the
+    prediction checks made during them.
+
+    * `winner[r, g]` is the winner of game g of run r, as RunLogger
+      records it: `int(state.winner)` (for soccer, 1 for the red team,
+      i.e. player 0, and 2 for the blue team), or -1 if nobody won.
+    * `hit[i]` is 1 if the i-th prediction check was right and 0
+      otherwise, and `hit_run[i]` and `hit_game[i]` are the run and
+      game it was made in. Checks are in the order they were made,
+      run by run.
+
+    `save` writes the arrays to a directory as .npy files, and `load`
+    memory-maps them back, so queries only read what they use.
+    """
+    FIELDS = ('winner', 'hit', 'hit_run', 'hit_game')
+
+    def __init__(self, winner, hit=None, hit_run=None, hit_game=None):
+        self.winner = np.asarray(winner, dtype=np.int8)
+        if self.winner.ndim != 2:
+            raise ValueError("winner must be a (runs, games) array.")
+        self.hit = np.zeros(0, np.int8) if hit is None else np.asarray(hit, dtype=np.int8)
+        self.hit_run = np.zeros(0, np.int16) if hit_run is None else np.asarray(hit_run, dtype=np.int16)
+        self.hit_game = np.zeros(0, np.int32) if hit_game is None else np.asarray(hit_game, dtype=np.int32)
+        self._checks = None
+
+    @property
+    def runs(self):
+        return self.winner.shape[0]
+
+    @property
+    def games(self):
+        return self.winner.shape[1]
+
+    @classmethod
+    def stack(cls, results):
+        """Combines Results of the same number of games into one, with the
+        runs of each in order."""
+        results = list(results)
+        if len({r.games for r in results}) > 1:
+            raise ValueError("Every run must have the same number of games.")
+        offsets = np.cumsum([0] + [r.runs for r in results[:-1]])
+        return cls(np.concatenate([r.winner for r in results]),
+                   np.concatenate([r.hit for r in results]),
+                   np.concatenate([r.hit_run + o for (r, o) in zip(results, offsets)]),
+                   np.concatenate([r.hit_game for r in results]))
+
+    @classmethod
+    def from_log(cls, directory, runs=1):
+        """Reads the records a RunLogger wrote to `directory`, whose games
+        are split evenly into `runs` runs (e.g. the replicas of a
+        Tournament)."""
+        game = np.load(os.path.join(directory, 'game.npy'), mmap_mode='r')
+        winner = np.load(os.path.join(directory, 'winner.npy'), mmap_mode='r')
+        hit = np.load(os.path.join(directory, 'hit.npy'), mmap_mode='r')
+        num_games = int(game[-1]) + 1 if len(game) else 0
+        if num_games % runs:
+            raise ValueError("{} games cannot be split into {} runs.".format(num_games, runs))
+        winners = np.full(num_games, -1, np.int8)
+        winners[game] = winner
+        checked = hit >= 0
+        hit_game = np.asarray(game[checked])
+        games = num_games // runs
+        return cls(winners.reshape(runs, games), hit[checked],
+                   hit_game // games, hit_game % games)
+
+    @classmethod
+    def from_legacy_csv(cls, winner_paths, check_paths=None):
+        """Reads the CSV files the old Game wrote, one run per file: the
+        'game'/'winner' rows of `winner_paths` (savingprobsg_*.csv) and
+        the 'game'/'check' rows of `check_paths` (check_*.csv). Winners
+        are converted to RunLogger's numbering: '1' (red) is 1, '0'
+        (blue) is 2 and '-1' stays -1."""
+        legacy = {'1': 1, '0': 2, '-1': -1}
+        winners = []
+        for path in winner_paths:
+            with open(path, newline='') as f:
+                winners += [[legacy[value] for (kind, value) in csv.reader(f) if kind == 'winner']]
+        if len({len(w) for w in winners}) > 1:
+            raise ValueError("Every run must have the same number of games.")
+        (hit, hit_run, hit_game) = ([], [], [])
+        for (run, path) in enumerate(check_paths or []):
+            game = -1
+            with open(path, newline='') as f:
+                for (kind, value) in csv.reader(f):
+                    if kind == 'game':
+                        game += 1
+                    elif kind == 'check':
+                        hit += [value == 'True']
+                        hit_game += [game]
+            hit_run += [run] * (len(hit) - len(hit_run))
+        return cls(winners, hit, hit_run, hit_game)
+
+    def save(self, directory):
+        """Writes every array to `directory` as a .npy file."""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.FIELDS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Reads Results written by `save`, memory-mapped by default."""
+        return cls(*[np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+                     for name in cls.FIELDS])
+
+    def wins(self, winner):
+        """(runs, games) array, 1 where `winner` won the game."""
+        return (self.winner == winner).astype(np.int32)
+
+    def cumulative_wins(self, winner):
+        """(runs, games) array of the number of games `winner` won up to
+        and including each game."""
+        return np.cumsum(self.winner == winner, axis=1, dtype=np.int32)
+
+    def _windows(self, counts, window, step):
+        """Sums of `counts` over `window` games starting every `step`
+        games, as a (runs, windows) array."""
+        total = np.zeros((counts.shape[0], counts.shape[1] + 1), np.int64)
+        np.cumsum(counts, axis=1, out=total[:, 1:])
+        starts = np.arange(0, counts.shape[1] - window + 1, step)
+        return total[:, starts + window] - total[:, starts]
+
+    def win_rate(self, winner, window, step=1):
+        """(runs, windows) array of the fraction of games `winner` won in
+        windows of `window` games starting every `step` games (e.g.
+        `win_rate(1, 1000, 1000)` for each thousand games)."""
+        return self._windows(self.winner == winner, window, step) / window
+
+    def predictions(self):
+        """(runs, games) arrays of the number of prediction checks in each
+        game and of how many of them were right."""
+        if self._checks is None:
+            cell = self.hit_run.astype(np.int64) * self.games + self.hit_game
+            size = self.runs * self.games
+            checked = np.bincount(cell, minlength=size).reshape(self.runs, self.games)
+            right = np.bincount(cell, weights=self.hit, minlength=size).reshape(self.runs, self.games)
+            self._checks = (checked, right.astype(np.int64))
+        return self._checks
+
+    def accuracy(self, window=None, step=None):
+        """The fraction of right predictions of each run, as a (runs,)
+        array, or in windows of `window` games starting every `step`
+        games (default: `window`), as a (runs, windows) array. NaN where
+        no prediction was checked."""
+        (checked, right) = self.predictions()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if window is None:
+                return right.sum(axis=1) / checked.sum(axis=1)
+            step = step or window
+            return self._windows(right, window, step) / self._windows(checked, window, step)
+
+    def cumulative_hits(self, run):
+        """The number of right predictions up to and including each check
+        of `run`."""
+        return np.cumsum(self.hit[self.hit_run == run], dtype=np.int64)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import random
+import sys
+import time
+
+from ...lib.game import connect_four
+from ..proj2 import agent, evaluation
+
+
+# (width, height, connect_length) of the boards the checks are run on.
+# The first one is the default game.
+BOARDS = [
+    (7, 6, 4),
+    (4, 4, 3),
+    (5, 4, 4),
+    (6, 5, 5),
+    (5, 4, 3),
+    (2, 3, 3),
+]
+
+
+def _perft(state, depth, counts, ply=0):
+    """Adds the positions reached after each ply up to `depth` to
+    counts[ply] = [positions, wins of player 0, wins of player 1, draws]."""
+    for action in state.actions:
+        child = state.act(action)
+        c = counts[ply]
+        c[0] += 1
+        if child.is_terminal:
+            c[1 + child.winner if child.winner >= 0 else 3] += 1
+        elif ply + 1 < depth:
+            _perft(child, depth, counts, ply + 1)
+
+
+def _snapshot(state):
+    """Everything observable about a state through the public methods."""
+    return (
+        state.current_player,
+        state.winner,
+        list(state.actions),
+        [state.reward(p) for p in range(state.num_players)],
+        [state.at(x, y) for x in range(-1, state.width + 1) for y in range(-1, state.height + 1)],
+    )
+
+
+def perft(args):
+    """Counts the positions, wins and draws after each ply up to --depth
+    with both Connect 4 backends, and checks that the counts match.
+    Random games are also played with both backends from the same
+    seeds to check that they go through identical states."""
+    for (width, height, connect_length) in BOARDS:
+        counts = {}
+        for backend in ('record', 'bitboard'):
+            gm = connect_four.generator(width, height, connect_length, backend=backend)
+            counts[backend] = [[0, 0, 0, 0] for _ in range(args.depth)]
+            start = time.perf_counter()
+            _perft(gm.init([None, None]), args.depth, counts[backend])
+            print("{}x{} connect {}, {:>8}: {:>9} positions in {:6.2f}s"
+                  .format(width, height, connect_length, backend,
+                          sum(c[0] for c in counts[backend]), time.perf_counter() - start))
+        for (ply, (c_r, c_b)) in enumerate(zip(counts['record'], counts['bitboard'])):
+            if c_r != c_b:
+                sys.exit("Mismatch at ply {} on {}x{} board, connect {}: record {}, bitboard {}"
+                         .format(ply + 1, width, height, connect_length, c_r, c_b))
+        print("{:>5} {:>10} {:>8} {:>8} {:>8}".format('ply', 'positions', 'wins 0', 'wins 1', 'draws'))
+        for (ply, c) in enumerate(counts['record']):
+            print("{:>5} {:>10} {:>8} {:>8} {:>8}".format(ply + 1, *c))
+
+        record = connect_four.generator(width, height, connect_length)
+        bitboard = connect_four.generator(width, height, connect_length, backend='bitboard')
+        for seed in range(args.seed, args.seed + args.games):
+            rng = random.Random(seed)
+            (state_r, state_b) = (record.init([None, None]), bitboard.init([None, None]))
+            while True:
+                if _snapshot(state_r) != _snapshot(state_b):
+                    sys.exit("Mismatch in game {} on {}x{} board, connect {}:\n  {}\n  {}"
+                             .format(seed, width, height, connect_length, state_r, state_b))
+                if state_r.is_terminal:
+                    break
+                action = rng.choice(state_r.actions)
+                (state_r, state_b) = (state_r.act(action), state_b.act(action))
+    print("Both backends agree.")
+
+
+def minimax(args):
+    """Times a MinimaxAgent decision with alpha-beta pruning from the
+    empty 7x6 board at increasing depths, up to --depth, with each
+    Connect 4 backend."""
+    print("{:>8} {:>6} {:>10}".format('backend', 'depth', 'seconds'))
+    for backend in ('record', 'bitboard'):
+        state = connect_four.generator(backend=backend).init([None, None])
+        for depth in range(2, args.depth + 1):
+            mm = agent.MinimaxAgent(evaluation.connect_four, True, depth)
+            start = time.perf_counter()
+            mm.decide(state, None, None)
+            elapsed = time.perf_counter() - start
+            print("{:>8} {:>6} {:>10.3f}".format(backend, depth, elapsed))
+            if elapsed > args.time_limit:
+                break
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+################################################################
+## Benchmarks and consistency checks for the game engines and
+## agents. Run from the root directory with
+##
+##     python3 evaluate.py bench <benchmark> [options]
+##
+## Checks exit with a non-zero status if they find a mismatch.
+################################################################
+
+import os
+import sys
+from . import connect4, results, soccer
+
+benchmarks = {
+    'connect4_minimax': connect4.minimax,
+    'connect4_perft': connect4.perft,
+    'results_queries': results.queries,
+    'soccer_backends': soccer.backends,
+    'soccer_batch_env': soccer.batch_env,
+    'soccer_batch_evaluation': soccer.batch_evaluation,
+    'soccer_bounded_tables': soccer.bounded_tables,
+    'soccer_checkpoints': soccer.checkpoints,
+    'soccer_deepening': soccer.deepening,
+    'soccer_equivalence': soccer.equivalence,
+    'soccer_evaluation': soccer.evaluation_tables,
+    'soccer_expectimax': soccer.expectimax,
+    'soccer_headless': soccer.headless,
+    'soccer_history': soccer.history,
+    'soccer_keys': soccer.keys,
+    'soccer_mcts': soccer.mcts,
+    'soccer_occupancy': soccer.occupancy,
+    'soccer_opponent_acts': soccer.opponent_acts,
+    'soccer_opponent_tables': soccer.opponent_tables,
+    'soccer_ordering': soccer.ordering,
+    'soccer_parallel': soccer.parallel,
+    'soccer_shots': soccer.shots,
+    'soccer_successors': soccer.successors,
+    'soccer_tournament': soccer.tournament,
+    'soccer_transpositions': soccer.transpositions,
+}
+
+def main(cl_args):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks and consistency checks for the game engines and agents.')
+    parser.add_argument('benchmark', type=str, \
+                        help='Benchmark to run. Options: {}'.format(', '.join(benchmarks)))
+    parser.add_argument('--games', type=int, default=200, help='Number of games to play. (default: 200)')
+    parser.add_argument('--plies', type=int, default=300, help='Maximum number of plies per game. (default: 300)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first game. (default: 0)')
+    parser.add_argument('--depth', type=int, default=6, help='Search depth. (default: 6)')
+    parser.add_argument('--time_limit', type=float, default=30,
+                        help='Seconds after which a benchmark stops going deeper. (default: 30)')
+    parser.add_argument('--move_time', type=float, default=0.1,
+                        help='Seconds per move for agents with a time budget. (default: 0.1)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Largest number of worker processes to try. (default: number of CPUs)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**5, 10**6],
+                        help='Table sizes, in entries, for the lookup benchmarks. (default: 100000 1000000)')
+
+    args = parser.parse_args(cl_args)
+
+    if not args.benchmark in benchmarks:
+        sys.exit("Invalid benchmark! Please choose from among: {}".format(', '.join(benchmarks)))
+
+    benchmarks[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main([])
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from ...lib.results import Results
+
+
+def _experiment(rng, runs, games, checks_per_game):
+    """Random Results of `runs` runs of `games` games, with about
+    `checks_per_game` prediction checks per game."""
+    winner = rng.choice(np.array([-1, 1, 2], np.int8), size=(runs, games), p=[0.9, 0.06, 0.04])
+    counts = rng.poisson(checks_per_game, size=(runs, games))
+    hit_run = np.repeat(np.repeat(np.arange(runs), games), counts.ravel())
+    hit_game = np.repeat(np.tile(np.arange(games), runs), counts.ravel())
+    hit = rng.random(len(hit_run)) < 0.3
+    return Results(winner, hit, hit_run, hit_game)
+
+
+def _loop_cumulative_wins(winners, winner):
+    """Cumulative wins the way the analysis notebooks count them."""
+    cumsum = 0
+    all_sum = []
+    for w in winners:
+        if w == winner:
+            cumsum += 1
+        all_sum.append(cumsum)
+    return all_sum
+
+
+def queries(args):
+    """Times the Results queries on a memory-mapped experiment of 5 runs
+    of 5000 games with about 25 prediction checks per game, and checks
+    the cumulative wins and accuracies against plain Python loops."""
+    results = _experiment(np.random.default_rng(args.seed), 5, 5000, 25)
+    with tempfile.TemporaryDirectory() as directory:
+        results.save(directory)
+        start = time.perf_counter()
+        loaded = Results.load(directory)
+        print("{:>28}: {:8.2f}ms".format('load', (time.perf_counter() - start) * 1e3))
+        timed = [
+            ('cumulative_wins(1)', lambda: loaded.cumulative_wins(1)),
+            ('win_rate(1, 100)', lambda: loaded.win_rate(1, 100)),
+            ('win_rate(1, 1000, 1000)', lambda: loaded.win_rate(1, 1000, 1000)),
+            ('accuracy()', lambda: loaded.accuracy()),
+            ('accuracy(500)', lambda: loaded.accuracy(500)),
+            ('cumulative_hits(0)', lambda: loaded.cumulative_hits(0)),
+        ]
+        for (name, query) in timed:
+            # The first call also reads the files and fills caches.
+            start = time.perf_counter()
+            query()
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            query()
+            print("{:>28}: {:8.2f}ms first, {:8.2f}ms again"
+                  .format(name, first * 1e3, (time.perf_counter() - start) * 1e3))
+
+        start = time.perf_counter()
+        for r in range(loaded.runs):
+            if _loop_cumulative_wins(loaded.winner[r], 1) != loaded.cumulative_wins(1)[r].tolist():
+                sys.exit("Cumulative wins of run {} do not match the loop.".format(r))
+        print("{:>28}: {:8.2f}ms".format('cumulative wins, loops', (time.perf_counter() - start) * 1e3))
+        for r in range(loaded.runs):
+            hits = [bool(h) for (h, run) in zip(loaded.hit, loaded.hit_run) if run == r]
+            if abs(sum(hits) / len(hits) - loaded.accuracy()[r]) > 1e-12:
+                sys.exit("Accuracy of run {} does not match the loop.".format(r))
+    print("The queries match the loops.")
@@ -0,0 +1,1308 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from ...lib.game import Agent, Game, GameHistory, GreedyAgent, RunLogger, Tournament, discrete_soccer
+from ..proj2 import agent, evaluation
+
+
+# (field_width, field_height, goal_height, number of players) of the
+# fields the checks are run on. The first one is the default game.
+FIELDS = [
+    (10, 6, 2, 2),
+    (6, 6, 2, 2),
+    (14, 8, 4, 2),
+    (10, 6, 2, 3),
+    (12, 8, 2, 4),
+    (20, 12, 4, 8),
+]
+
+# Fields so narrow that _update_reset puts players off them (and that
+# random_pos cannot start a game on), for the checks of the tables
+# that reach outside the field.
+NARROW_FIELDS = [
+    (4, 4, 2, 2),
+    (3, 4, 2, 2),
+    (4, 4, 2, 14),
+]
+
+
+def _describe(obj):
+    """Backend-independent description of the result of `state.at`."""
+    if obj is None:
+        return None
+    return (obj.type, obj.index if obj.type == 'player' else None)
+
+
+def _snapshot(state, cells=False):
+    """Everything observable about a state through the public methods."""
+    snap = (
+        state.encode(),
+        list(state.actions),
+        bool(state.is_terminal),
+        [state.reward(p) for p in range(state.num_players)],
+        [state.rewardOM(p) for p in range(state.num_players)],
+    )
+    if cells:
+        snap += tuple(_describe(state.at(x, y))
+                      for x in range(-1, state.pitch.width + 3)
+                      for y in range(-1, state.pitch.height + 3))
+    return snap
+
+
+def _playout(state, rng, plies):
+    """Yields (action, next_state) along a random game from `state`.
+    Actions that turn out to be invalid yield a None next state and
+    another action is picked. The game stops early if the current
+    player has no valid action (e.g. after being reset off the field
+    on a narrow pitch)."""
+    for _ in range(plies):
+        if state.is_terminal:
+            return
+        actions = list(state.actions)
+        new_state = None
+        while new_state is None and actions:
+            action = actions.pop(rng.randrange(len(actions)))
+            new_state = state.act(action)
+            yield (action, new_state)
+        if new_state is None:
+            return
+        state = new_state
+
+
+def equivalence(args):
+    """Plays random games with both soccer backends from the same seeds
+    and checks that they go through identical trajectories."""
+    games = plies = 0
+    for (width, height, goal_height, num_players) in FIELDS:
+        record = discrete_soccer.generator(width, height, goal_height)
+        packed = discrete_soccer.generator(width, height, goal_height, backend='packed')
+        for seed in range(args.seed, args.seed + args.games):
+            random.seed(seed)
+            state_r = record.init([None] * num_players)
+            random.seed(seed)
+            state_p = packed.init([None] * num_players)
+            trajectories = zip(_playout(state_r, random.Random(seed), args.plies),
+                               _playout(state_p, random.Random(seed), args.plies))
+            if _snapshot(state_r, cells=True) != _snapshot(state_p, cells=True):
+                sys.exit("Mismatch in initial state on {}x{} field with {} players, seed {}:\n  {}\n  {}"
+                         .format(width, height, num_players, seed, state_r.encode(), state_p.encode()))
+            for ((a_r, state_r), (a_p, state_p)) in trajectories:
+                plies += 1
+                if a_r != a_p or (state_r is None) != (state_p is None) \
+                   or state_r is not None and _snapshot(state_r, cells=True) != _snapshot(state_p, cells=True):
+                    sys.exit("Mismatch after {} on {}x{} field with {} players, seed {}:\n  {}\n  {}"
+                             .format(a_r, width, height, num_players, seed,
+                                     state_r and state_r.encode(), state_p and state_p.encode()))
+            games += 1
+    print("{} games, {} plies: both backends went through identical states.".format(games, plies))
+
+
+def backends(args):
+    """Measures random-playout throughput of each soccer backend."""
+    rates = {}
+    for backend in ('record', 'packed'):
+        gm = discrete_soccer.generator(backend=backend)
+        random.seed(args.seed)
+        rng = random.Random(args.seed)
+        steps = 0
+        start = time.perf_counter()
+        for _ in range(args.games):
+            for (_, state) in _playout(gm.init([None, None]), rng, args.plies):
+                steps += 1
+        elapsed = time.perf_counter() - start
+        rates[backend] = steps / elapsed
+        print("{:>8}: {:>7} act() calls in {:6.2f}s, {:>9.0f} calls/sec"
+              .format(backend, steps, elapsed, rates[backend]))
+    print("speedup: {:.1f}x".format(rates['packed'] / rates['record']))
+
+
+def occupancy(args):
+    """Measures the cost of act(), and of looking up every cell of the
+    board with at() as draw() does, as the number of players grows."""
+    (width, height) = (30, 20)
+    print("{:>8} {:>8} {:>10} {:>10}".format('backend', 'players', 'us/act', 'us/sweep'))
+    for backend in ('record', 'packed'):
+        gm = discrete_soccer.generator(width, height, random_pos=False, backend=backend)
+        for num_players in (2, 4, 8, 16, 32, 40):
+            rng = random.Random(args.seed)
+            moves = []
+            for _ in range(args.games):
+                state = gm.init([None] * num_players)
+                for (action, new_state) in _playout(state, rng, args.plies):
+                    moves += [(state, action)]
+                    state = new_state or state
+
+            start = time.perf_counter()
+            for (state, action) in moves:
+                state.act(action)
+            act_time = (time.perf_counter() - start) / len(moves)
+
+            # Replaying the moves gives fresh state objects, so nothing
+            # looked up during the act() timing above is reused here.
+            states = [state.act(action) or state for (state, action) in moves[:200]]
+            start = time.perf_counter()
+            for state in states:
+                for x in range(width + 2):
+                    for y in range(height + 2):
+                        state.at(x, y)
+            sweep_time = (time.perf_counter() - start) / len(states)
+
+            print("{:>8} {:>8} {:>10.1f} {:>10.1f}".format(backend, num_players, act_time * 1e6, sweep_time * 1e6))
+
+
+def _random_codes(rng, count, width, height, num_players):
+    """Returns `count` distinct random positions (as `encode()` tuples)
+    on a width x height field."""
+    codes = set()
+    while len(codes) < count:
+        code = [rng.randrange(num_players), rng.randint(1, width), rng.randint(1, height)]
+        holder = rng.randrange(num_players + 1)
+        for i in range(num_players):
+            code += [rng.randint(1, width), rng.randint(1, height), rng.randrange(2), i == holder]
+        codes.add(tuple(code + [True, None]))
+    return list(codes)
+
+
+def keys(args):
+    """Measures Q-table style lookups, keyed by (state, action, action),
+    at several table sizes, and checks that no two distinct states
+    were merged into one entry."""
+    (width, height) = (30, 20)
+    pairs = [(a1, a2) for a1 in discrete_soccer.ACTIONS for a2 in discrete_soccer.ACTIONS]
+    print("{:>8} {:>9} {:>12} {:>12} {:>12}".format('backend', 'entries', 'build s', 'ns/first', 'ns/repeat'))
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        codes = _random_codes(rng, max(1, size // len(pairs)), width, height, 2)
+        probes = [rng.choice(codes) for _ in range(min(len(codes), 20000))]
+        for backend in ('record', 'packed'):
+            gm = discrete_soccer.generator(width, height, backend=backend)
+            start = time.perf_counter()
+            table = {}
+            for code in codes:
+                state = gm.decode(code)
+                for (a1, a2) in pairs:
+                    table[state, a1, a2] = 0.0
+            build_time = time.perf_counter() - start
+            if len(table) != len(codes) * len(pairs):
+                sys.exit("{} of {} distinct states were merged in the table ({} backend)"
+                         .format(len(codes) - len(table) // len(pairs), len(codes), backend))
+
+            # Fresh states, as search produces them: the first lookup
+            # computes the key, the following ones reuse it.
+            states = [gm.decode(code) for code in probes]
+            start = time.perf_counter()
+            for state in states:
+                table[state, pairs[0][0], pairs[0][1]]
+            first_time = (time.perf_counter() - start) / len(states)
+            start = time.perf_counter()
+            for state in states:
+                for (a1, a2) in pairs:
+                    table[state, a1, a2]
+            repeat_time = (time.perf_counter() - start) / (len(states) * len(pairs))
+
+            print("{:>8} {:>9} {:>12.2f} {:>12.0f} {:>12.0f}"
+                  .format(backend, len(table), build_time, first_time * 1e9, repeat_time * 1e9))
+            del table, states
+
+
+def _positions(args, count=20):
+    """Returns `count` non-terminal positions taken from random games on
+    the default field, the same ones for a given --seed."""
+    gm = discrete_soccer.generator(backend='packed')
+    rng = random.Random(args.seed)
+    positions = []
+    while len(positions) < count:
+        random.seed(rng.random())
+        state = gm.init([None, None])
+        plies = rng.randrange(40)
+        for (_, new_state) in _playout(state, rng, plies):
+            state = new_state or state
+        if not state.is_terminal:
+            positions += [state]
+    return positions
+
+
+def transpositions(args):
+    """Times MinimaxAgent decisions at --depth from a fixed set of
+    positions with each backend, without and with a transposition
+    table, and reports how often the table was hit and whether the
+    same actions were chosen."""
+    codes = [state.encode() for state in _positions(args)]
+    print("{:>8} {:>8} {:>8} {:>10} {:>10} {:>10} {:>8}".format(
+        'backend', 'pruning', 'table', 'seconds', 'hits', 'misses', 'same'))
+    for backend in ('record', 'packed'):
+        gm = discrete_soccer.generator(backend=backend)
+        positions = [gm.decode(code) for code in codes]
+        for pruning in (False, True):
+            chosen = None
+            for size in (None, 2**16):
+                # One agent for all the positions, as in a game.
+                mm = agent.MinimaxAgent(evaluation.soccer, pruning, args.depth, transposition_table_size=size)
+                start = time.perf_counter()
+                actions = [mm.decide(state, None, None)[0] for state in positions]
+                elapsed = time.perf_counter() - start
+                table = mm.transposition_table
+                chosen = chosen or actions
+                print("{:>8} {:>8} {:>8} {:>10.2f} {:>10} {:>10} {:>5}/{}".format(
+                    backend, str(pruning), size or '-', elapsed, table.hits if table else '-',
+                    table.misses if table else '-', sum(a == b for (a, b) in zip(chosen, actions)),
+                    len(positions)))
+
+
+def deepening(args):
+    """Compares the per-move latency of MinimaxAgent searching at a fixed
+    --depth with that of iterative deepening under a --move_time
+    budget, on the record backend."""
+    gm = discrete_soccer.generator()
+    positions = [gm.decode(state.encode()) for state in _positions(args)]
+    print("{:>24} {:>10} {:>10} {:>10} {:>12}".format('search', 'mean s', 'max s', 'min s', 'depths'))
+    for (name, mm) in (
+            ('depth {}'.format(args.depth), agent.MinimaxAgent(evaluation.soccer, False, args.depth)),
+            ('{}s per move'.format(args.move_time),
+             agent.MinimaxAgent(evaluation.soccer, False, 50, time_limit=args.move_time))):
+        (latencies, depths) = ([], [])
+        for state in positions:
+            start = time.perf_counter()
+            mm.decide(state, None, None)
+            latencies += [time.perf_counter() - start]
+            depths += [mm.last_depth]
+        print("{:>24} {:>10.3f} {:>10.3f} {:>10.3f} {:>12}".format(
+            name, sum(latencies) / len(latencies), max(latencies), min(latencies),
+            '{}-{}'.format(min(depths), max(depths))))
+
+
+def ordering(args):
+    """Counts the positions visited by plain minimax, by MinimaxAgent's
+    alpha-beta search and by NegamaxAgent without and with move
+    ordering (and with a transposition table), searching the same
+    positions to --depth, and checks that they all find actions of the
+    same value."""
+    positions = _positions(args)
+    searches = [
+        ('minimax', lambda: agent.MinimaxAgent(evaluation.soccer, False, args.depth)),
+        ('alpha-beta', lambda: agent.MinimaxAgent(evaluation.soccer, True, args.depth)),
+        ('negamax', lambda: agent.NegamaxAgent(evaluation.soccer, args.depth, ordering=False)),
+        ('negamax+ordering', lambda: agent.NegamaxAgent(evaluation.soccer, args.depth)),
+        ('negamax+ordering+table', lambda: agent.NegamaxAgent(evaluation.soccer, args.depth,
+                                                              transposition_table_size=2**16)),
+    ]
+    print("{:>24} {:>12} {:>10} {:>10}".format('search', 'nodes', 'vs minimax', 'seconds'))
+    (values, baseline) = (None, None)
+    for (name, make_agent) in searches:
+        (nodes, found) = (0, [])
+        start = time.perf_counter()
+        for state in positions:
+            mm = make_agent()
+            mm.decide(state, None, None)
+            nodes += mm.nodes
+            found += [mm.last_value]
+        elapsed = time.perf_counter() - start
+        (values, baseline) = (values or found, baseline or nodes)
+        if found != values:
+            sys.exit("{} found different values from minimax:\n  {}\n  {}".format(name, values, found))
+        print("{:>24} {:>12} {:>9.1f}% {:>10.2f}".format(name, nodes, 100 * nodes / baseline, elapsed))
+
+
+
+class _Metered(Agent):
+    """Plays as `agent` does, adding up the decisions it makes, the
+    seconds they take, and the values its `counters` attributes have
+    after each decision, in `totals`."""
+    def __init__(self, agent, counters=('nodes',)):
+        super().__init__()
+        self.agent = agent
+        self.counters = counters
+        self.decisions = 0
+        self.seconds = 0.0
+        self.totals = dict.fromkeys(counters, 0)
+
+    def decide(self, state, last_act_m, last_act_o):
+        start = time.perf_counter()
+        decision = self.agent.decide(state, last_act_m, last_act_o)
+        self.seconds += time.perf_counter() - start
+        self.decisions += 1
+        for counter in self.counters:
+            self.totals[counter] += getattr(self.agent, counter)
+        return decision
+
+    def learn(self, states, player_id):
+        pass
+
+
+def mcts(args):
+    """Plays --games games of MCTSAgent, with random playouts and with
+    playouts cut off at 10 plies and scored by the evaluation function,
+    against an alpha-beta MinimaxAgent deepening up to depth 20, both
+    with --move_time seconds per move, on the packed backend. The
+    agents swap sides every game. Reports MCTSAgent's wins, draws
+    (games ended by a repeated position) and losses, the nodes per
+    second of both (positions generated by MCTSAgent, positions
+    visited by minimax), the simulations per move and the share of
+    them kept from the previous move."""
+    gm = discrete_soccer.generator(backend='packed')
+    contenders = [
+        ('mcts', lambda: agent.MCTSAgent(simulations=None, time_limit=args.move_time)),
+        ('mcts+evaluation', lambda: agent.MCTSAgent(simulations=None, time_limit=args.move_time,
+                                                    playout_depth=10, evaluate_function=evaluation.soccer)),
+    ]
+    print("{:>16} {:>5} {:>5} {:>5} {:>11} {:>12} {:>10} {:>8}".format(
+        'agent', 'won', 'drew', 'lost', 'nodes/sec', 'minimax n/s', 'sims/move', 'reused'))
+    for (name, make) in contenders:
+        (won, drew, lost) = (0, 0, 0)
+        mc = _Metered(make(), ('nodes', 'simulations', 'reused'))
+        mm = _Metered(agent.MinimaxAgent(evaluation.soccer, True, 20, time_limit=args.move_time))
+        for g in range(args.games):
+            random.seed(args.seed + g)
+            np.random.seed(args.seed + g)
+            # MCTSAgent plays the red team (player 0) in even games.
+            (agents, team) = (([mc, mm], discrete_soccer.Team.RED) if g % 2 == 0
+                              else ([mm, mc], discrete_soccer.Team.BLUE))
+            with contextlib.redirect_stdout(io.StringIO()):
+                (_, winner, _) = Game(gm, agents)._run_round(2, -1, -1)
+            if winner is None:
+                drew += 1
+            elif winner == team:
+                won += 1
+            else:
+                lost += 1
+        totals = mc.totals
+        print("{:>16} {:>5} {:>5} {:>5} {:>11.0f} {:>12.0f} {:>10.0f} {:>7.0f}%".format(
+            name, won, drew, lost, totals['nodes'] / mc.seconds, mm.totals['nodes'] / mm.seconds,
+            totals['simulations'] / mc.decisions,
+            100 * totals['reused'] / max(1, totals['simulations'] + totals['reused'])))
+
+def parallel(args):
+    """Times MinimaxAgent decisions on the record backend with the root
+    split across 1 to --workers processes, at depths 5 to --depth, and
+    checks that the same actions are chosen as when searching
+    serially."""
+    gm = discrete_soccer.generator()
+    positions = [gm.decode(state.encode()) for state in _positions(args, 6)]
+    print("{:>6} {:>8} {:>10} {:>10} {:>8}".format('depth', 'workers', 'seconds', 'speedup', 'same'))
+    for depth in range(5, max(5, args.depth) + 1):
+        (serial_actions, serial_time) = (None, None)
+        for workers in range(1, args.workers + 1):
+            mm = agent.MinimaxAgent(evaluation.soccer, False, depth, workers=workers)
+            # Start the pool before timing; it is reused by every decision.
+            if workers > 1:
+                mm.decide(positions[0], None, None)
+            start = time.perf_counter()
+            actions = [mm.decide(state, None, None)[0] for state in positions]
+            elapsed = time.perf_counter() - start
+            mm.close()
+            (serial_actions, serial_time) = (serial_actions or actions, serial_time or elapsed)
+            if actions != serial_actions:
+                sys.exit("{} workers chose different actions at depth {}:\n  {}\n  {}"
+                         .format(workers, depth, serial_actions, actions))
+            print("{:>6} {:>8} {:>10.2f} {:>9.2f}x {:>5}/{}".format(
+                depth, workers, elapsed, serial_time / elapsed, len(actions), len(positions)))
+
+
+def _opponent_calls(args, tables):
+    """Plays --games games of OpponentLearning (player 0) against a
+    depth 2 MinimaxAgent on the packed backend, and returns the
+    arguments of every OpponentLearning.decide call."""
+    gm = discrete_soccer.generator(backend='packed')
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    om = agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1, tables=tables)
+    mm = agent.MinimaxAgent(evaluation.soccer, True, 2)
+    calls = []
+    for _ in range(args.games):
+        state = gm.init([om, mm])
+        seen = {state}
+        (last_act_m, last_act_o) = (None, None)
+        for _ in range(args.plies):
+            if state.is_terminal:
+                break
+            if state.current_player == 0:
+                calls += [(state, last_act_m, last_act_o)]
+                action = last_act_m = om.decide(state, last_act_m, last_act_o)[0]
+            else:
+                action = last_act_o = mm.decide(state, last_act_m, last_act_o)[0]
+            state = state.act(action)
+            # Games end on repeated positions, as in Game.
+            if state is None or state in seen:
+                break
+            seen.add(state)
+    return calls
+
+
+def opponent_tables(args):
+    """Replays the OpponentLearning decisions of --games games with the
+    dict and the dense tables, from the same seed, and measures
+    decisions per second. Exits if any decision differs."""
+    calls = _opponent_calls(args, 'dense')
+    results = {}
+    for tables in ('dict', 'dense'):
+        np.random.seed(args.seed)
+        om = agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1, tables=tables)
+        start = time.perf_counter()
+        results[tables] = [om.decide(*call) for call in calls]
+        elapsed = time.perf_counter() - start
+        states = len(om.tables) if om.tables is not None else len(om.N)
+        print("{:>6}: {:>7} decisions in {:6.2f}s, {:>8.0f} decisions/sec, {:>7} states"
+              .format(tables, len(calls), elapsed, len(calls) / elapsed, states))
+    if results['dict'] != results['dense']:
+        sys.exit("The dict and dense tables made different decisions.")
+    print("Both tables made the same decisions.")
+
+
+
+
+def _rss_megabytes():
+    """The resident memory of this process, in MB (Linux only; NaN
+    elsewhere)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return float('nan')
+
+
+def bounded_tables(args):
+    """Plays --games games of OpponentLearning (player 0) against a depth
+    2 MinimaxAgent on the packed backend, with dict tables, unbounded
+    dense tables and dense tables bounded to a quarter of the states
+    the unbounded ones end up with, and reports the size of the
+    tables, the resident memory of the process and the wins of
+    OpponentLearning every tenth of the games."""
+    gm = discrete_soccer.generator(backend='packed')
+    print("{:>10} {:>8} {:>8} {:>10} {:>10} {:>10} {:>6}".format(
+        'tables', 'games', 'states', 'evicted', 'table MB', 'RSS MB', 'wins'))
+    bound = None
+    for (tables, max_states) in (('dict', None), ('dense', None), ('dense', 'quarter')):
+        if max_states == 'quarter':
+            max_states = bound
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+        om = agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1, tables=tables, max_states=max_states)
+        game = Game(gm, [om, agent.MinimaxAgent(evaluation.soccer, True, 2)])
+        wins = 0
+        for g in range(args.games):
+            with contextlib.redirect_stdout(io.StringIO()):
+                (_, winner, _) = game._run_round(2, -1, -1)
+            wins += winner == discrete_soccer.Team.RED
+            if (g + 1) % max(1, args.games // 10) == 0 or g + 1 == args.games:
+                if om.tables is None:
+                    # The dicts themselves, without their keys.
+                    (states, evicted) = (len(om.N), '-')
+                    megabytes = sum(sys.getsizeof(d) for d in (om.N, om.C, om.Q)) / 2**20
+                else:
+                    (states, evicted) = (len(om.tables), om.tables.evictions)
+                    megabytes = om.tables.nbytes / 2**20
+                print("{:>10} {:>8} {:>8} {:>10} {:>10.2f} {:>10.1f} {:>6}".format(
+                    tables if max_states is None else 'max {}'.format(max_states), g + 1, states,
+                    evicted, megabytes, _rss_megabytes(), wins))
+        if tables == 'dense' and bound is None:
+            bound = max(1, len(om.tables) // 4)
+
+
+def _terminal_successors(gm, seed):
+    """Exits unless a SuccessorCache on `gm` leaves a won position without
+    successors after the same position still in play, which shares its
+    key, has been stepped through the cache."""
+    gm.cache_successors(1000)
+    random.seed(seed)
+    state = gm.init([None, None])
+    won = gm.decode(state.encode()[:-1] + (discrete_soccer.Team.RED,))
+    with contextlib.redirect_stdout(io.StringIO()):
+        stepped = [(action, state.act(action), won.act(action)) for action in state.actions]
+    gm.cache_successors(None)
+    for (action, _, after_win) in stepped:
+        if after_win is not None:
+            sys.exit("The cache gave a won position a successor for {}.".format(action))
+
+
+def _sized_successors(backend, seed):
+    """Exits unless a SuccessorCache gives the same position, set up on
+    each two-player field of FIELDS (where it has the same key), the
+    successors of its own field."""
+    gms = [discrete_soccer.generator(width, height, goal_height, backend=backend)
+           for (width, height, goal_height, num_players) in sorted(FIELDS) if num_players == 2]
+    random.seed(seed)
+    code = gms[0].init([None, None]).encode()
+    states = [gm.decode(code) for gm in gms]
+    describe = lambda successor: None if successor is None else (successor.dimensions, successor.encode())
+    with contextlib.redirect_stdout(io.StringIO()):
+        plain = [[describe(state.act(action)) for action in state.actions] for state in states]
+        gms[0].cache_successors(1000)
+        cached = [[describe(state.act(action)) for action in state.actions] for state in states]
+        gms[0].cache_successors(None)
+    if cached != plain:
+        sys.exit("The cache mixed up the successors of fields of different sizes.")
+
+
+def successors(args):
+    """Plays --games games of OpponentLearning (player 0) against a depth
+    2 MinimaxAgent on both backends, without a SuccessorCache and with
+    one of each of --sizes entries, and reports games per second, the
+    hit rate, size and estimated memory of the cache, and the resident
+    memory of the process. Exits if the cache changes any move, gives
+    a won position a successor or gives a position the successor of
+    the same position on a field of another size."""
+    print("{:>8} {:>9} {:>10} {:>8} {:>9} {:>9} {:>10} {:>9} {:>8}".format(
+        'backend', 'cache', 'games/sec', 'speedup', 'hit rate', 'entries', 'evicted', 'cache MB', 'RSS MB'))
+    for backend in ('record', 'packed'):
+        gm = discrete_soccer.generator(backend=backend)
+        (plain, elapsed) = (None, None)
+        for capacity in [None] + args.sizes:
+            random.seed(args.seed)
+            np.random.seed(args.seed)
+            cache = gm.cache_successors(capacity)
+            logger = RunLogger(None, discrete_soccer.ACTIONS)
+            game = Game(gm, [agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1),
+                             agent.MinimaxAgent(evaluation.soccer, True, 2)], logger=logger)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(args.games):
+                    game._run_round(2, -1, -1)
+            took = time.perf_counter() - start
+            records = logger.records()
+            if plain is None:
+                (plain, elapsed) = (records, took)
+                print("{:>8} {:>9} {:>10.2f} {:>8} {:>9} {:>9} {:>10} {:>9} {:>8.1f}".format(
+                    backend, 'none', args.games / took, '', '', '', '', '', _rss_megabytes()))
+                continue
+            if not np.array_equal(plain, records):
+                gm.cache_successors(None)
+                sys.exit("The {} games went differently with a cache of {} entries.".format(backend, capacity))
+            print("{:>8} {:>9} {:>10.2f} {:>7.2f}x {:>9.3f} {:>9} {:>10} {:>9.1f} {:>8.1f}".format(
+                backend, capacity, args.games / took, elapsed / took, cache.hit_rate, len(cache),
+                cache.evictions, cache.nbytes() / 2**20, _rss_megabytes()))
+        gm.cache_successors(None)
+        _terminal_successors(gm, args.seed)
+        _sized_successors(backend, args.seed)
+    print("The games went the same way with every cache, won positions have no successors and "
+          "every field has its own.")
+
+
+class _Crash(Exception):
+    """Stands for whatever stops a run early."""
+
+
+class _CrashingGame(Game):
+    """A Game that crashes when it is about to play game `crash_at`."""
+    crash_at = None
+
+    def _run_round(self, speed, actual_move, predicted_move):
+        if self.logger.game == self.crash_at:
+            raise _Crash
+        return super()._run_round(speed, actual_move, predicted_move)
+
+
+def _checkpointed_run(args, directory, crash_at=None, resume=False):
+    """Plays --games games of OpponentLearning (player 0) against a depth
+    2 MinimaxAgent on the packed backend, logging to `directory/log`
+    and taking a checkpoint in `directory/checkpoints` every third of
+    the games, and returns the Game."""
+    if not resume:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+    agents = [agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1),
+              agent.MinimaxAgent(evaluation.soccer, True, 2)]
+    logger = RunLogger(os.path.join(directory, 'log'), discrete_soccer.ACTIONS, resume=resume)
+    game = _CrashingGame(discrete_soccer.generator(backend='packed'), agents, logger=logger)
+    game.crash_at = crash_at
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            game.run(num_games=args.games, checkpoint_dir=os.path.join(directory, 'checkpoints'),
+                     checkpoint_every=max(1, args.games // 3), resume=resume)
+        except _Crash:
+            pass
+    logger.close()
+    return game
+
+
+def checkpoints(args):
+    """Plays --games games of OpponentLearning against MinimaxAgent
+    without stopping, and again with a crash halfway through between
+    two checkpoints, resumed from the last checkpoint. Exits unless
+    both runs log the same moves and end with the same tables, and
+    unless the checkpoints leave alone the files next to them that are
+    not checkpoints. Then times saving and loading OpponentTables of
+    each of --sizes random states."""
+    with tempfile.TemporaryDirectory() as directory:
+        # Not checkpoints, though their names start as theirs do.
+        others = ['games.csv', 'gameplan']
+        os.makedirs(os.path.join(directory, 'whole', 'checkpoints', 'gameplan'))
+        open(os.path.join(directory, 'whole', 'checkpoints', 'games.csv'), 'w').close()
+        whole = _checkpointed_run(args, os.path.join(directory, 'whole'))
+        if sorted(os.listdir(os.path.join(directory, 'whole', 'checkpoints'))) != \
+                sorted(others + ['game{}'.format(args.games)]):
+            sys.exit("The checkpoints removed other files, or left earlier checkpoints behind.")
+        _checkpointed_run(args, os.path.join(directory, 'resumed'), crash_at=args.games // 2)
+        resumed = _checkpointed_run(args, os.path.join(directory, 'resumed'), resume=True)
+        (a, b) = (whole.agents[0].tables, resumed.agents[0].tables)
+        n = len(a)
+        if not np.array_equal(whole.logger.records(), resumed.logger.records()):
+            sys.exit("The resumed run logged different moves.")
+        if not np.array_equal(a.keys(), b.keys()) or not (np.array_equal(a.N[:n], b.N[:n])
+                                             and np.array_equal(a.C[:n], b.C[:n])
+                                             and np.array_equal(a.Q[:n], b.Q[:n], equal_nan=True)):
+            sys.exit("The resumed run learned different tables.")
+        every = max(1, args.games // 3)
+        print("{} games, resumed from game {}: the same {} moves and {} states."
+              .format(args.games, args.games // 2 // every * every, len(whole.logger.records()), n))
+
+    rng = random.Random(args.seed)
+    print("{:>10} {:>10} {:>10} {:>10} {:>14}".format('states', 'MB', 'save (s)', 'load (s)', 'first read (s)'))
+    for size in args.sizes:
+        # Rows filled in directly, keyed as PackedSoccerState.key is.
+        tables = agent.OpponentTables(size)
+        tables.row_keys = [code[:-2] for code in _random_codes(rng, size, 10, 6, 2)]
+        tables.ids = {key: s for (s, key) in enumerate(tables.row_keys)}
+        tables.size = size
+        tables.N[:] = 1
+        tables.Q[:] = np.random.default_rng(args.seed).random(tables.Q.shape)
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            tables.save(directory)
+            save_time = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded = agent.OpponentTables.load(directory)
+            load_time = time.perf_counter() - start
+            # A state's first lookup searches the saved keys.
+            state = discrete_soccer.PackedSoccerState(None, tables.row_keys[size // 2] + (True, None))
+            start = time.perf_counter()
+            value = loaded.q(loaded.state_id(state), 0, 0)
+            read_time = time.perf_counter() - start
+            if value != tables.Q[size // 2, 0, 0]:
+                sys.exit("The loaded table differs.")
+            megabytes = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)) / 2**20
+            del loaded
+        print("{:>10} {:>10.0f} {:>10.2f} {:>10.2f} {:>14.6f}".format(size, megabytes, save_time, load_time, read_time))
+
+
+class _TwoPassOpponentLearning(agent.OpponentLearning):
+    """OpponentLearning as it was before its decisions reused the
+    successors of the state: the expected values were worked out once
+    for the update and again for the choice, and the action played
+    was applied once more for its reward."""
+    def _decide_dense(self, state, last_act_m, last_act_o):
+        tables = self.tables
+        s = tables.state_id(state, create=True)
+        tables.N[s] += 1
+        if last_act_o is not None and last_act_m is not None:
+            (p1_act, act_vals) = self._action_values(state)[:2]
+            V_ns = max(act_vals)
+            rand_o = np.random.choice(np.flatnonzero(act_vals == act_vals.max()))
+            next_state = state.act(p1_act[rand_o])
+            r = (state if next_state is None else next_state).rewardOM(self.me)
+            (m, o) = (tables.actions[last_act_m], tables.actions[last_act_o])
+            tables.Q[s, m, o] = (1- self.learning_rate)*tables.q(s, m, o) + self.learning_rate*(r + self.discount_factor*V_ns)
+            tables.C[s, o] += 1
+        (p1_act, act_vals, pred) = self._action_values(state)[:3]
+        rand_i = np.random.choice(np.flatnonzero(act_vals == act_vals.max()))
+        return p1_act[rand_i], pred
+
+
+def opponent_acts(args):
+    """Replays the OpponentLearning decisions of --games games with the
+    dense tables, as decisions were made before successors were
+    reused and as they are now, and with the dict tables. Counts the
+    calls to act() per decision with cProfile, and times the
+    decisions without it. Exits if any decision or table differs."""
+    import cProfile
+    import pstats
+    calls = _opponent_calls(args, 'dense')
+    agents = [('two passes', lambda: _TwoPassOpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1)),
+              ('dense', lambda: agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1)),
+              ('dict', lambda: agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1, tables='dict'))]
+    print("{:>12} {:>10} {:>14} {:>16}".format('decide', 'decisions', 'act() / call', 'decisions/sec'))
+    results = []
+    for (name, make) in agents:
+        np.random.seed(args.seed)
+        om = make()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        decisions = [om.decide(*call) for call in calls]
+        profiler.disable()
+        acts = sum(stat[1] for (function, stat) in pstats.Stats(profiler).stats.items()
+                   if function[2] == 'act')
+        np.random.seed(args.seed)
+        om = make()
+        start = time.perf_counter()
+        [om.decide(*call) for call in calls]
+        elapsed = time.perf_counter() - start
+        results += [(decisions, om)]
+        print("{:>12} {:>10} {:>14.1f} {:>16.0f}".format(name, len(calls), acts / len(calls), len(calls) / elapsed))
+    ((old, a), (new, b)) = results[:2]
+    n = len(a.tables)
+    if old != new or results[2][0] != new:
+        sys.exit("The decisions differ.")
+    if not (np.array_equal(a.tables.keys(), b.tables.keys()) and np.array_equal(a.tables.N[:n], b.tables.N[:n])
+            and np.array_equal(a.tables.C[:n], b.tables.C[:n])
+            and np.array_equal(a.tables.Q[:n], b.tables.Q[:n], equal_nan=True)):
+        sys.exit("The tables differ.")
+    print("The same decisions and tables every way.")
+
+class _RandomMover(Agent):
+    """Picks uniformly among the valid actions, without learning."""
+    def decide(self, state, last_act_m, last_act_o):
+        return (random.choice(state.actions), None)
+
+    def learn(self, states, player_id):
+        pass
+
+
+# Run in a fresh interpreter: prints the seconds taken to import the
+# game engine and whether that loaded pygame.
+_STARTUP = """
+import sys, time
+start = time.perf_counter()
+import src.lib.game
+print(time.perf_counter() - start, 'pygame' in sys.modules)
+"""
+
+
+def expectimax(args):
+    """Plays --games games of ExpectimaxAgent (player 1, the seat
+    OpponentLearning is always played against) against a depth 2
+    MinimaxAgent and against OpponentLearning, on the packed backend,
+    and of a MinimaxAgent searching as deep (depth 3, alpha-beta) and
+    scoring the positions at its depth limit with the evaluation
+    function, as ExpectimaxAgent does, against the same opponents.
+    Reports the wins, draws and losses of player 1 in each half of the
+    games, its nodes per second, and the share of the opponent's
+    positions ExpectimaxAgent searched with the counts rather than as
+    minimax does."""
+    gm = discrete_soccer.generator(backend='packed')
+    opponents = [
+        ('minimax', lambda: agent.MinimaxAgent(evaluation.soccer, True, 2)),
+        ('opponent', lambda: agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1)),
+    ]
+    players = [
+        ('expectimax', lambda: agent.ExpectimaxAgent(evaluation.soccer, 3)),
+        ('minimax', lambda: _EvaluatingMinimax(True, 3)),
+    ]
+    half = max(1, args.games // 2)
+    print("{:>12} {:>10} {:>14} {:>14} {:>11} {:>9}".format(
+        'player 1', 'vs', 'first half', 'second half', 'nodes/sec', 'expected'))
+    for (opponent_name, make_opponent) in opponents:
+        for (name, make) in players:
+            random.seed(args.seed)
+            np.random.seed(args.seed)
+            counters = ('nodes', 'expected', 'minimized') if name == 'expectimax' else ('nodes',)
+            player = _Metered(make(), counters)
+            game = Game(gm, [make_opponent(), player])
+            outcomes = [[0, 0, 0], [0, 0, 0]]
+            for g in range(args.games):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    (_, winner, _) = game._run_round(2, -1, -1)
+                outcome = 1 if winner is None else (0 if winner == discrete_soccer.Team.BLUE else 2)
+                outcomes[g >= half][outcome] += 1
+            totals = player.totals
+            searched = totals.get('expected', 0) + totals.get('minimized', 0)
+            print("{:>12} {:>10} {:>14} {:>14} {:>11.0f} {:>9}".format(
+                name, opponent_name, '/'.join(map(str, outcomes[0])), '/'.join(map(str, outcomes[1])),
+                totals['nodes'] / player.seconds,
+                '{:.0f}%'.format(100 * totals['expected'] / searched) if searched else '-'))
+    print("(won/drew/lost; draws are games ended by a repeated position)")
+
+
+def headless(args):
+    """Measures the import time of the game engine in a fresh
+    interpreter, and the overhead per game of Game._run_round with
+    display off over --games games between two random movers on the
+    packed backend. Exits if either loads pygame."""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    with tempfile.TemporaryDirectory() as cwd:
+        # The engine opens its CSV logs in the working directory.
+        env = dict(os.environ, PYTHONPATH=root)
+        times = []
+        for _ in range(5):
+            out = subprocess.run([sys.executable, '-c', _STARTUP], cwd=cwd, env=env,
+                                 capture_output=True, text=True, check=True).stdout.split()
+            if out[1] == 'True':
+                sys.exit("Importing the game engine loaded pygame.")
+            times += [float(out[0])]
+    print("import: {:6.3f}s (best of 5)".format(min(times)))
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    game = Game(discrete_soccer.generator(backend='packed'), [_RandomMover(), _RandomMover()])
+    plies = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.games):
+            plies += game._run_round(2, -1, -1)[0]
+    elapsed = time.perf_counter() - start
+    if 'pygame' in sys.modules:
+        sys.exit("A headless game loaded pygame.")
+    print("{} games, {} plies in {:.2f}s: {:.2f}ms per game, {:.1f}us per ply"
+          .format(args.games, plies, elapsed, elapsed / args.games * 1e3, elapsed / max(plies, 1) * 1e6))
+
+
+def tournament(args):
+    """Plays --games games of two depth 2 MinimaxAgents, and two
+    replicas of --games / 4 games of OpponentLearning against one, as
+    Tournaments over 1 to --workers processes, measures games per
+    second, and checks that the results match the single process
+    ones."""
+    gm = discrete_soccer.generator()
+    runs = [
+        ('minimax', [agent.MinimaxAgent(evaluation.soccer, True, 2),
+                     agent.MinimaxAgent(evaluation.soccer, True, 2)], args.games, 1),
+        ('opponent', [agent.OpponentLearning(evaluation.soccer, 0.5, 0.8, 0, 1),
+                      agent.MinimaxAgent(evaluation.soccer, True, 2)], max(1, args.games // 4), 2),
+    ]
+    for (name, agents, num_games, replicas) in runs:
+        serial = None
+        for workers in range(1, args.workers + 1):
+            t = Tournament(gm, agents, num_games, replicas=replicas, seed=args.seed, workers=workers)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = t.run()
+            print("{:>8}, {} workers: {} games in {:6.2f}s, {:6.2f} games/sec"
+                  .format(name, workers, num_games * replicas, t.elapsed, t.games_per_second))
+            if serial is None:
+                serial = results
+            elif results != serial:
+                sys.exit("The {} tournament over {} workers gave different results.".format(name, workers))
+    print("Every tournament matched the single process results.")
+
+
+def history(args):
+    """Plays --games random games of --plies plies on a 50x30 field with
+    each backend, without stopping at repeated states, and times the
+    repetition check of Game over them: testing each state against a
+    list of the earlier ones, as Game used to, and against a
+    GameHistory. Exits if they disagree about which states repeat."""
+    print("{:>8} {:>8} {:>12} {:>12} {:>10} {:>10}"
+          .format('backend', 'plies', 'list (s)', 'history (s)', 'speedup', 'repeats'))
+    for backend in ('record', 'packed'):
+        gm = discrete_soccer.generator(50, 30, 4, backend=backend)
+        (list_time, history_time, plies, repeats) = (0, 0, 0, 0)
+        for seed in range(args.seed, args.seed + args.games):
+            random.seed(seed)
+            state = gm.init([None, None])
+            trajectory = [s for (_, s) in _playout(state, random.Random(seed), args.plies) if s is not None]
+            plies += len(trajectory)
+
+            start = time.perf_counter()
+            states = [state]
+            by_list = []
+            for s in trajectory:
+                by_list += [s in states]
+                states += [s]
+            list_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            states = GameHistory(state)
+            by_history = []
+            for s in trajectory:
+                by_history += [s in states]
+                states.append(s)
+            history_time += time.perf_counter() - start
+
+            if by_list != by_history:
+                sys.exit("The list and the history disagree on game {} with the {} backend."
+                         .format(seed, backend))
+            repeats += sum(by_history)
+        print("{:>8} {:>8} {:>12.3f} {:>12.3f} {:>9.1f}x {:>10}"
+              .format(backend, plies, list_time, history_time, list_time / history_time, repeats))
+
+
+def _reference_dist_to_goal(state, pos, team):
+    """SoccerState.dist_to_goal, worked out without the pitch's tables."""
+    goal_pos = (state.pitch.width+0.5, state.pitch.height/2) if team == discrete_soccer.Team.RED \
+               else (0.5, state.pitch.height/2)
+    return math.sqrt(sum([(p1+0.51-p2)**2 for p1, p2 in zip(pos, goal_pos)]))
+
+
+def _reference_soccer(state, player_id):
+    """evaluation.soccer as it was before the distance tables."""
+    def distance(a, b):
+        return math.sqrt(pow(a.x - b.x, 2) + pow(a.y - b.y, 2))
+
+    def triangle_score(player1, player2, goal_team):
+        return (_reference_dist_to_goal(state, (player2.x, player2.y), goal_team)
+                + distance(player1, player2)) \
+            - _reference_dist_to_goal(state, (player1.x, player1.y), goal_team)
+
+    score = 0
+    player1 = state.players[player_id]
+    if player1.has_ball:
+        score += 5
+    for index, player2 in enumerate(state.players):
+        if index != player_id:
+            if player1.has_ball:
+                score += triangle_score(player1, player2, player1.team)
+            elif player2.has_ball:
+                score -= triangle_score(player2, player1, player2.team)
+            else:
+                score += distance(player2, state.ball) - distance(player1, state.ball)
+    return score
+
+
+class _LeafCollector(agent.MinimaxAgent):
+    """A MinimaxAgent that remembers every position its searches stop at.
+    (Soccer searches score those with the reward, which is 0 until the
+    game ends, so evaluation.soccer is not called there by default.)"""
+    def __init__(self, depth):
+        super().__init__(evaluation.soccer, True, depth)
+        self.leaves = []
+
+    def _cutoff_value(self, state, player):
+        self.leaves.append((state, player))
+        return super()._cutoff_value(state, player)
+
+
+def _restarts(width, height, goal_height, num_players):
+    """The positions _update_reset puts a game on the field in without
+    random_pos, with nobody, the red team and the blue team given the
+    ball."""
+    pitch = discrete_soccer.SoccerPitch.get(width, height, goal_height)
+    restarts = []
+    for prefer_side in (None, discrete_soccer.Team.RED, discrete_soccer.Team.BLUE):
+        state = discrete_soccer.PackedSoccerState.initial(pitch, num_players, random_pos=False)
+        s = list(state.code)
+        state._update_reset(s, prefer_side=prefer_side)
+        restarts += [tuple(s)]
+    return restarts
+
+
+def evaluation_tables(args):
+    """Collects the positions at the leaves of MinimaxAgent searches with
+    pruning at --depth from a fixed set of positions, and measures
+    evaluations per second over them with each backend, with
+    evaluation.soccer and with the same evaluation worked out without
+    the pitch's distance tables. Exits if the two ever differ, there or
+    on the restart positions of the fields of FIELDS and NARROW_FIELDS,
+    which can be off the field."""
+    codes = [state.encode() for state in _positions(args)]
+    print("{:>8} {:>8} {:>16} {:>16} {:>8}".format(
+        'backend', 'leaves', 'tables (evals/s)', 'math (evals/s)', 'speedup'))
+    for backend in ('record', 'packed'):
+        gm = discrete_soccer.generator(backend=backend)
+        mm = _LeafCollector(args.depth)
+        for code in codes:
+            mm.decide(gm.decode(code), None, None)
+        leaves = mm.leaves
+
+        rates = []
+        for evaluate in (evaluation.soccer, _reference_soccer):
+            start = time.perf_counter()
+            for _ in range(10):
+                for (state, player_id) in leaves:
+                    evaluate(state, player_id)
+            rates += [10 * len(leaves) / (time.perf_counter() - start)]
+        for (state, player_id) in leaves:
+            if evaluation.soccer(state, player_id) != _reference_soccer(state, player_id):
+                sys.exit("The evaluations differ on {}.".format(state.encode()))
+        print("{:>8} {:>8} {:>16.0f} {:>16.0f} {:>7.1f}x".format(
+            backend, len(leaves), rates[0], rates[1], rates[0] / rates[1]))
+
+    restarts = 0
+    for (width, height, goal_height, num_players) in FIELDS + NARROW_FIELDS:
+        for backend in ('record', 'packed'):
+            gm = discrete_soccer.generator(width, height, goal_height, backend=backend)
+            codes = _restarts(width, height, goal_height, num_players)
+            for code in codes:
+                state = gm.decode(code)
+                for player_id in range(num_players):
+                    if evaluation.soccer(state, player_id) != _reference_soccer(state, player_id):
+                        sys.exit("The evaluations differ on {}.".format(code))
+                    restarts += 1
+            for player_id in range(num_players):
+                batch = evaluation.soccer_batch(codes, player_id, gm)
+                if batch.tolist() != [_reference_soccer(gm.decode(code), player_id) for code in codes]:
+                    sys.exit("soccer_batch differs on the restarts of a {}x{} field."
+                             .format(width, height))
+    print("Both evaluations agree on every leaf and on {} restarts.".format(restarts))
+
+
+class _EvaluatingMinimax(agent.MinimaxAgent):
+    """A MinimaxAgent that scores every non-terminal position at its depth
+    limit with the evaluation function, as searches of games without
+    rewards before the end (e.g. Connect 4) do, and counts them."""
+    def __init__(self, pruning, depth, batch=False):
+        super().__init__(evaluation.soccer, pruning, depth,
+                         batch_evaluate_function=evaluation.soccer_batch if batch else None)
+        self.evaluated = 0
+
+    def _cutoff_value(self, state, player):
+        self.evaluated += 1
+        return self.evaluate(state, player)
+
+    def _cutoff_values(self, states, player):
+        values = [state.reward(player) if state.is_terminal else None for state in states]
+        pending = [i for (i, value) in enumerate(values) if value is None]
+        if pending:
+            self.evaluated += len(pending)
+            scores = self.batch_evaluate([states[i].encode() for i in pending], player,
+                                         states[pending[0]].game_type)
+            for (i, score) in zip(pending, scores.tolist()):
+                values[i] = score
+        return values
+
+
+def batch_evaluation(args):
+    """Times MinimaxAgent decisions from a fixed set of positions on the
+    packed backend, with and without pruning, at depths 4 to --depth,
+    scoring the positions at the depth limit with evaluation.soccer one
+    at a time and with evaluation.soccer_batch in batches, and the same
+    for GreedyAgent. (MinimaxAgent only batches searches without
+    pruning.) Exits unless both choose the same actions, with the same
+    values, after visiting the same positions, or if the batched
+    GreedyAgent picks anything but the best action act() accepts in
+    the positions of a random game. Then measures
+    evaluations per second for batches of several sizes."""
+    positions = _positions(args)
+    print("{:>8} {:>6} {:>10} {:>14} {:>14} {:>8}".format(
+        'pruning', 'depth', 'evals', 'per-leaf (s)', 'batched (s)', 'speedup'))
+    for pruning in (True, False):
+        # Without pruning, deep searches take long enough on a few
+        # positions.
+        searched = positions if pruning else positions[:5]
+        for depth in range(min(4, args.depth), args.depth + 1):
+            runs = []
+            for batch in (False, True):
+                mm = _EvaluatingMinimax(pruning, depth, batch)
+                start = time.perf_counter()
+                decisions = []
+                for state in searched:
+                    decisions += [(mm.decide(state, None, None)[0], mm.last_value, mm.nodes)]
+                runs += [(time.perf_counter() - start, decisions, mm.evaluated)]
+            if runs[0][1] != runs[1][1]:
+                sys.exit("Batched evaluation changed the search at depth {}.".format(depth))
+            print("{:>8} {:>6} {:>10} {:>14.2f} {:>14.2f} {:>7.2f}x".format(
+                str(pruning), depth, runs[1][2], runs[0][0], runs[1][0], runs[0][0] / runs[1][0]))
+
+    greedy = [GreedyAgent(evaluation.soccer), GreedyAgent(evaluation.soccer, evaluation.soccer_batch)]
+    times = []
+    chosen = []
+    for player in greedy:
+        start = time.perf_counter()
+        for _ in range(100):
+            actions = [player.decide(state) for state in positions]
+        times += [time.perf_counter() - start]
+        chosen += [actions]
+    if chosen[0] != chosen[1]:
+        sys.exit("Batched evaluation changed GreedyAgent's actions.")
+    # Positions where act() rejects some of the actions, which have no
+    # child to score.
+    random.seed(args.seed)
+    states = [state for (_, state) in _playout(discrete_soccer.generator(backend='packed').init([None, None]),
+                                               random.Random(args.seed), 500) if state is not None]
+    for state in states:
+        children = [(a, state.act(a)) for a in state.actions]
+        if state.is_terminal or all(child is not None for (_, child) in children):
+            continue
+        best = max([(a, evaluation.soccer(child, state.current_player)) for (a, child) in children
+                    if child is not None], key=lambda x: x[1])[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            action = greedy[1].decide(state)
+        if action != best:
+            sys.exit("Batched GreedyAgent chose {} rather than {}.".format(action, best))
+    print("{:>8} {:>6} {:>10} {:>14.2f} {:>14.2f} {:>7.2f}x".format(
+        '-', 'greedy', 100 * sum(len(state.actions) for state in positions),
+        times[0], times[1], times[0] / times[1]))
+
+    # How the cost of a batch is spread over its positions.
+    leaves = [leaf for state in positions for child in map(state.act, state.actions) if child
+              for leaf in map(child.act, child.actions) if leaf]
+    game_type = leaves[0].game_type
+    print("{:>8} {:>16} {:>16} {:>8}".format('batch', 'per-leaf (ev/s)', 'batched (ev/s)', 'speedup'))
+    for size in (1, 4, 16, 64, 256):
+        batches = [leaves[i:i + size] for i in range(0, len(leaves) - size + 1, size)]
+        count = 10 * size * len(batches)
+        start = time.perf_counter()
+        for _ in range(10):
+            for batch in batches:
+                for leaf in batch:
+                    evaluation.soccer(leaf, 0)
+        single = count / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(10):
+            for batch in batches:
+                evaluation.soccer_batch([leaf.encode() for leaf in batch], 0, game_type)
+        batched = count / (time.perf_counter() - start)
+        print("{:>8} {:>16.0f} {:>16.0f} {:>7.2f}x".format(size, single, batched, batched / single))
+    print("Batched evaluation makes the same decisions.")
+
+
+# The fields of the kick checks of batch_env: the two-player fields of
+# FIELDS, and fields narrow enough that a player restarts off them.
+_KICK_FIELDS = [(width, height, goal_height) for (width, height, goal_height, num_players) in FIELDS
+                if num_players == 2] + [(7, 6, 2), (8, 6, 2)]
+
+
+def batch_env(args):
+    """Steps `SoccerBatch`es of --games games for --plies moves on each
+    two-player field of FIELDS, with random actions of which a tenth
+    are picked from every action (valid or not), and exits unless every
+    game ends up where PackedSoccerState.act takes it, and the same for
+    kicks from every cell of _KICK_FIELDS. Then measures
+    the moves per second of random games on the default field with
+    PackedSoccerState.act and with SoccerBatch.step for batches of
+    --sizes games."""
+    steps = 0
+    for (width, height, goal_height, num_players) in FIELDS:
+        if num_players != 2:
+            continue
+        batch = discrete_soccer.SoccerBatch(args.games, width, height, goal_height, seed=args.seed)
+        for _ in range(args.plies):
+            codes = batch.codes()
+            valid = batch.valid_actions()
+            actions = batch.sample_actions()
+            anything = batch.rng.random(batch.num_games) < 0.1
+            actions = np.where(anything, batch.rng.integers(0, len(discrete_soccer.ACTIONS), batch.num_games),
+                               actions)
+            (winner, done) = batch.step(actions, reset=False)
+            for (k, (code, new_code)) in enumerate(zip(codes, batch.codes())):
+                action = discrete_soccer.ACTIONS[actions[k]]
+                # act() complains about actions that are not in
+                # state.actions, so those are only checked on the batch.
+                state = discrete_soccer.PackedSoccerState(batch.pitch, code)
+                new_state = state.act(action) if valid[k, actions[k]] else None
+                expected = code if new_state is None else new_state.code
+                if new_code != expected or batch.invalid[k] != (new_state is None) \
+                   or winner[k] != (expected[-1] or 0):
+                    sys.exit("Mismatch after {} on a {}x{} field:\n  {}\n  {}\n  {}"
+                             .format(action, width, height, code, expected, new_code))
+            steps += batch.num_games
+            batch.reset(done)
+    print("{} moves: the batches went where PackedSoccerState.act went.".format(steps))
+
+    # Kicks from every cell a player with the ball can be on, restarts
+    # off the field included, with the other player anywhere on the
+    # field, set up with set_codes rather than reached by playing.
+    kicks = 0
+    for (width, height, goal_height) in _KICK_FIELDS:
+        pitch = discrete_soccer.SoccerPitch.get(width, height, goal_height)
+        m = pitch.margin
+        codes = []
+        for current in (0, 1):
+            for x in range(-m, width + 2 + m):
+                for y in range(1, height + 1):
+                    for ox in range(1, width + 1):
+                        for oy in range(1, height + 1):
+                            if (ox, oy) != (x, y):
+                                players = [x, y, 0, True, ox, oy, 0, False]
+                                if current:
+                                    players = players[4:] + players[:4]
+                                codes += [(current, x, y, *players, False, None)]
+        batch = discrete_soccer.SoccerBatch(len(codes), width, height, goal_height, seed=args.seed)
+        batch.set_codes(codes)
+        batch.step(np.zeros(len(codes), np.int8), reset=False)
+        for (code, new_code) in zip(codes, batch.codes()):
+            expected = discrete_soccer.PackedSoccerState(pitch, code).act(discrete_soccer.Action.KICK).code
+            if new_code != expected:
+                sys.exit("Mismatch after a kick on a {}x{} field:\n  {}\n  {}\n  {}"
+                         .format(width, height, code, expected, new_code))
+        kicks += len(codes)
+    print("{} kicks: the batches went where PackedSoccerState.act went.".format(kicks))
+
+    gm = discrete_soccer.generator(backend='packed')
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    moves = 0
+    start = time.perf_counter()
+    for _ in range(args.games):
+        for (_, state) in _playout(gm.init([None, None]), rng, args.plies):
+            moves += state is not None
+    scalar = moves / (time.perf_counter() - start)
+    print("{:>10} {:>14} {:>10}".format('games', 'moves/sec', 'speedup'))
+    print("{:>10} {:>14.0f} {:>10}".format('scalar', scalar, '-'))
+    for size in args.sizes:
+        batch = discrete_soccer.SoccerBatch(size, seed=args.seed)
+        moves = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 2:
+            batch.step(batch.sample_actions())
+            moves += size - batch.invalid.sum()
+        rate = moves / (time.perf_counter() - start)
+        print("{:>10} {:>14.0f} {:>9.1f}x".format(size, rate, rate / scalar))
+
+def _reference_shot(state, x, y, team):
+    """The goal-angle geometry of SoccerState.can_shoot_from and
+    check_kick, worked out without the pitch's shot map."""
+    (x, y) = (x + 0.5, y - 0.5)
+    goal_x = state.pitch.width + 2 if team == discrete_soccer.Team.RED else 0
+    goal_y1 = int(state.pitch.height - state.pitch.goal_height) / 2
+    goal_y2 = int(state.pitch.height + state.pitch.goal_height) / 2
+    dx = goal_x - x
+    dy1 = (goal_y1 - y)
+    dy2 = (goal_y2 - y)
+    norm1 = math.sqrt(dx**2 + dy1**2)
+    norm2 = math.sqrt(dx**2 + dy2**2)
+    dy = ((goal_y1+goal_y2)/2 - y)
+    dist = math.sqrt(dx**2 + dy**2)
+    angle = math.acos((dx**2 + dy1*dy2)/(norm1*norm2))
+    return (x, y, dx, dy1, dy2, dist, angle, state.is_goal(dist, angle))
+
+
+def _reference_check_kick(state, player):
+    """SoccerState.check_kick as it was before the shot map."""
+    (x, y, dx, dy1, dy2, dist, angle, is_goal) = _reference_shot(state, player.x, player.y, player.team)
+    f_y1 = lambda obj_x: y + dy1 * obj_x
+    f_y2 = lambda obj_x: y + dy2 * obj_x
+    intercept = (None, float("inf"))
+    for obj in state.players:
+        if obj.index == player.index: continue
+        (obj_x, obj_y) = (obj.x + 0.5, obj.y + 0.5)
+        obj_x = (obj_x - x) / dx
+        if obj_y >= f_y1(obj_x) and obj_y <= f_y2(obj_x):
+            new_i = (obj, math.sqrt((x - obj_x)**2 + (y - obj_y)**2))
+            intercept = min([intercept, new_i], key=lambda x: x[1])
+    return (dist, angle, is_goal, intercept[0])
+
+
+def shots(args):
+    """Times SoccerState.can_shoot_from over every cell of each field of
+    FIELDS (what draw() does), and check_kick for every player of the
+    states of --games random games, with the pitch's shot map and
+    without it, and exits if they ever differ."""
+    print("{:>10} {:>8} {:>14} {:>14} {:>8}".format('field', 'calls', 'map (us/call)', 'math (us/call)', 'speedup'))
+    sweeps = []
+    kicks = []
+    for (width, height, goal_height, num_players) in FIELDS:
+        gm = discrete_soccer.generator(width, height, goal_height)
+        random.seed(args.seed)
+        state = gm.init([None] * num_players)
+        cells = [(x, y, team) for team in discrete_soccer.Team
+                 for x in range(-1, width + 3) for y in range(-1, height + 3)]
+        sweeps += [(state, cells)]
+        for seed in range(args.seed, args.seed + args.games):
+            random.seed(seed)
+            for (_, new_state) in _playout(gm.init([None] * num_players), random.Random(seed), args.plies):
+                if new_state is not None:
+                    kicks += [(new_state, p) for p in new_state.players]
+
+    for (state, cells) in sweeps:
+        for (x, y, team) in cells:
+            if state.can_shoot_from(x, y, team) != _reference_shot(state, x, y, team)[7]:
+                sys.exit("can_shoot_from({}, {}, {}) differs on a {}x{} field."
+                         .format(x, y, team, state.pitch.width, state.pitch.height))
+    for (state, player) in kicks:
+        if state.check_kick(player) != _reference_check_kick(state, player):
+            sys.exit("check_kick differs for player {} in {}.".format(player.index, state.encode()))
+
+    timings = [
+        ('sweep', sum(len(cells) for (_, cells) in sweeps),
+         lambda: [state.can_shoot_from(*cell) for (state, cells) in sweeps for cell in cells],
+         lambda: [_reference_shot(state, *cell)[7] for (state, cells) in sweeps for cell in cells]),
+        ('check_kick', len(kicks),
+         lambda: [state.check_kick(player) for (state, player) in kicks],
+         lambda: [_reference_check_kick(state, player) for (state, player) in kicks]),
+    ]
+    for (name, calls, with_map, with_math) in timings:
+        times = []
+        for run in (with_map, with_math):
+            start = time.perf_counter()
+            run()
+            times += [(time.perf_counter() - start) / calls * 1e6]
+        print("{:>10} {:>8} {:>14.2f} {:>14.2f} {:>7.1f}x".format(name, calls, times[0], times[1], times[1] / times[0]))
+    print("The shot map gives the same results everywhere.")
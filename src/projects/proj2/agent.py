@@ -1,15 +1,56 @@
 #!/usr/bin/env python3
 from os import stat
+import math
+import multiprocessing
+import os
+import random
+import time
 from pyrsistent import PMap
 import numpy as np
 from collections import defaultdict
 
-from src.lib.game.discrete_soccer import Action
-from ...lib.game import Agent, RandomAgent, GameState
+from src.lib.game.discrete_soccer import Action, ACTIONS
+from ...lib.game import Agent, RandomAgent, GameState, TranspositionTable
 
 import csv
 
 
+class _OutOfBudget(Exception):
+    """Raised inside a search when its time or node budget runs out."""
+
+
+# The copy of the agent that a worker process searches with (see
+# MinimaxAgent.parallel_search).
+_worker_agent = None
+
+
+def _init_worker(agent):
+    global _worker_agent
+    _worker_agent = agent
+    _worker_agent.workers = None
+
+
+def _search_subtree(task):
+    """Runs in a worker process: decodes a position and returns its
+    value for `player`, searched to `depth`, along with the number of
+    positions visited. The value is None if the budget ran out. The
+    worker's transposition table, if any, is put in the `generation`
+    of the root's (see TranspositionTable.new_search), so that entries
+    from earlier decisions give way as they do at the root."""
+    (game_type, code, player, depth, time_left, node_budget, generation) = task
+    agent = _worker_agent
+    if agent.transposition_table is not None:
+        agent.transposition_table.generation = generation
+    agent.search_depth = depth
+    agent.nodes = 0
+    agent._deadline = None if time_left is None else time.perf_counter() + time_left
+    agent._node_budget = node_budget
+    try:
+        value = agent.subtree_value(game_type.decode(code), player)
+    except _OutOfBudget:
+        value = None
+    return (value, agent.nodes)
+
 
 class MinimaxAgent(RandomAgent):
     """An agent that makes decisions using the Minimax algorithm, using a
@@ -27,14 +68,82 @@ class MinimaxAgent(RandomAgent):
     :param max_depth: The maximum depth to search using the minimax
         algorithm, before using estimates generated by the evaluation
         function.
+
+    :param transposition_table_size: If given, positions already
+        searched are remembered in a TranspositionTable of at most
+        this many entries, kept between decisions. Its hit and miss
+        counters are available as `transposition_table.hits` and
+        `transposition_table.misses`.
+
+    :param time_limit: If given (or if `node_limit` is), each decision
+        is made by iterative deepening: searches of depth 1, 2, ... up
+        to `max_depth` are run until one runs past `time_limit`
+        seconds from the start of the decision, and the best action of
+        the deepest completed search is played. The depth 1 search
+        always completes, even past the limit. Each search tries the
+        previous one's best action first. `last_depth` holds the depth
+        that was reached.
+
+    :param node_limit: Like `time_limit`, but limits the number of
+        positions visited in each decision.
+
+    :param workers: If more than 1, the actions at the root are searched
+        in parallel by this many worker processes. The pool is started
+        on the first decision and kept until `close()` is called.
+        Positions are sent to the workers as `state.encode()`.
+
+    :param batch_evaluate_function: If given, and without alpha-beta
+        pruning, the children of positions one ply above the depth
+        limit are all generated together, and those that need the
+        evaluation function are scored in a single call to this
+        function instead, with the parameters (codes, player_id,
+        game_type): the `encode()` tuples of the positions, the player,
+        and their GameType. It returns a NumPy vector of the same
+        scores `evaluate_function` gives (see
+        `evaluation.soccer_batch`). Without a transposition table, all
+        the positions at the limit below each position two plies above
+        it are scored together. The search visits the same positions
+        and chooses the same action. With pruning, positions are scored
+        one at a time, as a batch would score the children past a
+        cutoff as well.
     """
 
-    def __init__(self, evaluate_function, alpha_beta_pruning=False, max_depth=5):
+    def __init__(self, evaluate_function, alpha_beta_pruning=False, max_depth=5,
+                 transposition_table_size=None, time_limit=None, node_limit=None,
+                 workers=None, batch_evaluate_function=None):
         super().__init__()
         self.evaluate = evaluate_function
+        self.batch_evaluate = batch_evaluate_function
         # print('EVAL FUNCTION\n',evaluate_function)
         self.alpha_beta_pruning = alpha_beta_pruning
         self.max_depth = max_depth
+        self.transposition_table = None
+        if transposition_table_size:
+            self.transposition_table = TranspositionTable(transposition_table_size)
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        # Depth of the current search, and positions it has visited.
+        self.search_depth = max_depth
+        self.nodes = 0
+        self.last_depth = None
+        self.last_value = None
+        self._deadline = None
+        self._node_budget = None
+        self.workers = workers
+        self._pool = None
+
+    def __getstate__(self):
+        # Worker pools cannot be pickled (or shared with the workers).
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def close(self):
+        """Stops the worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
 
     def decide(self, state: GameState , lm, lo):
         # print('minimax')
@@ -62,13 +171,117 @@ class MinimaxAgent(RandomAgent):
         # print(state.players)
         # print('\nCURRENT PLAYER LAST ACTION   ', state.players[state.current_player].last_action)
 
+        start = time.perf_counter()
+        if self.transposition_table is not None:
+            self.transposition_table.new_search()
+        self.nodes = 0
+
+        if self.time_limit is not None or self.node_limit is not None:
+            return self.iterative_deepening(state, start),None
+
+        self.search_depth = self.max_depth
+        self.last_depth = self.max_depth
+        return self._search_root(state),None
+
+    def _search_root(self, state, first_action=None):
+        if self.workers is not None and self.workers > 1 and self.search_depth > 1:
+            return self.parallel_search(state, first_action)
+        return self.search(state, first_action)
+
+    def search(self, state, first_action=None):
+        """Searches `state` `search_depth` plies deep and returns the best
+        action, trying `first_action` first."""
         if not self.alpha_beta_pruning:
-            return self.minimax(state),None
+            return self.minimax(state, first_action)
 
         else:
-            return self.minimax_with_ab_pruning(state),None
+            return self.minimax_with_ab_pruning(state, first_action)
+
+    def iterative_deepening(self, state, start=None):
+        """Searches `state` one ply deeper at a time, up to `max_depth`,
+        until the time or node budget runs out, and returns the best
+        action of the deepest search that completed. Both budgets are
+        counted from `start` (by default, now), the start of the
+        decision, but the one-ply search always completes, so there is
+        always an action to play (see `_visit`)."""
+        if start is None:
+            start = time.perf_counter()
+        if self.time_limit is not None:
+            self._deadline = start + self.time_limit
+        if self.node_limit is not None:
+            self._node_budget = self.node_limit
+        best_action = None
+        try:
+            for depth in range(1, self.max_depth + 1):
+                self.search_depth = depth
+                action = self._search_root(state, first_action=best_action)
+                best_action = action
+                self.last_depth = depth
+        except _OutOfBudget:
+            pass
+        finally:
+            self._deadline = None
+            self._node_budget = None
+        return best_action
 
-    def minimax(self, state: GameState):
+    def parallel_search(self, state, first_action=None):
+        """Like `search`, but the actions at the root are searched by the
+        worker processes, each as a separate task. The tasks do not
+        share alpha-beta bounds, but the action chosen is the same."""
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self,))
+
+        player = state.current_player
+        children = [(a, state.act(a)) for a in self._ordered(state.actions, first_action)]
+        children = [(a, child) for (a, child) in children if child is not None]
+        time_left = None
+        if self._deadline is not None:
+            time_left = self._deadline - time.perf_counter()
+        node_budget = None
+        if self._node_budget is not None:
+            node_budget = max(0, self._node_budget - self.nodes) // max(1, len(children))
+        table = self.transposition_table
+        generation = None if table is None else table.generation
+        tasks = [(child.game_type, child.encode(), player, self.search_depth, time_left, node_budget,
+                  generation)
+                 for (_, child) in children]
+        results = self._pool.map(_search_subtree, tasks)
+
+        self.nodes += sum(nodes for (_, nodes) in results)
+        if any(value is None for (value, _) in results):
+            raise _OutOfBudget
+        best_action = None
+        best_score = float("-inf")
+        for ((action, _), (score, _)) in zip(children, results):
+            if score > best_score:
+                best_action = action
+                best_score = score
+        self.last_value = best_score
+        return best_action
+
+    def subtree_value(self, state, player):
+        """The value for `player` of `state`, reached by one of `player`'s
+        actions at the root."""
+        return self.min_value(state, player, pruning=self.alpha_beta_pruning)
+
+    def _ordered(self, actions, first_action):
+        """`actions`, with `first_action` moved to the front."""
+        if first_action is None or first_action not in actions:
+            return actions
+        return [first_action] + [a for a in actions if a != first_action]
+
+    def _visit(self):
+        """Counts a position visited by the search, and stops the search
+        if it has run out of budget, unless it is only one ply deep."""
+        self.nodes += 1
+        if self.search_depth == 1:
+            return
+        if self._node_budget is not None and self.nodes > self._node_budget:
+            raise _OutOfBudget
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise _OutOfBudget
+
+    def minimax(self, state: GameState, first_action=None):
         # This is the suggested method you use to do minimax.  Assume
         # `state` is the current state, `player` is the player that
         # the agent is representing (NOT the current player in
@@ -77,7 +290,7 @@ class MinimaxAgent(RandomAgent):
 
         best_action = None
         best_score = float("-inf")
-        for index, action in enumerate(state.actions):
+        for index, action in enumerate(self._ordered(state.actions, first_action)):
 
             # print(str(action) + " score: " + str(self.evaluate(state.act(action), state.current_player)))
             new_state = state.act(action)
@@ -89,13 +302,13 @@ class MinimaxAgent(RandomAgent):
                 if score > best_score:
                     best_action = action
                     best_score = score
+        self.last_value = best_score
         return best_action
 
-    def minimax_with_ab_pruning(self, state):
-        print("WITH AB PRUNING")
+    def minimax_with_ab_pruning(self, state, first_action=None):
         best_action = None
         best_score = float("-inf")
-        for index, action in enumerate(state.actions):
+        for index, action in enumerate(self._ordered(state.actions, first_action)):
 
             # print(str(action) + " score: " + str(self.evaluate(state.act(action), state.current_player)))
             new_state = state.act(action)
@@ -108,13 +321,90 @@ class MinimaxAgent(RandomAgent):
                 if score > best_score:
                     best_action = action
                     best_score = score
+        self.last_value = best_score
         return best_action
 
+    def _cutoff_value(self, state, player):
+        # Soccer states have a reward of 0 until the game is over, but
+        # GameState.reward is None for non-terminal states in general
+        # (e.g. Connect 4), in which case the evaluation function is used.
+        reward = state.reward(player)
+        if reward is None:
+            return self.evaluate(state, player)
+        return reward
+
+    def _cutoff_values(self, states, player):
+        """The values of `states`, reached at the depth limit, as
+        min_value/max_value give them, with every non-terminal state
+        without a reward scored in one call to `batch_evaluate`."""
+        values = [state.reward(player) for state in states]
+        pending = [i for (i, value) in enumerate(values)
+                   if value is None and not states[i].is_terminal]
+        if pending:
+            scores = self.batch_evaluate([states[i].encode() for i in pending], player,
+                                         states[pending[0]].game_type)
+            for (i, score) in zip(pending, scores.tolist()):
+                values[i] = score
+        return values
+
+    def _batched_values(self, state, player, depth, pruning, maximize):
+        """The values of the children of `state`, searched at `depth`, in
+        the order of `state.actions`, if they are worked out with
+        `batch_evaluate`, or None if they are to be searched one by one.
+        `maximize` is True if the children are max nodes.
+
+        Only searches without pruning are batched, as the children after
+        a cutoff would be scored for nothing. Children at the depth
+        limit are scored together. Without a transposition table,
+        nothing is gained by searching the children of a position two
+        plies above the limit one by one, so all of its grandchildren
+        are scored together instead."""
+        if self.batch_evaluate is None or pruning:
+            return None
+        if depth + 1 >= self.search_depth:
+            return self._leaf_values(state, player)
+        if depth + 2 == self.search_depth and self.transposition_table is None:
+            return self._subtree_values(state, player, maximize)
+        return None
+
+    def _leaf_values(self, state, player):
+        """Yields the values of the children of `state`, which are at the
+        depth limit, counting each child as visited when it is
+        yielded."""
+        children = [child for child in map(state.act, state.actions) if child is not None]
+        for value in self._cutoff_values(children, player):
+            self._visit()
+            yield value
+
+    def _subtree_values(self, state, player, maximize):
+        """Yields the values of the children of `state`, which is two
+        plies above the depth limit: the largest (if `maximize`) or
+        smallest value of each child's children, all of which are
+        scored together."""
+        children = [child for child in map(state.act, state.actions) if child is not None]
+        families = [[] if child.is_terminal else
+                    [leaf for leaf in map(child.act, child.actions) if leaf is not None]
+                    for child in children]
+        values = iter(self._cutoff_values([leaf for family in families for leaf in family], player))
+        for (child, family) in zip(children, families):
+            self._visit()
+            if child.is_terminal:
+                yield child.reward(player)
+                continue
+            best = float("-inf") if maximize else float("inf")
+            for _ in family:
+                self._visit()
+                value = next(values)
+                if (value > best) if maximize else (value < best):
+                    best = value
+            yield best
+
     def min_value(self, state: GameState, player, depth: int = 1, pruning: bool = False, alpha: float = float("-inf"),
                   beta: float = float("inf")):
         # TODO un-combine reward and evaluation
         # print(state)
 
+        self._visit()
         spaces = ""
         for i in range(0, depth):
             spaces += "    "
@@ -123,35 +413,54 @@ class MinimaxAgent(RandomAgent):
         if state.is_terminal:
             return state.reward(player) # + self.evaluate(state, player)
         # If we reached the max search depth, return the utility
-        if depth >= self.max_depth:
+        if depth >= self.search_depth:
             # print('EVAL SP\n', self.evaluate(state,player))
-            return state.reward(player)
+            return self._cutoff_value(state, player)
+
+        # The value depends on whose payoff is searched for, as well as
+        # on the position.
+        table = self.transposition_table
+        if table is not None:
+            key = (state, player)
+            entry = table.probe(key, self.search_depth - depth)
+            if entry is not None and table.cutoff(entry[0], entry[1], alpha, beta):
+                return entry[0]
+            window = (alpha, beta)
 
         smallest_score = float("inf")
-        for index, action in enumerate(state.actions):
-            new_state = state.act(action)
-            if new_state is not None:
-                #print(str(spaces) + str(alpha) + ", " + str(beta))
-                #print(spaces + str(action))
-                score = self.max_value(new_state, player, depth=depth + 1, pruning=pruning, alpha=alpha, beta=beta)
-                #print(spaces + str(action) + ": " + str(score))
+        batch = self._batched_values(state, player, depth, pruning, maximize=True)
+        if batch is not None:
+            for score in batch:
                 if score < smallest_score:
-                    #print(spaces + "New Smallest Score")
                     smallest_score = score
-            if pruning:
-                if smallest_score <= alpha:
-                    #print(spaces + "pruned")
-                    #print(spaces + "score: " + str(smallest_score) + " <= alpha: " + str(alpha))
-                    return smallest_score
-
-                beta = min(beta, smallest_score)
-                #if smallest_score < beta:
-                    #print(spaces + "Beta: " + str(beta))
+        else:
+            for index, action in enumerate(state.actions):
+                new_state = state.act(action)
+                if new_state is not None:
+                    #print(str(spaces) + str(alpha) + ", " + str(beta))
+                    #print(spaces + str(action))
+                    score = self.max_value(new_state, player, depth=depth + 1, pruning=pruning, alpha=alpha, beta=beta)
+                    #print(spaces + str(action) + ": " + str(score))
+                    if score < smallest_score:
+                        #print(spaces + "New Smallest Score")
+                        smallest_score = score
+                if pruning:
+                    if smallest_score <= alpha:
+                        #print(spaces + "pruned")
+                        #print(spaces + "score: " + str(smallest_score) + " <= alpha: " + str(alpha))
+                        break
+
+                    beta = min(beta, smallest_score)
+                    #if smallest_score < beta:
+                        #print(spaces + "Beta: " + str(beta))
+        if table is not None:
+            table.store(key, self.search_depth - depth, smallest_score, table.bound(smallest_score, *window))
         return smallest_score
 
     def max_value(self, state: GameState, player, depth: int = 1, pruning: bool = False, alpha: float = float("-inf"),
                   beta: float = float("inf")):
         # print(state)
+        self._visit()
         spaces = ""
         for i in range(0, depth):
             spaces += "    "
@@ -159,39 +468,581 @@ class MinimaxAgent(RandomAgent):
         if state.is_terminal:
             return state.reward(player) #  + self.evaluate(state, player)
         # If we reached the max search depth, return the utility
-        if depth >= self.max_depth:
-            return state.reward(player)
+        if depth >= self.search_depth:
+            return self._cutoff_value(state, player)
+
+        table = self.transposition_table
+        if table is not None:
+            key = (state, player)
+            entry = table.probe(key, self.search_depth - depth)
+            if entry is not None and table.cutoff(entry[0], entry[1], alpha, beta):
+                return entry[0]
+            window = (alpha, beta)
 
         biggest_score = float("-inf")
-        for index, action in enumerate(state.actions):
-            new_state = state.act(action)
-            if new_state is not None:
-                #print(str(spaces) + str(alpha) + ", " + str(beta))
-                #print(spaces + str(action))
-                score = self.min_value(new_state, player, depth=depth + 1, pruning=pruning, alpha=alpha, beta=beta)
-                #print(spaces + str(action) + ": " + str(score))
+        batch = self._batched_values(state, player, depth, pruning, maximize=False)
+        if batch is not None:
+            for score in batch:
                 if score > biggest_score:
-                    #print(spaces + "New Biggest Score")
                     biggest_score = score
-            if pruning:
-                if biggest_score >= beta:
-                    #print(spaces + "pruned")
-                    #print(spaces + "score: " + str(biggest_score) + " >= beta: " + str(beta))
-                    return biggest_score
-                alpha = max(alpha, biggest_score)
-                #if biggest_score > alpha:
-                    #print(spaces + "Alpha: " + str(alpha))
-
+        else:
+            for index, action in enumerate(state.actions):
+                new_state = state.act(action)
+                if new_state is not None:
+                    #print(str(spaces) + str(alpha) + ", " + str(beta))
+                    #print(spaces + str(action))
+                    score = self.min_value(new_state, player, depth=depth + 1, pruning=pruning, alpha=alpha, beta=beta)
+                    #print(spaces + str(action) + ": " + str(score))
+                    if score > biggest_score:
+                        #print(spaces + "New Biggest Score")
+                        biggest_score = score
+                if pruning:
+                    if biggest_score >= beta:
+                        #print(spaces + "pruned")
+                        #print(spaces + "score: " + str(biggest_score) + " >= beta: " + str(beta))
+                        break
+                    alpha = max(alpha, biggest_score)
+                    #if biggest_score > alpha:
+                        #print(spaces + "Alpha: " + str(alpha))
+
+        if table is not None:
+            table.store(key, self.search_depth - depth, biggest_score, table.bound(biggest_score, *window))
         return biggest_score
 
+class NegamaxAgent(MinimaxAgent):
+    """A MinimaxAgent that always prunes, written as a single negamax
+    search with alpha-beta bounds passed down through every level,
+    including the root, and with move ordering:
+
+    1. the best action found for the position by an earlier search
+       (the previous iteration at the root when deepening, or the
+       transposition table elsewhere),
+    2. kicking, when the player has the ball,
+    3. the other actions, by how often they caused a cutoff before
+       (the history heuristic).
+
+    Payoffs are still those of the player the agent decides for, with
+    the sign flipped at the opponent's turns, so it picks an action of
+    the same value as MinimaxAgent at the same depth. Ties may be
+    broken differently, since actions are tried in a different order.
+
+    Besides `nodes`, the agent counts `cutoffs`, the number of
+    positions whose remaining actions were pruned.
+
+    :param ordering: False to try actions in the order `state.actions`
+        gives them.
+
+    The other parameters are those of MinimaxAgent.
+    """
+    # Tried before the other actions whenever they are available.
+    PRIORITY_ACTIONS = (Action.KICK,)
+
+    def __init__(self, evaluate_function, max_depth=5, transposition_table_size=None,
+                 time_limit=None, node_limit=None, workers=None, ordering=True):
+        super().__init__(evaluate_function, True, max_depth,
+                         transposition_table_size=transposition_table_size,
+                         time_limit=time_limit, node_limit=node_limit, workers=workers)
+        self.ordering = ordering
+        self.cutoffs = 0
+        self.history = defaultdict(int)
+
+    def decide(self, state: GameState, lm, lo):
+        self.cutoffs = 0
+        self.history.clear()
+        return super().decide(state, lm, lo)
+
+    def search(self, state, first_action=None):
+        player = state.current_player
+        (alpha, beta) = (float("-inf"), float("inf"))
+        best_action = None
+        for action in self.order(state, first_action):
+            new_state = state.act(action)
+            if new_state is not None:
+                score = -self.negamax(new_state, player, 1, -beta, -alpha, -1)
+                if score > alpha or best_action is None:
+                    best_action = action
+                    alpha = max(alpha, score)
+        self.last_value = alpha
+        return best_action
+
+    def subtree_value(self, state, player):
+        return -self.negamax(state, player, 1, float("-inf"), float("inf"), -1)
+
+    def order(self, state, best_action=None):
+        """The actions of `state` in the order they should be searched."""
+        actions = list(state.actions)
+        if not self.ordering:
+            return actions
+        history = self.history
+        player = state.current_player
+        actions.sort(key=lambda a: -history[player, a])
+        for action in reversed(self.PRIORITY_ACTIONS + (best_action,)):
+            if action is not None and action in actions:
+                actions.remove(action)
+                actions.insert(0, action)
+        return actions
+
+    def negamax(self, state, player, depth, alpha, beta, color):
+        """The value of `state` for the player to move, searched to
+        `search_depth` with the window (`alpha`, `beta`): the payoff of
+        `player` times `color`, which is 1 at `player`'s turns and -1
+        at the opponent's."""
+        self._visit()
+        if state.is_terminal:
+            return color * state.reward(player)
+        if depth >= self.search_depth:
+            return color * self._cutoff_value(state, player)
+
+        remaining = self.search_depth - depth
+        table = self.transposition_table
+        best_action = None
+        if table is not None:
+            key = (state, player)
+            entry = table.probe(key, remaining)
+            if entry is not None and table.cutoff(entry[0], entry[1], alpha, beta):
+                return entry[0]
+            best_action = table.best_action(key)
+            window = (alpha, beta)
+
+        best_score = float("-inf")
+        for action in self.order(state, best_action):
+            new_state = state.act(action)
+            if new_state is None:
+                continue
+            score = -self.negamax(new_state, player, depth + 1, -beta, -alpha, -color)
+            if score > best_score:
+                best_score = score
+                best_action = action
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.cutoffs += 1
+                self.history[state.current_player, action] += remaining * remaining
+                break
+
+        if table is not None:
+            table.store(key, remaining, best_score, table.bound(best_score, *window), best_action)
+        return best_score
+
+
+class _Node:
+    """A position in an MCTSAgent's tree.
+
+    `total` adds up the payoffs, from the playouts through this node,
+    of the player who moved into it (`mover`), so that its parent can
+    pick the child best for the player to move there."""
+    __slots__ = ('state', 'mover', 'children', 'untried', 'visits', 'total')
+
+    def __init__(self, state, mover):
+        self.state = state
+        self.mover = mover
+        # Expanded children by action, and actions not yet expanded.
+        self.children = {}
+        self.untried = [] if state.is_terminal else list(state.actions)
+        self.visits = 0
+        self.total = 0.0
+
+
+class MCTSAgent(Agent):
+    """An agent that makes decisions by Monte Carlo tree search with the
+    UCT rule, using nothing but the GameState interface (`actions`,
+    `act`, `is_terminal`, `reward`), so it plays any game.
+
+    Each simulation walks down the tree, at each position taking the
+    child with the best upper confidence bound
+
+        total / visits + exploration * sqrt(ln(parent visits) / visits)
+
+    until it reaches a position with actions not yet tried, adds the
+    child of one of them, and plays random actions from there to the
+    end of the game or for `playout_depth` plies. Payoffs are
+    `reward / 10`, in [-1, 1] for the games here, and a playout that
+    is cut off counts as a draw unless `evaluate_function` is given.
+    The action played is the one simulated most often.
+
+    The subtree of the position the opponent's answer leads to is kept
+    for the next decision, so the simulations that went through it
+    are not lost. The opponent's most simulated answer to the action
+    played is returned as the prediction of its next action.
+
+    `simulations` and `nodes` (positions generated, in the tree and in
+    the playouts) count the work of the last decision, and `reused`
+    the simulations it started with from the previous one.
+
+    :param simulations: The most simulations per decision.
+
+    :param time_limit: If given, the most seconds per decision. The
+        search stops at whichever budget runs out first; at least one
+        of them must be given.
+
+    :param exploration: The weight of the exploration term of UCT.
+
+    :param playout_depth: The most random actions per playout.
+
+    :param evaluate_function: If given, scores the positions where a
+        playout is cut off, with the parameters (state, player_id); the
+        payoff is then tanh(score / evaluation_scale) instead of 0.
+
+    :param evaluation_scale: See `evaluate_function`.
+    """
+
+    def __init__(self, simulations=1000, time_limit=None, exploration=math.sqrt(2),
+                 playout_depth=50, evaluate_function=None, evaluation_scale=10.0):
+        super().__init__()
+        if simulations is None and time_limit is None:
+            raise ValueError("MCTSAgent needs a simulation budget, a time limit or both.")
+        self.max_simulations = simulations
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.playout_depth = playout_depth
+        self.evaluate = evaluate_function
+        self.evaluation_scale = evaluation_scale
+        self.simulations = 0
+        self.nodes = 0
+        self.reused = 0
+        # The node of the position after the agent's last action.
+        self._root = None
+
+    def decide(self, state: GameState, lm, lo):
+        root = self._reused_root(state)
+        if root is None:
+            root = _Node(state, None)
+        self.reused = root.visits
+        self.simulations = 0
+        self.nodes = 0
+
+        deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        while root.untried or root.children:
+            if self.max_simulations is not None and self.simulations >= self.max_simulations:
+                break
+            if deadline is not None and self.simulations and time.perf_counter() > deadline:
+                break
+            self._simulate(root)
+            self.simulations += 1
+
+        if not root.children:
+            # Every action was invalid; let the game report it.
+            self._root = None
+            return state.actions[0], None
+        (action, child) = max(root.children.items(), key=lambda item: item[1].visits)
+        self._root = child
+        pred = None
+        if child.children:
+            pred = max(child.children.items(), key=lambda item: item[1].visits)[0]
+        return action, pred
+
+    def _reused_root(self, state):
+        """The node of `state` in the tree kept from the last decision,
+        among the positions the opponent could have moved to, if it was
+        simulated there."""
+        last = self._root
+        self._root = None
+        if last is None:
+            return None
+        for child in last.children.values():
+            if child.state == state:
+                child.mover = None
+                return child
+        return None
+
+    def _simulate(self, root):
+        """Runs one simulation from `root` and backs up its payoffs."""
+        node = root
+        path = [node]
+        # Selection: down through positions whose actions have all
+        # been tried.
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            exploration = self.exploration
+            best = None
+            best_bound = float("-inf")
+            for child in node.children.values():
+                bound = child.total / child.visits + exploration * math.sqrt(log_visits / child.visits)
+                if bound > best_bound:
+                    best = child
+                    best_bound = bound
+            node = best
+            path.append(node)
+
+        # Expansion: the child of one untried action. Actions whose
+        # successor is None are dropped.
+        untried = node.untried
+        while untried:
+            action = untried.pop(random.randrange(len(untried)))
+            new_state = node.state.act(action)
+            self.nodes += 1
+            if new_state is not None:
+                child = node.children[action] = _Node(new_state, node.state.current_player)
+                node = child
+                path.append(node)
+                break
+
+        payoffs = self._playout(node.state)
+        for node in path:
+            node.visits += 1
+            if node.mover is not None:
+                node.total += payoffs[node.mover]
+
+    def _playout(self, state):
+        """Plays random actions from `state`, and returns the payoff of
+        each player where the playout ends."""
+        for _ in range(self.playout_depth):
+            if state.is_terminal:
+                break
+            actions = list(state.actions)
+            new_state = None
+            while new_state is None and actions:
+                new_state = state.act(actions.pop(random.randrange(len(actions))))
+                self.nodes += 1
+            if new_state is None:
+                break
+            state = new_state
+        players = range(state.num_players)
+        if state.is_terminal:
+            return [state.reward(p) / 10 for p in players]
+        if self.evaluate is None:
+            return [0.0 for p in players]
+        return [math.tanh(self.evaluate(state, p) / self.evaluation_scale) for p in players]
+
+
+class OpponentTables:
+    """The Q, N and C tables of OpponentLearning as NumPy arrays.
+
+    States are numbered in the order they are first counted (see
+    `state_id`) and actions by their position in `ACTIONS`, so that
+
+        N[s]          is how often state s was decided in,
+        C[s, a2]      how often the opponent answered a2 there, and
+        Q[s, a1, a2]  the value of playing a1 against a2 from s.
+
+    Q entries that were never read hold NaN. They are drawn from
+    U(0, 1) the first time they are read, in the order they are read,
+    so the values match those of the defaultdicts the tables replace.
+    Looking a state up never gives it a row: only `state_id(state,
+    create=True)`, for the states OpponentLearning decides in, does.
+    The arrays double in length whenever they run out of rows.
+
+    With `max_states`, the tables never hold more than that many states
+    (each takes `ROW_BYTES` bytes of arrays). Once they are full, the
+    row of the least visited state (by N) is given to each new state,
+    which starts over with N and C at 0 and Q unread. Candidates for
+    eviction are picked `max_states // EVICT_FRACTION` at a time, by
+    their N when picked, so that the rows are not all compared on
+    every new state. `evictions` counts the states evicted.
+
+    `save` writes the tables as .npy files and `load` memory-maps them
+    back, copy-on-write. The states of loaded tables are not all put
+    in `ids` up front, which would take seconds for millions of them:
+    each is found by its hash, in the saved keys, the first time it is
+    looked up. A large table is then ready at once, and only the rows
+    that are used are read.
+
+    """
+    # Hashes are only compared to those of the same Python (see load).
+    _HASH_CHECK = hash((1, -2, 3))
+    ROW_BYTES = 8 * (1 + len(ACTIONS) + len(ACTIONS) ** 2)
+    EVICT_FRACTION = 16
+
+    def __init__(self, capacity=1024, max_states=None):
+        if max_states is not None and max_states < 1:
+            raise ValueError("The tables need room for at least one state.")
+        # The row of every state looked up so far, the key of each row
+        # (None for loaded rows not looked up yet), and the number of
+        # rows in use.
+        self.ids = {}
+        self.row_keys = []
+        self.size = 0
+        self.max_states = max_states
+        if max_states is not None:
+            capacity = min(capacity, max_states)
+        self.evictions = 0
+        # Rows to evict next, least visited first.
+        self._victims = []
+        # The keys of loaded tables (see load), or None, and the loaded
+        # rows that have since been given to other states.
+        self._saved = None
+        self._replaced = set()
+        self.actions = {a: i for (i, a) in enumerate(ACTIONS)}
+        self.N = np.zeros(capacity)
+        self.C = np.zeros((capacity, len(ACTIONS)))
+        self.Q = np.full((capacity, len(ACTIONS), len(ACTIONS)), np.nan)
+
+    def __len__(self):
+        return self.size
+
+    def state_id(self, state, create=False):
+        """The row of `state`, or -1 if it has none and `create` is
+        False."""
+        key = state.key
+        s = self.ids.get(key, -1)
+        if s < 0 and self._saved is not None:
+            s = self._saved_id(key)
+        if s < 0 and create:
+            if self.max_states is not None and self.size >= self.max_states:
+                s = self._evict()
+                self.row_keys[s] = key
+            else:
+                s = self.size
+                self.size += 1
+                self.row_keys.append(key)
+                if s == len(self.N):
+                    self._grow()
+            self.ids[key] = s
+        return s
+
+    def _evict(self):
+        """Empties the row of the least visited state and returns it."""
+        if not self._victims:
+            count = max(1, self.max_states // self.EVICT_FRACTION)
+            order = np.argsort(self.N[:self.size], kind='stable')[:count]
+            self._victims = order[::-1].tolist()
+        s = self._victims.pop()
+        key = self.row_keys[s]
+        if key is None:
+            key = tuple(self._saved[0][s].tolist())
+        self.ids.pop(key, None)
+        if self._saved is not None and s < len(self._saved[0]):
+            self._replaced.add(s)
+        self.N[s] = 0
+        self.C[s] = 0
+        self.Q[s] = np.nan
+        self.evictions += 1
+        return s
+
+    @property
+    def nbytes(self):
+        """The memory taken by the N, C and Q arrays."""
+        return self.N.nbytes + self.C.nbytes + self.Q.nbytes
+
+    def _saved_id(self, key):
+        """The row of `key` among the loaded keys, or -1."""
+        (keys, hashes, order, sorted_hashes) = self._saved
+        h = hash(key)
+        i = int(sorted_hashes.searchsorted(h))
+        while i < len(sorted_hashes) and sorted_hashes[i] == h:
+            s = int(order[i])
+            if s not in self._replaced and tuple(keys[s].tolist()) == key:
+                self.ids[key] = s
+                self.row_keys[s] = key
+                return s
+            i += 1
+        return -1
+
+    def q(self, s, a1, a2):
+        """Reads Q[s, a1, a2], drawing it first if it was never read."""
+        if np.isnan(self.Q[s, a1, a2]):
+            self.Q[s, a1, a2] = np.random.uniform(0,1)
+        return self.Q[s, a1, a2]
+
+    def _grow(self):
+        n = max(len(self.N), 1)
+        if self.max_states is not None:
+            n = min(n, self.max_states - len(self.N))
+        self.N = np.concatenate([self.N, np.zeros(n)])
+        self.C = np.concatenate([self.C, np.zeros((n, len(ACTIONS)))])
+        self.Q = np.concatenate([self.Q, np.full((n, len(ACTIONS), len(ACTIONS)), np.nan)])
+
+    def keys(self):
+        """The key of the state of each row in use, as a (rows, key
+        length) array."""
+        if self._saved is None:
+            if not self.size:
+                return np.zeros((0, 0), np.int64)
+            return np.array(self.row_keys, dtype=np.int64)
+        saved = self._saved[0]
+        keys = np.zeros((self.size, saved.shape[1]), np.int64)
+        keys[:len(saved)] = saved
+        known = [s for (s, key) in enumerate(self.row_keys) if key is not None]
+        if known:
+            keys[known] = [self.row_keys[s] for s in known]
+        return keys
+
+    def save(self, directory):
+        """Writes the rows in use to `directory`: `N.npy`, `C.npy` and
+        `Q.npy`, `keys.npy`, the key (see GameState.key) of each state,
+        `hashes.npy`, the hash of each key, and `order.npy`, the rows
+        in the order of their hashes. Keys must be tuples of integers
+        of the same length, as those of soccer states are."""
+        os.makedirs(directory, exist_ok=True)
+        n = self.size
+        keys = self.keys()
+        hashes = np.empty(n, np.int64)
+        if self._saved is None:
+            hashes[:] = [hash(tuple(key)) for key in keys.tolist()] if n else []
+        else:
+            # Only the hashes of rows given to new states are worked out.
+            saved = len(self._saved[0])
+            hashes[:saved] = self._saved[1]
+            changed = sorted(self._replaced) + list(range(saved, n))
+            hashes[changed] = [hash(tuple(key)) for key in keys[changed].tolist()]
+        np.save(os.path.join(directory, 'keys.npy'), keys)
+        np.save(os.path.join(directory, 'hashes.npy'), np.append(hashes, self._HASH_CHECK))
+        np.save(os.path.join(directory, 'order.npy'), np.argsort(hashes, kind='stable'))
+        for name in ('N', 'C', 'Q'):
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name)[:n])
+
+    @classmethod
+    def load(cls, directory, mmap_mode='c', max_states=None):
+        """Reads tables written by `save`. By default N, C and Q are
+        memory-mapped copy-on-write: changes to them are not written
+        back. Tables saved by a Python that hashes tuples differently
+        have all their keys put in `ids` instead. `max_states` must
+        leave room for every saved state."""
+        tables = cls(capacity=0, max_states=max_states)
+        keys = np.load(os.path.join(directory, 'keys.npy'), mmap_mode='r')
+        hashes = np.load(os.path.join(directory, 'hashes.npy'), mmap_mode='r')
+        if max_states is not None and len(keys) > max_states:
+            raise ValueError("{} states were saved, more than max_states.".format(len(keys)))
+        tables.size = len(keys)
+        if hashes[-1] == cls._HASH_CHECK:
+            order = np.load(os.path.join(directory, 'order.npy'), mmap_mode='r')
+            tables._saved = (keys, hashes[:-1], order, hashes[order])
+            tables.row_keys = [None] * len(keys)
+        else:
+            tables.row_keys = list(map(tuple, keys.tolist()))
+            tables.ids = dict(zip(tables.row_keys, range(len(keys))))
+        for name in ('N', 'C', 'Q'):
+            setattr(tables, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode))
+        return tables
+
+
+def _initial_q():
+    # A module-level function rather than a lambda so that the agent
+    # can be pickled (e.g. by Tournament).
+    return np.random.uniform(0,1)
+
+
 class OpponentLearning(Agent):
-    def __init__(self, evaluate_function,learning_rate,discount_factor , me , opp):
+    """Learns a Q value for each pair of its own and its opponent's
+    actions, together with how often the opponent chose each action
+    (C) in each state it decided in (N), and plays the action with the
+    best expected value against that model of the opponent.
+
+    :param tables: 'dense' (the default) keeps Q, N and C as NumPy
+        arrays in an OpponentTables, `self.tables`, and computes the
+        expected values of all actions in one go; 'dict' keeps them
+        as the defaultdicts `self.Q`, `self.N` and `self.C`. Both make
+        the same decisions. Only dense tables can be saved and loaded.
+
+    :param max_states: If given, the most states the dense tables hold,
+        evicting the least visited ones beyond that (see
+        OpponentTables).
+    """
+    learning = True
+
+    def __init__(self, evaluate_function,learning_rate,discount_factor , me , opp, tables='dense',
+                 max_states=None):
         super().__init__()
         self.evaluate = evaluate_function
         self.learning_rate = learning_rate
         self.discount_factor = discount_factor
         
-        self.Q = defaultdict(lambda: np.random.uniform(0,1))
+        if tables not in ('dense', 'dict'):
+            raise ValueError("Unknown table type '{}'. Choose either 'dense' or 'dict'.".format(tables))
+        if tables == 'dict' and max_states is not None:
+            raise ValueError("Only dense tables can be bounded.")
+        self.max_states = max_states
+        self.tables = OpponentTables(max_states=max_states) if tables == 'dense' else None
+        self.Q = defaultdict(_initial_q)
         self.N = defaultdict(float)
         self.C = defaultdict(float)
 
@@ -204,6 +1055,8 @@ class OpponentLearning(Agent):
         # self.writer = csv.writer(csv_save)
 
     def decide(self, state , last_act_m, last_act_o):
+        if self.tables is not None:
+            return self._decide_dense(state, last_act_m, last_act_o)
 
         #print(state.current_player)
         # self.me = state.current_player
@@ -253,41 +1106,24 @@ class OpponentLearning(Agent):
         #     # print("here")
         #     self.writer.writerow(['new game' , 'start'])
 
-        if last_act_o is not None and last_act_m is not None:
-            # print('p0')
-            p1_act = state.acts
-            # print('p1_act' , p1_act)
-            # print(len(p1_act))
-            
-            
-            act_vals = np.zeros(len(p1_act))
-            for i, a1 in enumerate(p1_act):
-                # print('action casuning problem  ' , a1)
-                next_state = state.act(a1)
-                if next_state is None:
-                    p1_act.remove(a1)
-                    act_vals = np.delete(act_vals, i)
-                    continue
-                # print('p1')
-                p2_act = next_state.acts
-                if next_state is not None:
-                    for a2 in p2_act:
-                        if self.N[next_state] != 0:
-                            p = (self.C[next_state,a2]/self.N[next_state])
-                            act_vals[i] += p*self.Q[next_state,a1,a2]
+        # The successors and the expected values of the actions are
+        # worked out once, for the update and the choice (see
+        # _decide_dense).
+        (p1_act, act_vals, pred, children) = self._dict_action_values(state)
 
+        if last_act_o is not None and last_act_m is not None:
             # print('act vals  ' , act_vals)
             V_ns = max(act_vals)
             # print('vns  ' , V_ns)
             rand_o = np.random.choice(np.flatnonzero(act_vals == act_vals.max()))
             # print('rANDD  '  , rand_o)
             a_m = p1_act[rand_o]
-            next_state = state.act(a_m)
+            next_state = children[a_m] if a_m in children else state.act(a_m)
 
             if next_state is None:
-                print('none state')
-                print(a_m)
-
+                # The action changes nothing (the game asks again), so
+                # the reward is that of staying put.
+                next_state = state
 
             r = next_state.rewardOM(self.me)
             
@@ -313,6 +1149,8 @@ class OpponentLearning(Agent):
             self.Q[state,last_act_m,last_act_o] = (1- self.learning_rate)*self.Q[state,last_act_m,last_act_o] + self.learning_rate*(r + self.discount_factor*V_ns)
             # print(self.Q[state,last_act_m,last_act_o])
             self.C[state,last_act_o] += 1
+            if state in children.values():
+                (p1_act, act_vals, pred, children) = self._dict_action_values(state)
             
             
         # print('p0')
@@ -335,33 +1173,6 @@ class OpponentLearning(Agent):
 
 
 
-        # print('p0')
-        p1_act = state.acts
-        # print('p1_act' , p1_act)
-        # print(len(p1_act))
-        
-        act_vals = np.zeros(len(p1_act))
-        for i, a1 in enumerate(p1_act):
-            # print('action casuning problem  ' , a1)
-            next_state = state.act(a1)
-            if next_state is None:
-                p1_act.remove(a1)
-                act_vals = np.delete(act_vals, i)
-                continue
-            # print('p1')
-            p2_act = next_state.acts
-            if next_state is not None:
-                for a2 in p2_act:
-                    # print('in loop a2  ' , N[next_state])
-                    if self.N[next_state] != 0:
-                        p = (self.C[next_state,a2]/self.N[next_state])
-                        if p > pred_p:
-                            pred = a2
-                            pred_p = p
-                        # print('            ******    ' , a2 , p)
-                        act_vals[i] += p*self.Q[next_state,a1,a2]
-
-        
         rand_i = np.random.choice(np.flatnonzero(act_vals == act_vals.max()))
         # print('index ' ,rand_i)
         a_m = p1_act[rand_i]
@@ -451,9 +1262,306 @@ class OpponentLearning(Agent):
 
    
 
+    def _dict_action_values(self, state):
+        """`_action_values` with the dicts."""
+        pred_p = -1
+        pred = None
+        children = {}
+        p1_act = list(state.acts)
+        act_vals = np.zeros(len(p1_act))
+        for i, a1 in enumerate(p1_act):
+            next_state = state.act(a1)
+            children[a1] = next_state
+            if next_state is None:
+                p1_act.remove(a1)
+                act_vals = np.delete(act_vals, i)
+                continue
+            p2_act = next_state.acts
+            for a2 in p2_act:
+                # .get, so that looking does not add entries.
+                if self.N.get(next_state, 0) != 0:
+                    p = (self.C.get((next_state,a2), 0.0)/self.N[next_state])
+                    if p > pred_p:
+                        pred = a2
+                        pred_p = p
+                    act_vals[i] += p*self.Q[next_state,a1,a2]
+        return (p1_act, act_vals, pred, children)
+
+    def save(self, directory):
+        """Saves the Q, N and C tables to `directory` (see
+        OpponentTables.save)."""
+        if self.tables is None:
+            raise ValueError("Only dense tables can be saved.")
+        self.tables.save(directory)
+
+    def load(self, directory, mmap_mode='c'):
+        """Replaces the Q, N and C tables with those saved to `directory`,
+        memory-mapped (see OpponentTables.load)."""
+        if self.tables is None:
+            raise ValueError("Only dense tables can be loaded.")
+        self.tables = OpponentTables.load(directory, mmap_mode, self.max_states)
+
+    def _decide_dense(self, state, last_act_m, last_act_o):
+        """`decide` with the OpponentTables: the same steps, in the same
+        order and with the same random draws, as with the dicts.
+
+        The successors of `state` and the expected values of its actions
+        are worked out once, for both the update and the choice. The
+        update only changes the row of `state`, which is not one of its
+        successors' (they have another player to move), so the values
+        would come out the same the second time; they are only worked
+        out again if a successor is `state` itself."""
+        tables = self.tables
+        s = tables.state_id(state, create=True)
+        tables.N[s] += 1
+        (p1_act, act_vals, pred, children) = self._action_values(state)
 
+        if last_act_o is not None and last_act_m is not None:
+            V_ns = max(act_vals)
+            rand_o = np.random.choice(np.flatnonzero(act_vals == act_vals.max()))
+            a_m = p1_act[rand_o]
+            next_state = children[a_m] if a_m in children else state.act(a_m)
+
+            if next_state is None:
+                next_state = state
+
+            r = next_state.rewardOM(self.me)
+            (m, o) = (tables.actions[last_act_m], tables.actions[last_act_o])
+            tables.Q[s, m, o] = (1- self.learning_rate)*tables.q(s, m, o) + self.learning_rate*(r + self.discount_factor*V_ns)
+            tables.C[s, o] += 1
+            if state in children.values():
+                (p1_act, act_vals, pred, children) = self._action_values(state)
+
+        rand_i = np.random.choice(np.flatnonzero(act_vals == act_vals.max()))
+        a_m = p1_act[rand_i]
+        return a_m, pred
+
+    def _action_values(self, state):
+        """Returns the actions of `state` that are considered, the expected
+        value of each against the opponent model, the opponent's most
+        likely answer, and the successor of `state` each action that
+        was looked at leads to, as a dict.
+
+        The expected value of a1 is the sum over the opponent's actions
+        a2 of C[s', a2] / N[s'] * Q[s', a1, a2], where s' is the state
+        a1 leads to. It is computed for every a1 at once; the sums are
+        taken as cumulative sums over a2 so that they add up in the same
+        order (and to the same floats) as the loops of `decide`.
+        """
+        tables = self.tables
+        p1_act = list(state.acts)
+        act_vals = np.zeros(len(p1_act))
+        # The list is changed while it is walked, exactly as in
+        # `decide`, so the same actions are skipped.
+        (rows, ids, moves, options) = ([], [], [], [])
+        children = {}
+        for i, a1 in enumerate(p1_act):
+            next_state = state.act(a1)
+            children[a1] = next_state
+            if next_state is None:
+                p1_act.remove(a1)
+                act_vals = np.delete(act_vals, i)
+                continue
+            s = tables.state_id(next_state)
+            if s >= 0 and tables.N[s] != 0:
+                rows += [i]
+                ids += [s]
+                moves += [tables.actions[a1]]
+                options += [[a in next_state.acts for a in ACTIONS]]
+        if not rows:
+            return (p1_act, act_vals, None, children)
+
+        ids = np.array(ids)
+        moves = np.array(moves)
+        options = np.array(options)
+        p = tables.C[ids] / tables.N[ids][:, None]
+        q = tables.Q[ids, moves]
+        unread = options & np.isnan(q)
+        if unread.any():
+            q[unread] = np.random.uniform(0, 1, unread.sum())
+            tables.Q[ids, moves] = q
+        act_vals[rows] = np.cumsum(np.where(options, p * q, 0.0), axis=1)[:, -1]
+
+        # The first of the likeliest answers, in the order `decide`
+        # looks at them.
+        likelihood = np.where(options, p, -1.0)
+        best = np.argmax(likelihood)
+        pred = ACTIONS[best % len(ACTIONS)] if likelihood.flat[best] > -1 else None
+        return (p1_act, act_vals, pred, children)
+
+
+class ExpectimaxAgent(MinimaxAgent):
+    """A MinimaxAgent that expects the opponent to answer the way it has
+    answered before, rather than the way that is worst for the agent.
+
+    The agent counts, in an OpponentTables, how often it has seen each
+    position with the opponent to move (N) and how often the opponent
+    gave each answer there (C). Where a position was seen at least
+    `min_visits` times, the search takes the expected value of the
+    opponent's answers there, answer a2 weighted by C[s, a2] / N[s].
+    Answers less likely than `min_probability` are not searched, and
+    the probabilities of the others are scaled up to add up to 1. At
+    the opponent's other positions the search takes the smallest
+    value, as MinimaxAgent does, and at the agent's own the largest.
+    There is no alpha-beta pruning.
+
+    The counts carry over from game to game. `expected`, `minimized`
+    and `pruned` count the opponent positions of the last decision
+    searched each way and the answers skipped. The opponent's likeliest
+    answer to the action played, if it was seen, is returned as the
+    prediction of its next action.
+
+    Actions are numbered by their position in ACTIONS, as in
+    OpponentLearning, so the agent plays soccer.
+
+    :param min_visits: How often a position must have been seen for
+        the opponent's answers there to be weighted by their counts.
+
+    :param min_probability: The least likely answer that is searched.
+
+    :param tables: The OpponentTables to count in, e.g. counts saved
+        by an earlier run (see `save`) and read back with
+        OpponentTables.load. New tables by default.
+
+    :param max_states: If given, the most states new tables hold (see
+        OpponentTables).
+
+    :param evaluate_cutoffs: If True (the default), positions at the
+        depth limit are scored by the evaluation function. MinimaxAgent
+        gives soccer positions there their reward, 0 until the game is
+        over, which would make every expected value short of a goal
+        the same; False keeps MinimaxAgent's values.
+
+    The other parameters are those of MinimaxAgent.
+    """
+    learning = True
+
+    def __init__(self, evaluate_function, max_depth=3, min_visits=3, min_probability=0.05,
+                 tables=None, max_states=None, evaluate_cutoffs=True, time_limit=None,
+                 node_limit=None):
+        super().__init__(evaluate_function, False, max_depth, time_limit=time_limit,
+                         node_limit=node_limit)
+        self.evaluate_cutoffs = evaluate_cutoffs
+        self.min_visits = min_visits
+        self.min_probability = min_probability
+        self.tables = tables if tables is not None else OpponentTables(max_states=max_states)
+        self.expected = 0
+        self.minimized = 0
+        self.pruned = 0
+        # The position the agent's last action led to.
+        self._last = None
+
+    def decide(self, state: GameState, lm, lo):
+        self._observe(state)
+        self.expected = self.minimized = self.pruned = 0
+        (action, _) = super().decide(state, lm, lo)
+        pred = None
+        if action is not None:
+            self._last = state.act(action)
+            if self._last is not None and not self._last.is_terminal:
+                pred = self._likeliest_answer(self._last)
+        return action, pred
+
+    def _observe(self, state):
+        """Counts the opponent's answer to the agent's last action, if
+        `state` is where one of its answers led."""
+        last = self._last
+        self._last = None
+        if last is None or last.is_terminal:
+            return
+        for answer in last.actions:
+            if last.act(answer) == state:
+                tables = self.tables
+                s = tables.state_id(last, create=True)
+                tables.N[s] += 1
+                tables.C[s, tables.actions[answer]] += 1
+                return
+
+    def _likeliest_answer(self, state):
+        tables = self.tables
+        s = tables.state_id(state)
+        if s < 0 or tables.N[s] == 0:
+            return None
+        counts = tables.C[s]
+        return max(state.actions, key=lambda a: counts[tables.actions[a]])
+
+    def _answer_weights(self, state):
+        """The opponent's answers at `state` that are searched and their
+        probabilities, or None if `state` was not seen often enough."""
+        tables = self.tables
+        s = tables.state_id(state)
+        if s < 0 or tables.N[s] < self.min_visits:
+            return None
+        (visits, counts) = (tables.N[s], tables.C[s])
+        actions = state.actions
+        weights = [(a, counts[tables.actions[a]] / visits) for a in actions]
+        weights = [(a, p) for (a, p) in weights if p > 0 and p >= self.min_probability]
+        self.pruned += len(actions) - len(weights)
+        return weights or None
+
+    def search(self, state, first_action=None):
+        player = state.current_player
+        best_action = None
+        best_score = float("-inf")
+        for action in self._ordered(state.actions, first_action):
+            new_state = state.act(action)
+            if new_state is not None:
+                score = self.expected_value(new_state, player, 1)
+                if score > best_score:
+                    best_action = action
+                    best_score = score
+        self.last_value = best_score
+        return best_action
 
+    def subtree_value(self, state, player):
+        return self.expected_value(state, player, 1)
 
+    def _cutoff_value(self, state, player):
+        if self.evaluate_cutoffs:
+            return self.evaluate(state, player)
+        return super()._cutoff_value(state, player)
 
+    def expected_value(self, state, player, depth):
+        """The value of `state` for `player`, searched to `search_depth`."""
+        self._visit()
+        if state.is_terminal:
+            return state.reward(player)
+        if depth >= self.search_depth:
+            return self._cutoff_value(state, player)
+
+        if state.current_player == player:
+            best_score = float("-inf")
+            for action in state.actions:
+                new_state = state.act(action)
+                if new_state is not None:
+                    best_score = max(best_score, self.expected_value(new_state, player, depth + 1))
+            return best_score
+
+        weights = self._answer_weights(state)
+        if weights is not None:
+            (value, total) = (0.0, 0.0)
+            for (action, p) in weights:
+                new_state = state.act(action)
+                if new_state is not None:
+                    value += p * self.expected_value(new_state, player, depth + 1)
+                    total += p
+            if total > 0:
+                self.expected += 1
+                return value / total
+
+        self.minimized += 1
+        smallest_score = float("inf")
+        for action in state.actions:
+            new_state = state.act(action)
+            if new_state is not None:
+                smallest_score = min(smallest_score, self.expected_value(new_state, player, depth + 1))
+        return smallest_score
 
+    def save(self, directory):
+        """Saves the counts to `directory` (see OpponentTables.save)."""
+        self.tables.save(directory)
 
+    def load(self, directory, mmap_mode='c'):
+        """Replaces the counts with those saved to `directory`,
+        memory-mapped (see OpponentTables.load)."""
+        self.tables = OpponentTables.load(directory, mmap_mode, self.tables.max_states)
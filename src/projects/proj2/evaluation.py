@@ -2,15 +2,31 @@
 
 import math, random
 
+import numpy as np
+
 
 from ...lib.game import discrete_soccer, connect_four, GameState
+# `connect_four` is shadowed by the evaluation function below.
+from ...lib.game.connect_four import Connect4State, BitboardConnect4State
+from ...lib.game.connect_four import generator as connect_four_generator
 
 
 def soccer(state: GameState, player_id):
     # TODO: Implement this function!
     # print('in eval func !!!!!!!')
     score = 0
-    player1 = state.players[player_id]
+    players = state.players
+    player1 = players[player_id]
+    # Each position is read once, and every distance comes from the
+    # tables of the state's SoccerPitch (see triangle_score and
+    # difference_to_ball, which this works out the same way).
+    pitch = state.pitch_info
+    goal = pitch.goal_distance_rows
+    distance = pitch.distance_rows
+    m = pitch.margin
+    (x1, y1) = (player1.x, player1.y)
+    ball = state.ball
+    (ball_x, ball_y) = (ball.x, ball.y)
     #print("player1.x: " + str(player1.x))
     #print("player1.y: " + str(player1.y))
     #print("ball.x: " + str(state.ball.x))
@@ -25,19 +41,28 @@ def soccer(state: GameState, player_id):
         #print("This player (P1) has the ball")
         score += 5
 
-    for index, player2 in enumerate(state.players):
+    for index, player2 in enumerate(players):
         #print("index: " + str(index))
         if index != player_id:
+            (x2, y2) = (player2.x, player2.y)
             if player1.has_ball:
-                score += triangle_score(state, player1, player2, player1.team)
+                # triangle_score(state, player1, player2, player1.team)
+                to_goal = goal[player1.team]
+                score += (to_goal[x2 + m][y2 + m] + distance[abs(x1 - x2)][abs(y1 - y2)]) \
+                    - to_goal[x1 + m][y1 + m]
                 #print("P1: " + str(player1.x) + ", " + str(player1.y))
                 #print("P2: " + str(player2.x) + ", " + str(player2.y))
                 #print("P1 triangle score (good): " + str(triangle_score(state, player1, player2, player2.team)))
             elif player2.has_ball:
-                score -= triangle_score(state, player2, player1, player2.team)
+                # triangle_score(state, player2, player1, player2.team)
+                to_goal = goal[player2.team]
+                score -= (to_goal[x1 + m][y1 + m] + distance[abs(x2 - x1)][abs(y2 - y1)]) \
+                    - to_goal[x2 + m][y2 + m]
                 #print("P2 triangle score (bad): " + str(triangle_score(state, player2, player1, player1.team)))
             else:
-                score += difference_to_ball(state, player1, player2)
+                # difference_to_ball(state, player1, player2)
+                score += distance[abs(x2 - ball_x)][abs(y2 - ball_y)] \
+                    - distance[abs(x1 - ball_x)][abs(y1 - ball_y)]
                 #print("P1: " + str(player1.x) + ", " + str(player1.y))
                 #print("P2: " + str(player2.x) + ", " + str(player2.y))
                 #print("Ball: " + str(state.ball.x) + ", " + str(state.ball.y))
@@ -67,11 +92,44 @@ def soccer(state: GameState, player_id):
     # SoccerState-specific information. The file
     # `src/lib/game/discrete_soccer.py` provides a description of all
     # useful SoccerState properties.
-    if not isinstance(state, discrete_soccer.SoccerState):
+    if not isinstance(state, (discrete_soccer.SoccerState, discrete_soccer.PackedSoccerState)):
         raise ValueError("Evaluation function incompatible with game type.")
     #print("score: " + str(score))
     return score
 
+def soccer_batch(codes, player_id, game_type):
+    """`soccer` for many positions at once: `codes` are the `encode()`
+    tuples of states of the `game_type` field, and the result is the
+    NumPy vector of their scores for `player_id`, equal to what
+    `soccer` gives for each of them."""
+    if not isinstance(game_type, discrete_soccer.generator):
+        raise ValueError("Evaluation function incompatible with game type.")
+    pitch = game_type.pitch
+    goal = pitch.goal_distance
+    distance = pitch.distance
+    m = pitch.margin
+    # Every column but the ball's on_field flag and the winner (None
+    # until the game ends), laid out as PackedSoccerState.code is.
+    codes = np.array([code[:-2] for code in codes], dtype=np.intp)
+    (ball_x, ball_y) = (codes[:, 1], codes[:, 2])
+    (xs, ys, has_ball) = (codes[:, 3::4], codes[:, 4::4], codes[:, 6::4] != 0)
+    (x1, y1, has1) = (xs[:, player_id], ys[:, player_id], has_ball[:, player_id])
+    team1 = discrete_soccer.Team.RED if player_id % 2 == 0 else discrete_soccer.Team.BLUE
+    # The same terms as `soccer`, added up in the same order, so the
+    # scores come out identical rather than merely close.
+    score = np.where(has1, 5.0, 0.0)
+    for index in range(xs.shape[1]):
+        if index != player_id:
+            (x2, y2, has2) = (xs[:, index], ys[:, index], has_ball[:, index])
+            team2 = discrete_soccer.Team.RED if index % 2 == 0 else discrete_soccer.Team.BLUE
+            between = distance[abs(x1 - x2), abs(y1 - y2)]
+            good = (goal[team1, x2 + m, y2 + m] + between) - goal[team1, x1 + m, y1 + m]
+            bad = (goal[team2, x1 + m, y1 + m] + between) - goal[team2, x2 + m, y2 + m]
+            to_ball = distance[abs(x2 - ball_x), abs(y2 - ball_y)] \
+                - distance[abs(x1 - ball_x), abs(y1 - ball_y)]
+            score += np.where(has1, good, np.where(has2, -bad, to_ball))
+    return score
+
 def closerness_to_goal(state, player1, player2, goal_team):
 
     p1_dist = state.dist_to_goal((player1.x, player1.y), goal_team)
@@ -81,26 +139,39 @@ def closerness_to_goal(state, player1, player2, goal_team):
     return p2_dist - p1_dist
 
 def triangle_score(state, player1, player2, goal_team):
-    goal_to_p2 = state.dist_to_goal((player2.x, player2.y), goal_team)
+    # Distances come from the tables of the state's SoccerPitch rather
+    # than being worked out again on every evaluation.
+    pitch = state.pitch_info
+    goal = pitch.goal_distance_rows[goal_team]
+    m = pitch.margin
+    goal_to_p2 = goal[player2.x + m][player2.y + m]
     #print("Goal -> P2: " + str(goal_to_p2))
-    dist_between = distance_between_players(player1, player2)
+    dist_between = distance_between_players(player1, player2, state)
     #print("P1 -> P2: " + str(dist_between))
-    goal_to_p1 = state.dist_to_goal((player1.x, player1.y), goal_team)
+    goal_to_p1 = goal[player1.x + m][player1.y + m]
     #print("Goal -> P1: " + str(goal_to_p1))
     return (goal_to_p2 + dist_between) - goal_to_p1
 
 def difference_to_ball(state, player1, player2):
-    p1_dist = math.sqrt(
-        pow(player1.x - state.ball.x, 2) + pow(player1.y - state.ball.y, 2))
-    p2_dist = math.sqrt(
-        pow(player2.x - state.ball.x, 2) + pow(player2.y - state.ball.y, 2))
+    distance = state.pitch_info.distance_rows
+    ball = state.ball
+    p1_dist = distance[abs(player1.x - ball.x)][abs(player1.y - ball.y)]
+    p2_dist = distance[abs(player2.x - ball.x)][abs(player2.y - ball.y)]
     return p2_dist - p1_dist
 
-def distance_between_players(player1, player2):
+def distance_between_players(player1, player2, state=None):
+    if state is not None:
+        return state.pitch_info.distance_rows[abs(player1.x - player2.x)][abs(player1.y - player2.y)]
     return math.sqrt(
         pow(player1.x - player2.x, 2) + pow(player1.y - player2.y, 2))
 
 def connect_four(state, player_id):
-    if not isinstance(state, connect_four.Connect4State):
+    if not isinstance(state, (Connect4State, BitboardConnect4State)):
         raise ValueError("Evaluation function incompatible with game type.")
     return 0
+
+def connect_four_batch(codes, player_id, game_type):
+    """`connect_four` for the states whose `encode()` tuples are `codes`."""
+    if not isinstance(game_type, connect_four_generator):
+        raise ValueError("Evaluation function incompatible with game type.")
+    return np.zeros(len(codes))
@@ -11,7 +11,7 @@
 ################################################################
 
 from ...lib import cli
-from ...lib.game import Game, RandomAgent, discrete_soccer, connect_four
+from ...lib.game import Game, Tournament, RunLogger, RandomAgent, discrete_soccer, connect_four
 import sys
 from . import agent, evaluation
 
@@ -19,10 +19,20 @@ game_module = {
     'discrete_soccer': discrete_soccer,
     'connect_four': connect_four
 }
+# The actions of each game in the order the logs number them, or None
+# for games whose actions are already numbers.
+log_actions = {
+    'discrete_soccer': discrete_soccer.ACTIONS,
+    'connect_four': None
+}
 evaluations = {
     'discrete_soccer': evaluation.soccer,
     'connect_four': evaluation.connect_four
 }
+batch_evaluations = {
+    'discrete_soccer': evaluation.soccer_batch,
+    'connect_four': evaluation.connect_four_batch
+}
 
 def run_game(args):
     agents = []
@@ -32,27 +42,54 @@ def run_game(args):
 
     gm = game_module[args.game]
     evaluation_fn = evaluations[args.game]
-
-    minimax_agent = agent.MinimaxAgent(
-        evaluation_fn,
-        args.ab_pruning,
-        args.max_depth
-    )
+    batch_evaluation_fn = batch_evaluations[args.game] if args.batch_eval else None
+
+    def make_minimax_agent():
+        if args.mcts:
+            return agent.MCTSAgent(
+                simulations=args.simulations,
+                time_limit=args.time_limit
+            )
+        if args.expectimax:
+            return agent.ExpectimaxAgent(
+                evaluation_fn,
+                args.max_depth,
+                min_visits=args.min_visits,
+                time_limit=args.time_limit,
+                node_limit=args.node_limit
+            )
+        if args.negamax:
+            return agent.NegamaxAgent(
+                evaluation_fn,
+                args.max_depth,
+                time_limit=args.time_limit,
+                node_limit=args.node_limit
+            )
+        return agent.MinimaxAgent(
+            evaluation_fn,
+            args.ab_pruning,
+            args.max_depth,
+            time_limit=args.time_limit,
+            node_limit=args.node_limit,
+            batch_evaluate_function=batch_evaluation_fn
+        )
+
+    minimax_agent = make_minimax_agent()
     
-    minimax_agent1 = agent.MinimaxAgent(
-        evaluation_fn,
-        args.ab_pruning,
-        args.max_depth
-    )
+    minimax_agent1 = make_minimax_agent()
 
     opponentlearning_agent = agent.OpponentLearning(
         evaluation_fn,
         learning_rate=0.5,
         discount_factor=0.8,
         me = 0,
-        opp = 1
+        opp = 1,
+        max_states = args.max_states
     )
 
+    if args.warm_start:
+        opponentlearning_agent.load(args.warm_start)
+
 #     opponentlearning_agent2 = agent.OpponentLearning(
 #         evaluation_fn,
 #         learning_rate=0.5,
@@ -69,10 +106,26 @@ def run_game(args):
 
     # agents = [minimax_agent,minimax_agent1]
     print(agents)
-    game = Game(gm.generator(), agents)
-    # print(game)
-    # g
-    game.run(play_again='query', speed=2)
+    game_type = gm.generator()
+    if args.successor_cache:
+        game_type.cache_successors(args.successor_cache)
+    logger = RunLogger(args.log_dir, log_actions[args.game], resume=args.resume)
+    if args.workers is not None:
+        tournament = Tournament(game_type, agents, args.num_games, replicas=args.replicas,
+                                seed=args.seed, workers=args.workers, logger=logger)
+        tournament.run()
+        print("{} games in {:.1f}s, {:.2f} games/sec".format(
+            args.replicas * args.num_games, tournament.elapsed, tournament.games_per_second))
+    else:
+        game = Game(game_type, agents, logger=logger)
+        # print(game)
+        # g
+        game.run(play_again='query', speed=2, num_games=args.num_games,
+                 checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every,
+                 resume=args.resume)
+    logger.close()
+    if args.log_csv:
+        logger.export_csv(args.log_csv)
 
 
 def main(cl_args):
@@ -81,12 +134,66 @@ def main(cl_args):
     parser = argparse.ArgumentParser(description='Main function for Project 2: Minimax, Alpha-Beta Game Tree Search and Reinforcement Learning.')
     parser.add_argument('--max_depth', type=int, default=5, help='The maximum depth that minimax should search.')
     parser.add_argument('--ab_pruning', action='store_true', help='If included, use alpha-beta pruning.')
+    parser.add_argument('--negamax', action='store_true',
+                        help='If included, use the negamax search with alpha-beta pruning and move ordering.')
+    parser.add_argument('--mcts', action='store_true',
+                        help='If included, use Monte Carlo tree search instead of minimax.')
+    parser.add_argument('--simulations', type=int, default=1000,
+                        help='Simulations per move of the Monte Carlo tree search. (default: 1000)')
+    parser.add_argument('--expectimax', action='store_true',
+                        help='If included, search the opponent\'s answers by how often it gave them before.')
+    parser.add_argument('--min_visits', type=int, default=3,
+                        help='Visits of a position before --expectimax trusts the counts there. (default: 3)')
+    parser.add_argument('--time_limit', type=float, default=None,
+                        help='If given, minimax deepens its search one ply at a time, up to --max_depth, '
+                             'for at most this many seconds per move. The one-ply search always '
+                             'completes, even past the limit.')
+    parser.add_argument('--node_limit', type=int, default=None,
+                        help='If given, minimax deepens its search one ply at a time, up to --max_depth, '
+                             'visiting at most this many positions per move. The one-ply search '
+                             'always completes, even past the limit.')
+    parser.add_argument('--batch_eval', action='store_true',
+                        help='If included, minimax without --ab_pruning scores the positions at its depth limit '
+                             'in batches of siblings. It has no effect on soccer, where minimax scores '
+                             'those positions with their reward, 0, rather than the evaluation function.')
+    parser.add_argument('--successor_cache', type=int, default=None,
+                        help='If given, remember up to this many successors of (state, action) pairs, '
+                             'evicting the least recently used.')
+    parser.add_argument('--num_games', type=int, default=1000, help='Number of games to play. (default: 1000)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='If given, play the games as a tournament over this many processes, '
+                             'seeded from --seed.')
+    parser.add_argument('--replicas', type=int, default=1,
+                        help='Number of independent runs of --num_games in a tournament. (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first game of a tournament. (default: 0)')
+    parser.add_argument('--log_dir', type=str, default='log',
+                        help='Directory to log every move to, one .npy file per field. (default: log)')
+    parser.add_argument('--log_csv', type=str, default=None,
+                        help='If given, also export the log to this CSV file.')
+    parser.add_argument('--checkpoint_dir', type=str, default=None,
+                        help='If given, save the learned tables and random states there every '
+                             '--checkpoint_every games and at the end.')
+    parser.add_argument('--checkpoint_every', type=int, default=None,
+                        help='Number of games between checkpoints.')
+    parser.add_argument('--resume', action='store_true',
+                        help='If included, carry on from the latest checkpoint in --checkpoint_dir, '
+                             'and from the moves logged to --log_dir before it.')
+    parser.add_argument('--max_states', type=int, default=None,
+                        help='If given, the most states OpponentLearning keeps; the least visited '
+                             'are evicted beyond that.')
+    parser.add_argument('--warm_start', type=str, default=None,
+                        help='If given, start OpponentLearning from the tables saved in this directory '
+                             '(e.g. checkpoints/game5000/agent0).')
     parser.add_argument('--game', type=str, default='discrete_soccer', \
                         help='Game to play. (default: discrete_soccer)\n Options: discrete_soccer, connect_four')
     parser.add_argument('--minimini', action='store_true', default=False, \
                         help='If included, a human player will be able to join the game.')
 
     args = parser.parse_args(cl_args)
+    if args.workers is not None and (args.checkpoint_dir or args.resume):
+        parser.error("Checkpoints are only taken when the games are not played as a tournament.")
+    if args.resume and not args.checkpoint_dir:
+        parser.error("--resume needs --checkpoint_dir.")
 
     run_game(args)
 